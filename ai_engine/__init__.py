@@ -0,0 +1,8 @@
+import os
+import sys
+
+# src/ の分析モジュール（測定値ストア・異常スコアリング・メトリクスなど）を利用する。
+# パッケージ内のどのモジュールを最初に読み込んでも import できるよう、ここで一度だけ設定する
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.append(SRC_DIR)
@@ -0,0 +1,209 @@
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+# 機械IDだけを指定した場合の問い合わせ（プロンプトには機械IDを含めて渡す）
+MACHINE_QUERY = "{machine_id}の最近の点検記録から考えられる故障原因と対策"
+# 同じく検索に使う文面。全機械で同じにすることで、故障事例・技術ナレッジの検索は1回で済み、
+# 点検記録の検索だけが機械IDのフィルタで機械ごとに絞り込まれる
+MACHINE_RETRIEVAL_QUERY = "最近の点検記録から考えられる故障原因と対策"
+
+
+def _parse_datetime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+class AnalysisJobManager:
+    """故障原因分析のバッチジョブ
+
+    問い合わせ（または機械ID）の一覧を、同時実行数を concurrency に制限して分析する。
+    同じ問い合わせ・機械の項目は1回だけ分析し、ジョブ内の分析どうしで同一の検索を共有する。
+    検索はジョブごとに concurrency × 検索対象の種類数 のスレッドで実行する。
+    分析結果は1件終わるごとに save_analysis_result で分析ログに追記し、
+    ジョブの状態は <jobs_dir>/<ジョブID>.json に一時ファイルからの os.replace で書き出す。
+    再起動後は resume() で未完了の項目だけを続きから分析する。
+    """
+
+    def __init__(self, get_analyzer: Callable, jobs_dir: str = "data/jobs",
+                 max_concurrency: Optional[int] = None):
+        self.get_analyzer = get_analyzer
+        self.jobs_dir = jobs_dir
+        self.max_concurrency = max_concurrency if max_concurrency is not None else int(
+            os.getenv("ANALYSIS_JOB_MAX_CONCURRENCY", "16")
+        )
+        self._lock = threading.RLock()
+        self._jobs: Optional[Dict[str, Dict]] = None
+        self._threads: Dict[str, threading.Thread] = {}
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _load_jobs(self) -> Dict[str, Dict]:
+        """保存済みのジョブを読み込む（初回のみ）"""
+        with self._lock:
+            if self._jobs is None:
+                self._jobs = {}
+                if os.path.isdir(self.jobs_dir):
+                    for name in sorted(os.listdir(self.jobs_dir)):
+                        if not name.endswith(".json"):
+                            continue
+                        with open(os.path.join(self.jobs_dir, name), 'r', encoding='utf-8') as f:
+                            job = json.load(f)
+                        self._jobs[job["job_id"]] = job
+            return self._jobs
+
+    def _save(self, job: Dict):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        path = self._path(job["job_id"])
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def submit(self, queries: Optional[List[str]] = None, machine_ids: Optional[List[str]] = None,
+               concurrency: int = 4, start: Optional[datetime] = None,
+               end: Optional[datetime] = None) -> Dict:
+        """ジョブを登録してバックグラウンドで開始し、その概要を返す"""
+        targets = [(query, None, None) for query in queries or []]
+        targets += [(MACHINE_QUERY.format(machine_id=machine_id), machine_id, MACHINE_RETRIEVAL_QUERY)
+                    for machine_id in machine_ids or []]
+        if not targets:
+            raise ValueError("queries か machine_ids のいずれかを指定してください")
+        if not 1 <= concurrency <= self.max_concurrency:
+            raise ValueError(f"concurrency は 1 から {self.max_concurrency} の範囲で指定してください")
+
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "pending",
+            "created_at": datetime.now().isoformat(),
+            "started_at": None,
+            "finished_at": None,
+            "concurrency": concurrency,
+            "start": start.isoformat() if start else None,
+            "end": end.isoformat() if end else None,
+            "items": [
+                {"index": i, "query": query, "machine_id": machine_id, "retrieval_query": retrieval_query,
+                 "status": "pending", "record_id": None, "error": None}
+                for i, (query, machine_id, retrieval_query) in enumerate(targets)
+            ],
+            "shared_retrievals": 0,
+        }
+        with self._lock:
+            self._load_jobs()[job["job_id"]] = job
+            self._save(job)
+        self._start(job["job_id"])
+        return self.summary(job)
+
+    def _start(self, job_id: str):
+        with self._lock:
+            thread = self._threads.get(job_id)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self._run, args=(job_id,), daemon=True,
+                                      name=f"analysis-job-{job_id[:8]}")
+            self._threads[job_id] = thread
+            thread.start()
+
+    def resume(self) -> List[str]:
+        """前回の起動で終わらなかったジョブを再開し、そのIDを返す"""
+        resumed = [job_id for job_id, job in list(self._load_jobs().items())
+                   if job["status"] in ("pending", "running")]
+        for job_id in resumed:
+            self._start(job_id)
+        return resumed
+
+    def _run(self, job_id: str):
+        from vectorize_and_predict import RETRIEVAL_SOURCES, SharedRetrievals
+
+        job = self._load_jobs()[job_id]
+        start, end = _parse_datetime(job["start"]), _parse_datetime(job["end"])
+        # 同じ問い合わせ・機械の項目はまとめて1回だけ分析する（完了済みの項目は飛ばす）
+        groups: Dict[Tuple[str, Optional[str]], List[Dict]] = {}
+        for item in job["items"]:
+            if item["status"] == "pending":
+                groups.setdefault((item["query"], item["machine_id"]), []).append(item)
+
+        with self._lock:
+            job["status"] = "running"
+            job["started_at"] = job["started_at"] or datetime.now().isoformat()
+            self._save(job)
+
+        try:
+            analyzer = self.get_analyzer()
+        except Exception as e:
+            print(f"Error starting analysis job {job_id}: {e}")
+            analyzer = None
+        shared = SharedRetrievals(max_workers=job["concurrency"] * len(RETRIEVAL_SOURCES))
+
+        def run_group(key: Tuple[str, Optional[str]], items: List[Dict]):
+            query, machine_id = key
+            record_id, error = None, None
+            try:
+                if analyzer is None:
+                    raise RuntimeError("分析器を初期化できませんでした")
+                analysis = analyzer.analyze_failure_cause(
+                    query, machine_id=machine_id, start=start, end=end, shared_retrievals=shared,
+                    retrieval_query=items[0].get("retrieval_query")
+                )
+                record_id = analyzer.save_analysis_result({**analysis, "job_id": job_id,
+                                                           "machine_id": machine_id})
+            except Exception as e:
+                print(f"Error in analysis job {job_id} ({machine_id or query}): {e}")
+                error = str(e)
+            with self._lock:
+                for item in items:
+                    item["status"] = "error" if error else "done"
+                    item["record_id"] = record_id
+                    item["error"] = error
+                self._save(job)
+
+        with ThreadPoolExecutor(max_workers=job["concurrency"],
+                                thread_name_prefix=f"analysis-job-{job_id[:8]}") as pool:
+            for future in [pool.submit(run_group, key, items) for key, items in groups.items()]:
+                future.result()
+        shared.close()
+
+        with self._lock:
+            job["status"] = "completed"
+            job["finished_at"] = datetime.now().isoformat()
+            job["shared_retrievals"] += shared.hits
+            self._save(job)
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Dict:
+        """ジョブの実行が終わるまで待ち、その概要を返す"""
+        thread = self._threads.get(job_id)
+        if thread is not None:
+            thread.join(timeout)
+        return self.summary(self._load_jobs()[job_id])
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        return self._load_jobs().get(job_id)
+
+    def list_jobs(self) -> List[Dict]:
+        """ジョブの概要を新しい順に返す"""
+        with self._lock:
+            jobs = sorted(self._load_jobs().values(), key=lambda job: job["created_at"], reverse=True)
+            return [self.summary(job) for job in jobs]
+
+    def summary(self, job: Dict) -> Dict:
+        """ジョブの進捗（項目ごとの内容を除く）"""
+        with self._lock:
+            total = len(job["items"])
+            done = sum(item["status"] == "done" for item in job["items"])
+            errors = sum(item["status"] == "error" for item in job["items"])
+            elapsed = None
+            if job["started_at"]:
+                finished = _parse_datetime(job["finished_at"]) or datetime.now()
+                elapsed = (finished - _parse_datetime(job["started_at"])).total_seconds()
+            return {
+                **{key: value for key, value in job.items() if key != "items"},
+                "total": total,
+                "done": done,
+                "errors": errors,
+                "progress": (done + errors) / total if total else 1.0,
+                "elapsed_seconds": elapsed,
+            }
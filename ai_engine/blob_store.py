@@ -0,0 +1,101 @@
+import base64
+import binascii
+import hashlib
+import os
+import re
+import uuid
+from typing import Any, Dict, Optional
+
+# "data:image/png;base64,...." 形式のデータURI
+_DATA_URI = re.compile(r"^data:([\w.+-]+/[\w.+-]+)?;base64,", re.ASCII)
+_BASE64 = re.compile(r"^[A-Za-z0-9+/\r\n]+={0,2}$", re.ASCII)
+_DIGEST = re.compile(r"^[0-9a-f]{64}$")
+
+# 先頭のバイト列から判定する画像の種類
+_MAGIC_NUMBERS = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF8", "image/gif"),
+    (b"%PDF", "application/pdf"),
+)
+
+
+class BlobStore:
+    """内容の SHA-256 をキーとするファイルのストア
+
+    <root>/<ハッシュの先頭2文字>/<ハッシュ> に保存する。同じ内容は一度しか書き込まれず、
+    書き込みは一時ファイルからの os.replace で行うため、読み手が書きかけを見ることはない。
+    """
+
+    def __init__(self, root: str = "data/blobs"):
+        self.root = root
+
+    def path(self, digest: str) -> str:
+        if not _DIGEST.match(digest):
+            raise ValueError(f"不正なハッシュ値です: {digest}")
+        return os.path.join(self.root, digest[:2], digest)
+
+    def put(self, data: bytes) -> str:
+        """data を保存してハッシュ値を返す（保存済みなら書き込まない）"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return digest
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def get(self, digest: str) -> bytes:
+        with open(self.path(digest), 'rb') as f:
+            return f.read()
+
+    def content_type(self, digest: str) -> str:
+        """ブロブの先頭から推定した Content-Type"""
+        with open(self.path(digest), 'rb') as f:
+            head = f.read(12)
+        if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+            return "image/webp"
+        for magic, content_type in _MAGIC_NUMBERS:
+            if head.startswith(magic):
+                return content_type
+        return "application/octet-stream"
+
+    def offload_base64(self, value: str, min_length: int = 1024) -> Optional[Dict]:
+        """base64 の文字列（データURIを含む）を保存し、代わりに置く参照を返す
+
+        base64 でない文字列や min_length 未満の短い文字列は None（そのまま残す）。
+        """
+        if not isinstance(value, str):
+            return None
+        content_type = None
+        payload = value
+        match = _DATA_URI.match(value)
+        if match:
+            content_type = match.group(1)
+            payload = value[match.end():]
+        elif len(value) < min_length or not _BASE64.match(value):
+            return None
+        try:
+            data = base64.b64decode(payload, validate=False)
+        except (binascii.Error, ValueError):
+            return None
+        return {
+            "blob": self.put(data),
+            "content_type": content_type or "application/octet-stream",
+            "size": len(data),
+            "encoding": "data_uri" if match else "base64",
+        }
+
+    def offload_inline(self, value: Any, min_length: int = 1024) -> Any:
+        """入れ子の値に含まれる base64 の文字列を、すべてブロブの参照に置き換えた値を返す"""
+        if isinstance(value, dict):
+            return {key: self.offload_inline(item, min_length) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self.offload_inline(item, min_length) for item in value]
+        reference = self.offload_base64(value, min_length)
+        return value if reference is None else reference
@@ -1,45 +1,213 @@
+import hashlib
 import json
 import os
+import threading
+import uuid
+from collections import OrderedDict
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
+
+from metrics import count_cache, stage_timer
+from .blob_store import BlobStore
+from .json_sections import index_object, iter_array, load_span, mapped, read_sections
 
 class FaultDataLoader:
-    def __init__(self, data_dir: str = "attached_assets"):
+    # 画像を埋め込み得るメッセージのフィールド（base64 はブロブストアへ移して参照に置き換える）
+    INLINE_MEDIA_FIELDS = ("base64_images", "media")
+    HISTORY_KEY = "conversation_history"
+
+    def __init__(self, data_dir: str = "attached_assets", max_cached_files: int = 32,
+                 blob_store: Optional[BlobStore] = None, poll_interval: Optional[float] = None):
         self.data_dir = data_dir
+        self.max_cached_files = max_cached_files
+        self.blob_store = blob_store or BlobStore(os.getenv("BLOB_STORE_DIR", "data/blobs"))
+        # 既存ファイルの上書きを拾うためにバックグラウンドで走査し直す間隔（秒、0 以下で無効）
+        self.poll_interval = poll_interval if poll_interval is not None else \
+            float(os.getenv("FAULT_DIR_POLL_SECONDS", "5"))
+        self._lock = threading.Lock()
+        # 最新のファイル: ディレクトリの mtime が変わったとき（追加・削除・リネーム）とポーリングで求め直す
+        self._dir_mtime: Optional[int] = None
+        self._latest: Optional[str] = None
+        self._poller: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        # ファイルごとのキャッシュ: パス -> ((mtime, size), {"spans": セクションの位置, "sections": 解析済みの値})
+        self._documents: "OrderedDict[str, Tuple[Tuple[int, int], Dict]]" = OrderedDict()
+
+    def _entry(self, file_path: str) -> Dict:
+        """ファイルのキャッシュエントリ（mtime とサイズが変わっていればセクションの位置を索引し直す）"""
+        stat = os.stat(file_path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._documents.get(file_path)
+            if cached and cached[0] == signature:
+                self._documents.move_to_end(file_path)
+                return cached[1]
+
+        with stage_timer("fault_data_index"), mapped(file_path) as buf:
+            entry = {"spans": index_object(buf), "sections": {}, "signature": signature}
+        with self._lock:
+            self._documents[file_path] = (signature, entry)
+            self._documents.move_to_end(file_path)
+            while len(self._documents) > self.max_cached_files:
+                self._documents.popitem(last=False)
+        return entry
+
+    def load_section(self, file_path: str, key: str, default=None):
+        """故障情報のJSONファイルからトップレベルの1セクションだけを読み込む
+
+        セクションの位置は初回にファイルを走査して索引し、以降は該当部分だけを解析する。
+        会話履歴の画像はブロブストアの参照に置き換えて返す（ingest() を参照）。
+        返される値はキャッシュと共有されるため、呼び出し側で変更しないこと。
+        """
+        try:
+            entry = self._entry(file_path)
+            if key not in entry["spans"]:
+                return default
+            sections = entry["sections"]
+            if key in sections:
+                count_cache("fault_data", True)
+                return sections[key]
+
+            count_cache("fault_data", False)
+            with stage_timer("fault_data_read"):
+                if key == self.HISTORY_KEY:
+                    value = self.ingest(file_path, entry["spans"])
+                else:
+                    value = read_sections(file_path, [key], entry["spans"])[key]
+            sections[key] = value
+            return value
+        except Exception as e:
+            print(f"Error loading fault data: {e}")
+            return default
 
     def load_fault_data(self, file_path: str) -> Dict:
-        """故障情報のJSONファイルを読み込む"""
+        """故障情報のJSONファイルを読み込む（会話履歴の画像はブロブの参照になる）"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            spans = self._entry(file_path)["spans"]
         except Exception as e:
             print(f"Error loading fault data: {e}")
             return {}
+        return {key: self.load_section(file_path, key) for key in spans}
+
+    def _manifest_path(self, file_path: str, signature: Tuple[int, int]) -> str:
+        key = hashlib.sha256(f"{os.path.abspath(file_path)}:{signature[0]}:{signature[1]}".encode()).hexdigest()
+        return os.path.join(self.blob_store.root, "exports", f"{key}.json")
+
+    def ingest(self, file_path: str, spans: Optional[Dict] = None) -> List[Dict]:
+        """会話履歴の base64 画像をブロブストアへ移し、参照に置き換えた履歴を返す
+
+        置き換えた履歴はファイルの mtime・サイズごとに保存するため、画像のデコードは
+        ファイルごとに一度だけで、以降の読み込みは画像の大きさに依存しない。
+        メッセージは1件ずつ解析するため、一度にメモリに載る画像は1件分に限られる。
+        """
+        stat = os.stat(file_path)
+        manifest_path = self._manifest_path(file_path, (stat.st_mtime_ns, stat.st_size))
+        if os.path.exists(manifest_path):
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        history = []
+        with mapped(file_path) as buf:
+            spans = spans if spans is not None else index_object(buf)
+            if self.HISTORY_KEY in spans:
+                for span in iter_array(buf, spans[self.HISTORY_KEY]):
+                    message = load_span(buf, span)
+                    if isinstance(message, dict):
+                        for field in self.INLINE_MEDIA_FIELDS:
+                            if field in message:
+                                message[field] = self.blob_store.offload_inline(message[field])
+                    history.append(message)
+
+        os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        tmp_path = f"{manifest_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(history, f, ensure_ascii=False)
+        os.replace(tmp_path, manifest_path)
+        return history
 
     def get_fault_history(self, file_path: str) -> List[Dict]:
         """故障履歴を取得"""
-        data = self.load_fault_data(file_path)
-        return data.get('conversation_history', [])
+        return self.load_section(file_path, self.HISTORY_KEY, [])
 
     def get_diagnostics(self, file_path: str) -> Dict:
         """診断情報を取得"""
-        data = self.load_fault_data(file_path)
-        return data.get('diagnostics', {})
+        return self.load_section(file_path, 'diagnostics', {})
 
     def get_device_context(self, file_path: str) -> Dict:
         """デバイスコンテキストを取得"""
-        data = self.load_fault_data(file_path)
-        return data.get('device_context', {})
+        return self.load_section(file_path, 'device_context', {})
+
+    def rescan(self) -> Optional[str]:
+        """ディレクトリを走査して最新の故障情報ファイルを求め直す"""
+        dir_mtime = os.stat(self.data_dir).st_mtime_ns
+        latest_file, latest_ctime = None, None
+        with stage_timer("fault_dir_scan"), os.scandir(self.data_dir) as entries:
+            for entry in entries:
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    ctime = entry.stat().st_ctime_ns
+                except FileNotFoundError:
+                    continue
+                if latest_ctime is None or ctime > latest_ctime:
+                    latest_file, latest_ctime = entry.path, ctime
+        with self._lock:
+            self._dir_mtime = dir_mtime
+            self._latest = latest_file
+        return latest_file
+
+    def get_latest_fault_file(self) -> Optional[str]:
+        """最新の故障情報ファイルのパスを取得
+
+        リクエストごとの確認はディレクトリの stat 1回だけで、走査し直すのはディレクトリの
+        mtime が変わったとき（追加・削除・リネーム）に限る。既存ファイルの上書きは
+        ディレクトリの mtime を変えないため、poll_interval ごとのバックグラウンドの走査で
+        反映する（内容のキャッシュは _entry() がファイルごとの (mtime_ns, size) で検証する）。
+        """
+        self._start_polling()
+        dir_mtime = os.stat(self.data_dir).st_mtime_ns
+        with self._lock:
+            if dir_mtime == self._dir_mtime:
+                return self._latest
+        return self.rescan()
+
+    def _start_polling(self):
+        if self.poll_interval <= 0 or self._poller is not None:
+            return
+        with self._lock:
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, daemon=True, name="fault-dir-poll")
+                self._poller.start()
+
+    def _poll(self):
+        while not self._stopped.wait(self.poll_interval):
+            try:
+                self.rescan()
+            except OSError as e:
+                print(f"Error scanning fault data: {e}")
+
+    def close(self):
+        """バックグラウンドの走査を止める"""
+        self._stopped.set()
 
     def get_latest_fault_data(self) -> Optional[Dict]:
         """最新の故障情報を取得"""
         try:
-            files = [f for f in os.listdir(self.data_dir) if f.endswith('.json')]
-            if not files:
+            latest_file = self.get_latest_fault_file()
+            if latest_file is None:
+                return None
+            return self.load_fault_data(latest_file)
+        except Exception as e:
+            print(f"Error getting latest fault data: {e}")
+            return None
+
+    def get_latest_section(self, key: str, default=None):
+        """最新の故障情報ファイルから1セクションだけを取得（ファイルがなければ None、セクションがなければ default）"""
+        try:
+            latest_file = self.get_latest_fault_file()
+            if latest_file is None:
                 return None
-            
-            latest_file = max(files, key=lambda x: os.path.getctime(os.path.join(self.data_dir, x)))
-            return self.load_fault_data(os.path.join(self.data_dir, latest_file))
+            return self.load_section(latest_file, key, default)
         except Exception as e:
             print(f"Error getting latest fault data: {e}")
-            return None 
\ No newline at end of file
+            return None
@@ -0,0 +1,138 @@
+import json
+import mmap
+import re
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+# JSON の構造を表す文字（文字列の外側で意味を持つもの）
+_STRUCTURAL = re.compile(rb'["{}\[\],]')
+_NON_WHITESPACE = re.compile(rb'\S')
+
+Span = Tuple[int, int]
+
+
+def _next_char(buf, pos: int) -> Tuple[bytes, int]:
+    """pos 以降で最初の空白以外の文字とその位置"""
+    match = _NON_WHITESPACE.search(buf, pos)
+    if match is None:
+        raise ValueError("JSON が途中で終わっています")
+    return buf[match.start():match.start() + 1], match.start()
+
+
+def _skip_string(buf, pos: int) -> int:
+    """開きの " の次の位置 pos から、閉じの " の次の位置を返す
+
+    " は find（memchr）で探し、直前のバックスラッシュが奇数個ならエスケープとみなして続ける。
+    """
+    while True:
+        end = buf.find(b'"', pos)
+        if end < 0:
+            raise ValueError("文字列が閉じられていません")
+        backslashes = 0
+        while buf[end - 1 - backslashes] == 0x5C:
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return end + 1
+        pos = end + 1
+
+
+def skip_value(buf, pos: int) -> int:
+    """pos から始まる値を解析せずに読み飛ばし、値の終わりの位置を返す
+
+    文字列の中身は閉じの " まで一気に読み飛ばすため、base64 の画像のような
+    長い文字列があっても Python のオブジェクトは作られない。
+    """
+    depth = 0
+    while True:
+        match = _STRUCTURAL.search(buf, pos)
+        if match is None:
+            if depth == 0:
+                return len(buf)
+            raise ValueError("JSON が途中で終わっています")
+        char = buf[match.start()]
+        if char == 0x22:  # "
+            pos = _skip_string(buf, match.end())
+            if depth == 0:
+                return pos
+            continue
+        if char in b"{[":
+            depth += 1
+        elif char in b"}]":
+            if depth == 0:
+                return match.start()
+            depth -= 1
+            if depth == 0:
+                return match.end()
+        elif depth == 0:  # , で終わる数値・真偽値・null
+            return match.start()
+        pos = match.end()
+
+
+def index_object(buf, pos: int = 0) -> Dict[str, Span]:
+    """pos から始まるオブジェクトの キー -> 値の (開始, 終了) 位置"""
+    char, pos = _next_char(buf, pos)
+    if char != b"{":
+        raise ValueError("JSON オブジェクトではありません")
+    spans: Dict[str, Span] = {}
+    pos += 1
+    while True:
+        char, pos = _next_char(buf, pos)
+        if char == b"}":
+            return spans
+        if char == b",":
+            pos += 1
+            continue
+        if char != b'"':
+            raise ValueError(f"キーが必要な位置に {char!r} があります")
+        key_end = _skip_string(buf, pos + 1)
+        key = json.loads(bytes(buf[pos:key_end]))
+        char, pos = _next_char(buf, key_end)
+        if char != b":":
+            raise ValueError(f"キー {key!r} の後に : がありません")
+        _, start = _next_char(buf, pos + 1)
+        pos = skip_value(buf, start)
+        spans[key] = (start, pos)
+
+
+def iter_array(buf, span: Span) -> Iterator[Span]:
+    """span の配列の要素ごとの (開始, 終了) 位置を返す"""
+    char, pos = _next_char(buf, span[0])
+    if char != b"[":
+        raise ValueError("JSON 配列ではありません")
+    pos += 1
+    while True:
+        char, pos = _next_char(buf, pos)
+        if char == b"]":
+            return
+        if char == b",":
+            pos += 1
+            continue
+        end = skip_value(buf, pos)
+        yield pos, end
+        pos = end
+
+
+def load_span(buf, span: Span):
+    return json.loads(bytes(buf[span[0]:span[1]]))
+
+
+@contextmanager
+def mapped(path: str):
+    """ファイルを読み取り専用でメモリマップする（読み込んだページだけがメモリに載る）"""
+    with open(path, 'rb') as f:
+        if f.seek(0, 2) == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            yield buf
+
+
+def read_sections(path: str, keys: Iterable[str],
+                  spans: Optional[Dict[str, Span]] = None) -> Dict:
+    """トップレベルのオブジェクトから keys のセクションだけを解析して返す
+
+    spans に index_object() の結果を渡すと、走査を省いて該当部分だけを読む。
+    """
+    with mapped(path) as buf:
+        spans = spans if spans is not None else index_object(buf)
+        return {key: load_span(buf, spans[key]) for key in keys if key in spans}
@@ -1,13 +1,102 @@
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, HTTPException, Request
+# Query はリクエストボディのモデル名に使っているため、クエリパラメータの指定は別名で読み込む
+from fastapi import Query as QueryParam
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import Optional, List, Dict
+from typing import Optional, List, Dict, TYPE_CHECKING
 import json
 import os
+import time
+import asyncio
+import threading
+from datetime import datetime
+
 from .fault_data_loader import FaultDataLoader
+from . import predict_response
+from .upload_store import UploadStore, UploadTooLarge
+from .analysis_jobs import AnalysisJobManager
+from metrics import registry, server_timing_header, start_request_timings
+from measurement_store import MeasurementStore
+from anomaly_scoring import score_fleet
+from record_log import RecordLog
+from inspection_index import InspectionIndex
+if TYPE_CHECKING:
+    # langchain 一式を読み込むため、実行時は get_analyzer() の中で import する
+    from vectorize_and_predict import MaintenanceAnalyzer
 
 app = FastAPI()
 fault_loader = FaultDataLoader()
+upload_store = UploadStore()
+measurement_store = MeasurementStore()
+_inspection_index: Optional[InspectionIndex] = None
+_inspection_index_lock = threading.Lock()
+_analysis_log: Optional[RecordLog] = None
+_analysis_log_lock = threading.Lock()
+_analyzer: Optional["MaintenanceAnalyzer"] = None
+_analyzer_lock = threading.Lock()
+analysis_jobs = AnalysisJobManager(lambda: get_analyzer())
+warmup_status: Dict = {"state": "pending", "errors": {}, "seconds": None}
+
+def get_analyzer() -> "MaintenanceAnalyzer":
+    """故障原因分析器を初回アクセス時に構築する"""
+    global _analyzer
+    with _analyzer_lock:
+        if _analyzer is None:
+            from vectorize_and_predict import MaintenanceAnalyzer
+            _analyzer = MaintenanceAnalyzer()
+        return _analyzer
+
+def get_inspection_index() -> InspectionIndex:
+    """点検記録の索引を初回アクセス時に構築する（ログは読み取り専用で開く）"""
+    global _inspection_index
+    with _inspection_index_lock:
+        if _inspection_index is None:
+            _inspection_index = InspectionIndex(
+                RecordLog("data/inspections/log/raw", read_only=True),
+                raw_dir="data/inspections/raw"
+            )
+        return _inspection_index
+
+def get_analysis_log() -> RecordLog:
+    """分析結果のログ（読み取り専用。追記はバッチジョブが分析器の書き込み用ログで行う）"""
+    global _analysis_log
+    with _analysis_log_lock:
+        if _analysis_log is None:
+            _analysis_log = RecordLog("data/inspections/log/processed", read_only=True)
+    _analysis_log.refresh()
+    return _analysis_log
+
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "ai_engine_http_request_seconds", "HTTP request latency by route (until response headers for streams)"
+)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """リクエストの所要時間を記録し、段階別の内訳を Server-Timing ヘッダーで返す
+
+    内訳は AI_ENGINE_TIMING_HEADERS=1 のとき、またはリクエストに X-Debug-Timing: 1 があるときだけ集計する。
+    ストリーミング応答ではヘッダー送信までの段階（検索など）だけが含まれる。
+    """
+    timings = None
+    if os.getenv("AI_ENGINE_TIMING_HEADERS") == "1" or request.headers.get("x-debug-timing") == "1":
+        timings = start_request_timings()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(elapsed, method=request.method,
+                                 route=getattr(route, "path", "unmatched"), status=response.status_code)
+    if timings is not None:
+        timings["total"] = elapsed
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+@app.get("/metrics")
+async def metrics():
+    """段階別の所要時間・キャッシュのヒット率などを Prometheus のテキスト形式で返す"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/")
 async def root():
@@ -25,21 +114,173 @@ app.add_middleware(
 class Query(BaseModel):
     query: str
 
+class AnalyzeQuery(Query):
+    # 検索する点検記録を機械・期間（start 以上 end 未満）で絞り込む
+    machine_id: Optional[str] = None
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+class AnalysisJobRequest(BaseModel):
+    # queries は問い合わせをそのまま、machine_ids は機械ごとの定型の問い合わせとして分析する
+    queries: List[str] = []
+    machine_ids: List[str] = []
+    concurrency: int = 4
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+
+def warm_up():
+    """予測パイプラインと分析器を構築し、重いライブラリの読み込みと接続を済ませておく"""
+    warmup_status["state"] = "running"
+    start = time.perf_counter()
+    steps = {
+        "prediction_pipeline": predict_response.get_pipeline,
+        "analyzer": lambda: get_analyzer().warm_up(),
+    }
+    for name, step in steps.items():
+        try:
+            step()
+        except Exception as e:
+            print(f"Error warming up {name}: {e}")
+            warmup_status["errors"][name] = str(e)
+    warmup_status["seconds"] = time.perf_counter() - start
+    warmup_status["state"] = "done"
+
+@app.on_event("startup")
+async def schedule_warm_up():
+    """起動を待たせないよう、ウォームアップはポートを開いた後にバックグラウンドで実行する
+
+    AI_ENGINE_WARMUP=0 の場合は実行せず、初回リクエスト時に構築する。
+    """
+    if os.getenv("AI_ENGINE_WARMUP", "1") != "0":
+        app.state.warmup_task = asyncio.create_task(run_in_threadpool(warm_up))
+
+@app.on_event("startup")
+async def resume_analysis_jobs():
+    """前回の起動で終わらなかったバッチ分析ジョブを再開する（ANALYSIS_JOBS_RESUME=0 の場合は再開しない）"""
+    if os.getenv("ANALYSIS_JOBS_RESUME", "1") != "0":
+        resumed = await run_in_threadpool(analysis_jobs.resume)
+        if resumed:
+            print(f"Resumed analysis jobs: {', '.join(resumed)}")
+
+@app.get("/api/health")
+async def health():
+    """起動状態（ウォームアップの進捗）を返す"""
+    return {"status": "ok", "warmup": warmup_status}
+
 @app.post("/api/predict")
 async def predict(query: Query):
-    # TODO: 実際の予測ロジックを実装
-    return {"answer": f"回答: {query.query}"}
+    """ナレッジを検索してGPTで回答を生成"""
+    try:
+        # ブロッキングな検索・生成はスレッドプールで実行し、イベントループを塞がない
+        answer = await run_in_threadpool(predict_response.generate_response, query.query)
+    except Exception as e:
+        print(f"Error generating response: {e}")
+        return {
+            "status": "error",
+            "message": "回答を生成できませんでした"
+        }
+    return {"answer": answer}
+
+def _sse(events):
+    """イベントの列を Server-Sent Events 形式に変換する（途中のエラーは error イベントで通知）"""
+    try:
+        for event in events:
+            data = json.dumps(event["data"], ensure_ascii=False, default=str)
+            yield f"event: {event['event']}\ndata: {data}\n\n"
+    except Exception as e:
+        print(f"Error while streaming: {e}")
+        data = json.dumps({"status": "error", "message": "回答を生成できませんでした"}, ensure_ascii=False)
+        yield f"event: error\ndata: {data}\n\n"
+
+def _sse_response(events) -> StreamingResponse:
+    # 同期ジェネレータはスレッドプールで反復されるため、イベントループを塞がない
+    return StreamingResponse(
+        _sse(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/api/predict/stream")
+async def predict_stream(query: Query):
+    """検索結果のメタデータを先に送り、回答をトークン単位でストリーミングする"""
+    return _sse_response(predict_response.stream_response(query.query))
+
+@app.post("/api/analyze/stream")
+async def analyze_stream(query: AnalyzeQuery):
+    """故障原因分析を、検索結果のメタデータ → 生成中のトークン → 完了 の順にストリーミングする"""
+    def events():
+        yield from get_analyzer().stream_failure_cause(query.query, machine_id=query.machine_id,
+                                                       start=query.start, end=query.end)
+    return _sse_response(events())
+
+@app.post("/api/analyze/jobs", status_code=202)
+async def submit_analysis_job(request: AnalysisJobRequest):
+    """複数の問い合わせ・機械の故障原因分析をバックグラウンドで実行するジョブを登録する"""
+    try:
+        return await run_in_threadpool(
+            analysis_jobs.submit, request.queries, request.machine_ids,
+            request.concurrency, request.start, request.end
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/analyze/jobs")
+async def list_analysis_jobs():
+    return {"jobs": await run_in_threadpool(analysis_jobs.list_jobs)}
+
+def _get_analysis_job(job_id: str) -> Dict:
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="ジョブが見つかりません")
+    return job
+
+@app.get("/api/analyze/jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """ジョブの進捗と項目ごとの状態"""
+    job = await run_in_threadpool(_get_analysis_job, job_id)
+    return {**analysis_jobs.summary(job), "items": [dict(item) for item in job["items"]]}
+
+@app.get("/api/analyze/jobs/{job_id}/results")
+async def get_analysis_job_results(job_id: str):
+    """完了した項目の分析結果（分析ログから読み出す）"""
+    job = await run_in_threadpool(_get_analysis_job, job_id)
+
+    def read_results():
+        log = get_analysis_log()
+        return [
+            {"index": item["index"], "query": item["query"], "machine_id": item["machine_id"],
+             "record_id": item["record_id"], "analysis": log.get(item["record_id"])}
+            for item in job["items"] if item["status"] == "done"
+        ]
+    return {"job_id": job_id, "results": await run_in_threadpool(read_results)}
 
 @app.post("/api/upload")
-async def upload_file(file: UploadFile = File(...)):
-    file_path = f"data/raw/{file.filename}"
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+async def upload_file(request: Request):
+    """multipart/form-data の file フィールドを受信しながら保存する（上限を超えた時点で打ち切る）"""
+    content_length = request.headers.get("content-length")
+    try:
+        saved = await upload_store.save(
+            request.stream(), request.headers.get("content-type", ""),
+            int(content_length) if content_length and content_length.isdigit() else None
+        )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    contents = await file.read()
-    with open(file_path, "wb") as f:
-        f.write(contents)
-    
-    return {"message": "ファイルがアップロードされました", "filename": file.filename}
+    if saved["duplicate"]:
+        return {
+            "message": "同じ内容のファイルが既にアップロードされています",
+            "filename": saved["filename"],
+            "sha256": saved["sha256"],
+            "duplicate": True
+        }
+    return {
+        "message": "ファイルがアップロードされました",
+        "filename": saved["filename"],
+        "sha256": saved["sha256"],
+        "duplicate": False
+    }
 
 @app.get("/api/history")
 async def get_history():
@@ -49,7 +290,7 @@ async def get_history():
 @app.get("/api/fault-data")
 async def get_fault_data():
     """最新の故障情報を取得"""
-    data = fault_loader.get_latest_fault_data()
+    data = await run_in_threadpool(fault_loader.get_latest_fault_data)
     if data:
         return {
             "status": "success",
@@ -62,12 +303,12 @@ async def get_fault_data():
 
 @app.get("/api/fault-history")
 async def get_fault_history():
-    """故障履歴を取得"""
-    data = fault_loader.get_latest_fault_data()
-    if data:
+    """故障履歴を取得（画像はブロブの参照。本体は /api/blobs/{digest} で取得する）"""
+    history = await run_in_threadpool(fault_loader.get_latest_section, "conversation_history", [])
+    if history is not None:
         return {
             "status": "success",
-            "history": data.get('conversation_history', [])
+            "history": history
         }
     return {
         "status": "error",
@@ -76,14 +317,69 @@ async def get_fault_history():
 
 @app.get("/api/diagnostics")
 async def get_diagnostics():
-    """診断情報を取得"""
-    data = fault_loader.get_latest_fault_data()
-    if data:
+    """診断情報を取得（ファイルの diagnostics セクションだけを解析する）"""
+    diagnostics = await run_in_threadpool(fault_loader.get_latest_section, "diagnostics")
+    if diagnostics is not None:
         return {
             "status": "success",
-            "diagnostics": data.get('diagnostics', {})
+            "diagnostics": diagnostics
         }
     return {
         "status": "error",
         "message": "診断情報が見つかりません"
     }
+
+@app.get("/api/blobs/{digest}")
+async def get_blob(digest: str):
+    """故障履歴から参照される画像などのブロブを返す（内容のハッシュがキーなので長期キャッシュできる）"""
+    try:
+        path = fault_loader.blob_store.path(digest)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="不正なハッシュ値です")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="ブロブが見つかりません")
+    return FileResponse(path, media_type=fault_loader.blob_store.content_type(digest),
+                        headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+@app.get("/api/anomalies")
+async def get_anomalies(window: int = 30, flagged_only: bool = False):
+    """全機械の測定値を一括で採点し、異常の疑いがある機械を返す"""
+    report = await run_in_threadpool(score_fleet, measurement_store, window)
+    flagged = [item for item in report if item["flagged"]]
+    return {
+        "status": "success",
+        "scored": len(report),
+        "flagged_count": len(flagged),
+        "machines": flagged if flagged_only else report
+    }
+
+def _parse_date(value: Optional[str], name: str) -> Optional[datetime]:
+    if value is None:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} の日付形式が不正です: {value}")
+
+def _query_inspections(**conditions) -> List:
+    index = get_inspection_index()
+    # 他プロセスが追記した記録を取り込んでから検索する
+    index.refresh()
+    return index.query(**conditions)
+
+@app.get("/api/inspections")
+async def get_inspections(machine_id: Optional[str] = None, location: Optional[str] = None,
+                          status: Optional[str] = None, inspection_type: Optional[str] = None,
+                          start: Optional[str] = None, end: Optional[str] = None,
+                          limit: int = QueryParam(100, ge=1)):
+    """条件に一致する点検記録を点検日時の新しい順に返す（start 以上 end 未満）"""
+    results = await run_in_threadpool(
+        _query_inspections, machine_id=machine_id, location=location, status=status,
+        inspection_type=inspection_type, start=_parse_date(start, "start"),
+        end=_parse_date(end, "end"), limit=limit
+    )
+    return {
+        "status": "success",
+        "count": len(results),
+        "inspections": [{"id": record_id, **record} for record_id, record in results]
+    }
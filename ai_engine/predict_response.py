@@ -1,13 +1,10 @@
 import os
-import pinecone
-from langchain.embeddings.openai import OpenAIEmbeddings
-from langchain.vectorstores import Pinecone
-from langchain.chat_models import ChatOpenAI
-from langchain.chains import RetrievalQA
-from langchain.schema import Document
-from langchain.prompts import PromptTemplate
+import threading
+from typing import Dict, Iterator, Optional
 from dotenv import load_dotenv
 
+from metrics import stage_timer
+
 load_dotenv()
 
 openai_api_key = os.getenv("OPENAI_API_KEY")
@@ -15,17 +12,95 @@ pinecone_api_key = os.getenv("PINECONE_API_KEY")
 pinecone_env = os.getenv("PINECONE_ENV") or "us-west1-gcp"
 index_name = os.getenv("PINECONE_INDEX") or "emergency-knowledge"
 
-pinecone.init(api_key=pinecone_api_key, environment=pinecone_env)
-llm = ChatOpenAI(openai_api_key=openai_api_key, temperature=0)
 
-def generate_response(query: str) -> str:
+class PredictionPipeline:
+    """検索と応答生成のパイプライン
+
+    埋め込み・ベクトルストア・RetrievalQA を一度だけ構築し、リクエスト間で再利用する。
+    """
+
+    def __init__(self, llm, retriever):
+        from langchain.chains import RetrievalQA
+
+        self.llm = llm
+        self.retriever = retriever
+        self.qa = RetrievalQA.from_chain_type(
+            llm=llm,
+            chain_type="stuff",
+            retriever=retriever,
+            return_source_documents=False
+        )
+
+    def run(self, query: str) -> str:
+        # RetrievalQA.run と同じ処理を、検索と生成の所要時間を分けて記録しながら行う
+        with stage_timer("vector_search", source="knowledge"):
+            docs = self.retriever.get_relevant_documents(query)
+        with stage_timer("llm"):
+            return self.qa.combine_documents_chain.run(input_documents=docs, question=query)
+
+    def stream(self, query: str) -> Iterator[Dict]:
+        """検索結果のメタデータを先に返し、続けて生成中のトークンを順に返す
+
+        RetrievalQA の "stuff" と同じプロンプトで LLM をストリーミング呼び出しする。
+        """
+        with stage_timer("vector_search", source="knowledge"):
+            docs = self.retriever.get_relevant_documents(query)
+        yield {"event": "context", "data": {
+            "sources": [{"metadata": doc.metadata, "preview": doc.page_content[:200]} for doc in docs]
+        }}
+
+        combine = self.qa.combine_documents_chain
+        prompt = combine.llm_chain.prompt
+        context = combine.document_separator.join(doc.page_content for doc in docs)
+        pieces = []
+        for chunk in self.llm.stream(prompt.format_prompt(context=context, question=query)):
+            if chunk.content:
+                pieces.append(chunk.content)
+                yield {"event": "token", "data": chunk.content}
+        yield {"event": "done", "data": {"answer": "".join(pieces)}}
+
+
+def build_pipeline() -> PredictionPipeline:
+    """Pinecone と OpenAI に接続してパイプラインを構築する
+
+    langchain・pinecone の読み込みには数秒かかるため、モジュールの import 時ではなくここで読み込む。
+    """
+    import pinecone
+    from langchain.embeddings.openai import OpenAIEmbeddings
+    from langchain.vectorstores import Pinecone
+    from langchain.chat_models import ChatOpenAI
+
+    pinecone.init(api_key=pinecone_api_key, environment=pinecone_env)
+    llm = ChatOpenAI(openai_api_key=openai_api_key, temperature=0)
     embeddings = OpenAIEmbeddings(openai_api_key=openai_api_key)
     vectorstore = Pinecone.from_existing_index(index_name=index_name, embedding=embeddings)
-    qa = RetrievalQA.from_chain_type(
-        llm=llm,
-        chain_type="stuff",
-        retriever=vectorstore.as_retriever(search_kwargs={"k": 3}),
-        return_source_documents=False
-    )
-    result = qa.run(query)
-    return result
+    return PredictionPipeline(llm, vectorstore.as_retriever(search_kwargs={"k": 3}))
+
+
+_pipeline: Optional[PredictionPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline() -> PredictionPipeline:
+    """共有パイプラインを返す（未構築なら構築する）"""
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = build_pipeline()
+    return _pipeline
+
+
+def set_pipeline(pipeline: Optional[PredictionPipeline]):
+    """共有パイプラインを差し替える（テストやベンチマーク用）"""
+    global _pipeline
+    with _pipeline_lock:
+        _pipeline = pipeline
+
+
+def generate_response(query: str) -> str:
+    return get_pipeline().run(query)
+
+
+def stream_response(query: str) -> Iterator[Dict]:
+    yield from get_pipeline().stream(query)
@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from typing import AsyncIterable, Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ModuleNotFoundError:  # python-multipart 0.0.12 以前
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# multipart の境界行・パートのヘッダーなど、ファイル本体以外に許すバイト数
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadTooLarge(Exception):
+    """アップロードサイズが上限を超えた"""
+
+
+class _FilePart:
+    """multipart の本文から field のファイルパートだけを一時ファイルへ書き出すパーサーのコールバック"""
+
+    def __init__(self, field: str, out, max_size: int):
+        self.field = field.encode()
+        self.out = out
+        self.max_size = max_size
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.filename: Optional[str] = None
+        self._headers: Dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._target = False
+        self._done = False
+
+    def callbacks(self) -> Dict:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._target = (not self._done and options.get(b"name") == self.field
+                        and b"filename" in options)
+        if self._target:
+            self.filename = options[b"filename"].decode('utf-8', 'replace')
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if not self._target:
+            return
+        self.size += end - start
+        if self.size > self.max_size:
+            raise UploadTooLarge(f"ファイルサイズが上限（{self.max_size} bytes）を超えています")
+        chunk = data[start:end]
+        self.digest.update(chunk)
+        self.out.write(chunk)
+
+    def _on_part_end(self):
+        if self._target:
+            self._done = True
+            self._target = False
+
+
+def safe_filename(name: str) -> str:
+    """クライアントが指定したファイル名から保存に使う名前を返す（使えない名前は ValueError）
+
+    ディレクトリ部分（/ と \\ 区切り）は捨てる。空の名前、. で始まる名前（.・..・隠しファイル・
+    書きかけの .part）と制御文字を含む名前は受け付けない。
+    """
+    filename = os.path.basename(name.replace("\\", "/")).strip()
+    if not filename or filename.startswith(".") or any(ord(char) < 0x20 for char in filename):
+        raise ValueError(f"ファイル名として使えません: {name!r}")
+    return filename
+
+
+class UploadStore:
+    """アップロードファイルの保存先
+
+    multipart/form-data の本文を受信しながら解析し、ファイルのパートを直接一時ファイルへ書き出して
+    SHA-256 を計算する（Starlette の UploadFile のように本文全体を先に一時ファイルへ溜めない）。
+    Content-Length が上限を超えていれば本文を読む前に、チャンク転送などで受信中に上限を超えれば
+    その時点で UploadTooLarge とし、書きかけの一時ファイルは削除する。
+    解析とディスク書き込みはスレッドプールで行うため、イベントループを塞がない。
+    同じ内容のファイルが既に保存されている場合は、新しいファイルを残さずに既存のファイル名を返す。
+    その判定に使うハッシュの索引は、アップロードで上書きされないよう upload_dir の外に置く
+    （既定は <upload_dir の親>/.upload_index/<upload_dir の名前>.jsonl）。
+    """
+
+    # 以前の版が upload_dir の中に置いていた索引（新しい索引がなければ読み込む）
+    LEGACY_INDEX_FILE = ".upload_index.jsonl"
+
+    def __init__(self, upload_dir: str = "data/raw", max_size: Optional[int] = None,
+                 index_path: Optional[str] = None):
+        self.upload_dir = upload_dir
+        self.max_size = max_size if max_size is not None else int(
+            os.getenv("MAX_UPLOAD_SIZE", str(500 * 1024 * 1024))
+        )
+        normalized = os.path.normpath(os.path.abspath(upload_dir))
+        self.index_path = index_path or os.path.join(
+            os.path.dirname(normalized), ".upload_index", os.path.basename(normalized) + ".jsonl"
+        )
+        self._lock = threading.Lock()
+        self._hashes: Optional[Dict[str, str]] = None
+
+    def _load_index(self) -> Dict[str, str]:
+        """ハッシュ -> ファイル名 の索引を読み込む（初回のみ。壊れた行は読み飛ばす）"""
+        if self._hashes is None:
+            path = self.index_path
+            if not os.path.exists(path):
+                path = os.path.join(self.upload_dir, self.LEGACY_INDEX_FILE)
+            # 同名ファイルが上書きされた場合は後の行を優先する
+            by_filename = {}
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                            by_filename[entry["filename"]] = entry["sha256"]
+                        except (ValueError, TypeError, KeyError):
+                            continue
+            self._hashes = {digest: filename for filename, digest in by_filename.items()}
+        return self._hashes
+
+    def _commit(self, tmp_path: str, filename: str, digest: str, size: int) -> Dict:
+        with self._lock:
+            hashes = self._load_index()
+            existing = hashes.get(digest)
+            if existing and os.path.exists(os.path.join(self.upload_dir, existing)):
+                os.remove(tmp_path)
+                return {"filename": existing, "sha256": digest, "size": size, "duplicate": True}
+
+            try:
+                os.replace(tmp_path, os.path.join(self.upload_dir, filename))
+            except OSError:
+                os.remove(tmp_path)
+                raise
+            for old_digest in [h for h, name in hashes.items() if name == filename]:
+                del hashes[old_digest]
+            hashes[digest] = filename
+            os.makedirs(os.path.dirname(self.index_path), exist_ok=True)
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({"sha256": digest, "filename": filename, "size": size},
+                                   ensure_ascii=False) + "\n")
+            return {"filename": filename, "sha256": digest, "size": size, "duplicate": False}
+
+    async def save(self, stream: AsyncIterable[bytes], content_type: str,
+                   content_length: Optional[int] = None, field: str = "file") -> Dict:
+        """multipart/form-data の本文 stream から field のファイルを保存し、保存結果を返す"""
+        if content_length is not None and content_length > self.max_size + MULTIPART_OVERHEAD:
+            raise UploadTooLarge(f"ファイルサイズが上限（{self.max_size} bytes）を超えています")
+        mime_type, options = parse_options_header(content_type)
+        if mime_type != b"multipart/form-data" or b"boundary" not in options:
+            raise ValueError("multipart/form-data で送信してください")
+
+        os.makedirs(self.upload_dir, exist_ok=True)
+        tmp_path = os.path.join(self.upload_dir, f".{uuid.uuid4().hex}.part")
+        out = await run_in_threadpool(open, tmp_path, "wb")
+        part = _FilePart(field, out, self.max_size)
+        parser = MultipartParser(options[b"boundary"], part.callbacks())
+        received = 0
+        try:
+            async for chunk in stream:
+                received += len(chunk)
+                if received > self.max_size + MULTIPART_OVERHEAD:
+                    raise UploadTooLarge(f"ファイルサイズが上限（{self.max_size} bytes）を超えています")
+                await run_in_threadpool(parser.write, chunk)
+            parser.finalize()
+            if part.filename is None:
+                raise ValueError(f"ファイルのフィールド {field} がありません")
+            filename = safe_filename(part.filename)
+        except BaseException:
+            await run_in_threadpool(out.close)
+            os.remove(tmp_path)
+            raise
+        await run_in_threadpool(out.close)
+
+        return await run_in_threadpool(self._commit, tmp_path, filename, part.digest.hexdigest(), part.size)
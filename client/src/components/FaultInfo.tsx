@@ -1,5 +1,5 @@
 import React, { useEffect, useState } from 'react';
-import { faultService, FaultData } from '../services/faultService';
+import { faultService, FaultData, mediaUrl } from '../services/faultService';
 
 const FaultInfo: React.FC = () => {
   const [faultData, setFaultData] = useState<FaultData | null>(null);
@@ -78,6 +78,14 @@ const FaultInfo: React.FC = () => {
                 <span>{new Date(message.timestamp).toLocaleString()}</span>
               </div>
               <p className="mt-1">{message.content}</p>
+              {Object.keys(message.base64_images ?? {}).length > 0 && (
+                <div className="flex flex-wrap gap-2 mt-2">
+                  {Object.entries(message.base64_images).map(([name, image]) => (
+                    <img key={name} src={mediaUrl(image)} alt={name} loading="lazy"
+                      className="h-24 rounded border object-cover" />
+                  ))}
+                </div>
+              )}
             </div>
           ))}
         </div>
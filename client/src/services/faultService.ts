@@ -1,4 +1,5 @@
 import axios from 'axios';
+import { BlobReference, ConversationMessage, InlineMedia } from '../types/fault';
 
 const API_BASE_URL = 'http://localhost:8000/api';
 
@@ -11,14 +12,7 @@ export interface FaultData {
     environment: string;
     last_export: string;
   };
-  conversation_history: Array<{
-    id: number;
-    timestamp: string;
-    role: string;
-    content: string;
-    media: any[];
-    base64_images: Record<string, string>;
-  }>;
+  conversation_history: ConversationMessage[];
   diagnostics: {
     components: string[];
     symptoms: string[];
@@ -34,6 +28,17 @@ export interface FaultData {
   };
 }
 
+export const isBlobReference = (media: InlineMedia): media is BlobReference =>
+  typeof media === 'object' && media !== null && typeof media.blob === 'string';
+
+// 画像を <img src> に渡せるURLにする（ブロブの参照は /api/blobs、base64 の文字列はデータURI）
+export const mediaUrl = (media: InlineMedia): string => {
+  if (isBlobReference(media)) {
+    return `${API_BASE_URL}/blobs/${media.blob}`;
+  }
+  return media.startsWith('data:') ? media : `data:image/png;base64,${media}`;
+};
+
 export const faultService = {
   async getFaultData(): Promise<FaultData | null> {
     try {
@@ -48,7 +53,7 @@ export const faultService = {
     }
   },
 
-  async getFaultHistory() {
+  async getFaultHistory(): Promise<ConversationMessage[]> {
     try {
       const response = await axios.get(`${API_BASE_URL}/fault-history`);
       if (response.data.status === 'success') {
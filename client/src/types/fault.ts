@@ -1,3 +1,23 @@
+// 会話履歴の画像はサーバーでブロブストアに移され、この参照に置き換えて返される。
+// 本体は /api/blobs/{blob} で取得する（短い文字列や元ファイルを直接読んだ場合は文字列のまま）
+export interface BlobReference {
+  blob: string;
+  content_type: string;
+  size: number;
+  encoding: 'base64' | 'data_uri';
+}
+
+export type InlineMedia = string | BlobReference;
+
+export interface ConversationMessage {
+  id: number;
+  timestamp: string;
+  role: 'user' | 'assistant';
+  content: string;
+  media: InlineMedia[];
+  base64_images: Record<string, InlineMedia>;
+}
+
 export interface FaultData {
   session_id: number;
   timestamp: string;
@@ -7,14 +27,7 @@ export interface FaultData {
     environment: string;
     last_export: string;
   };
-  conversation_history: {
-    id: number;
-    timestamp: string;
-    role: 'user' | 'assistant';
-    content: string;
-    media: string[];
-    base64_images: Record<string, string>;
-  }[];
+  conversation_history: ConversationMessage[];
   diagnostics: {
     components: string[];
     symptoms: string[];
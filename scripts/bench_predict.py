@@ -0,0 +1,89 @@
+# 📁 scripts/bench_predict.py
+# /api/predict のスループット計測（LLM・埋め込み検索はスタブ）
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+from typing import Dict, List
+
+import httpx
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ai_engine.main import app, _sse  # noqa: E402
+from ai_engine import predict_response  # noqa: E402
+# ai_engine が src/ を import パスに加えている
+from fake_backends import FakeLatencyChatModel  # noqa: E402
+
+
+class StubRetriever(BaseRetriever):
+    """一定の遅延（埋め込み＋ベクトル検索相当）で固定のドキュメントを返すリトリーバー"""
+    latency: float = 0.02
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        time.sleep(self.latency)
+        return [Document(page_content=f"ブレーキ解放不良の対応手順 {i}") for i in range(3)]
+
+
+async def run_load(total: int, concurrency: int) -> float:
+    """total 件のリクエストを concurrency 並列で送り、requests/sec を返す"""
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one(i: int):
+            async with semaphore:
+                response = await client.post("/api/predict", json={"query": f"ブレーキが解放できない {i}"})
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        return total / (time.perf_counter() - start)
+
+
+def measure_ttfb() -> Dict[str, float]:
+    """最初の出力までの秒数（一括応答とSSEの比較）
+
+    httpx の ASGITransport は本文をまとめて返すため、エンドポイントが返すイベント列を直接計測する。
+    """
+    query = "ブレーキが解放できない"
+    start = time.perf_counter()
+    predict_response.generate_response(query)
+    blocking = time.perf_counter() - start
+
+    start = time.perf_counter()
+    events = _sse(predict_response.stream_response(query))
+    next(events)
+    streaming = time.perf_counter() - start
+    for _ in events:
+        pass
+    return {"/api/predict": blocking, "/api/predict/stream": streaming}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/api/predict のスループット計測")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--retrieval-latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    predict_response.set_pipeline(predict_response.PredictionPipeline(
+        FakeLatencyChatModel(responses=["【応急復旧】ブレーキ回路を確認してください"], latency=args.llm_latency),
+        StubRetriever(latency=args.retrieval_latency),
+    ))
+
+    for concurrency in args.concurrency:
+        rps = asyncio.run(run_load(args.requests, concurrency))
+        print(f"✅ concurrency={concurrency:3d}: {rps:8.1f} requests/sec")
+
+    for path, ttfb in measure_ttfb().items():
+        print(f"✅ time to first byte {path}: {ttfb * 1000:7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
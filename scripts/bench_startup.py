@@ -0,0 +1,89 @@
+# 📁 scripts/bench_startup.py
+# ai_engine のコールドスタート計測（モジュールの import 時間と uvicorn が応答するまでの時間）
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+from typing import Dict, List
+
+import httpx
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure_import(runs: int) -> List[float]:
+    """新しいプロセスで ai_engine.main を import するのにかかる秒数"""
+    code = "import time; s = time.perf_counter(); import ai_engine.main; print(time.perf_counter() - s)"
+    times = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], cwd=ROOT_DIR, check=True,
+                                capture_output=True, text=True).stdout
+        times.append(float(output.strip().splitlines()[-1]))
+    return times
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_server(runs: int, warmup: bool, timeout: float = 60.0) -> List[float]:
+    """uvicorn を起動してから /api/health が応答するまでの秒数"""
+    env = dict(os.environ, AI_ENGINE_WARMUP="1" if warmup else "0")
+    times = []
+    for _ in range(runs):
+        port = _free_port()
+        start = time.perf_counter()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "ai_engine.main:app", "--port", str(port), "--log-level", "warning"],
+            cwd=ROOT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            while True:
+                if time.perf_counter() - start > timeout:
+                    raise TimeoutError("サーバーが起動しませんでした")
+                try:
+                    if httpx.get(f"http://127.0.0.1:{port}/api/health", timeout=1.0).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    time.sleep(0.02)
+            times.append(time.perf_counter() - start)
+        finally:
+            server.terminate()
+            server.wait()
+    return times
+
+
+def summarize(times: List[float]) -> Dict:
+    return {"median_sec": statistics.median(times), "min_sec": min(times), "max_sec": max(times), "runs": len(times)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ai_engine のコールドスタート計測")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--output", default=None, help="結果を JSON で保存するパス")
+    args = parser.parse_args()
+
+    results = {
+        "import_ai_engine_main": summarize(measure_import(args.runs)),
+        "uvicorn_ready": summarize(measure_server(args.runs, warmup=False)),
+        "uvicorn_ready_with_warmup": summarize(measure_server(args.runs, warmup=True)),
+    }
+    for name, summary in results.items():
+        print(f"✅ {name:28s}: median {summary['median_sec'] * 1000:7.1f} ms "
+              f"(min {summary['min_sec'] * 1000:.1f}, max {summary['max_sec'] * 1000:.1f})")
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
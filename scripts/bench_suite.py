@@ -0,0 +1,348 @@
+# 📁 scripts/bench_suite.py
+# オフラインのエンドツーエンド・ベンチマーク（埋め込み・LLMは決定的なフェイク、ベクトルストアはローカル）
+#
+#   python scripts/bench_suite.py --sizes 1000 10000 --output data/benchmarks/latest.json
+#   python scripts/bench_suite.py --baseline data/benchmarks/latest.json   # 前回との比較
+
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+import httpx
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document as LangchainDocument
+from langchain_core.retrievers import BaseRetriever
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, "src"))
+from ai_engine import main as engine, predict_response  # noqa: E402
+from ai_engine.analysis_jobs import AnalysisJobManager  # noqa: E402
+from answer_cache import extract_machine_ids  # noqa: E402
+from embedding_cache import EmbeddingCache  # noqa: E402
+from fake_backends import FakeLatencyChatModel, HashEmbeddings  # noqa: E402
+from vector_store import LocalVectorStore  # noqa: E402
+from vectorize_and_predict import MaintenanceAnalyzer  # noqa: E402
+
+FINDINGS = [
+    ("モーターの異常振動を検知", "ベアリングの状態確認が必要"),
+    ("モーターの温度が上昇傾向", "冷却システムの点検が必要"),
+    ("運転中に異常な音が発生", "ギアボックスの点検が必要"),
+    ("油圧が低下傾向", "油圧システムの点検が必要"),
+    ("異常なし", "通常運転継続"),
+]
+
+
+def make_records(count: int, machines: int = 50, seed: int = 0) -> List[Dict]:
+    """ベンチマーク用の点検記録（乱数シード固定で毎回同じ内容）"""
+    rng = random.Random(seed)
+    base = datetime(2024, 1, 1)
+    records = []
+    for i in range(count):
+        findings, recommendations = rng.choice(FINDINGS)
+        records.append({
+            "inspection_date": (base + timedelta(minutes=17 * i)).strftime("%Y-%m-%d %H:%M:%S"),
+            "machine_id": f"M{rng.randint(1, machines):03d}",
+            "inspection_type": rng.choice(["定期点検", "緊急点検", "予防保全"]),
+            "findings": f"{findings}（記録{i}）",
+            "recommendations": recommendations,
+            "measurements": {
+                "vibration": f"{rng.uniform(0.5, 4.0):.1f}mm/s",
+                "temperature": f"{rng.uniform(45, 95):.1f}°C",
+                "current": f"{rng.uniform(80, 120):.1f}A",
+            },
+            "location": f"工場{rng.choice('ABC')}-{rng.randint(1, 5)}階",
+            "status": "完了" if findings == "異常なし" else "要対応",
+        })
+    return records
+
+
+def make_queries(count: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return [f"モーターM{rng.randint(1, 50):03d}で{rng.choice(FINDINGS)[0]} 事例{i}" for i in range(count)]
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    values = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean()),
+        "samples": len(samples),
+    }
+
+
+def context_savings(analyses: List[Dict]) -> Dict[str, float]:
+    """文脈組み立て前後のプロンプト文脈トークン数（1回の分析あたりの平均）"""
+    raw = [sum(stats["raw_tokens"] for stats in analysis["context_stats"].values()) for analysis in analyses]
+    packed = [sum(stats["tokens"] for stats in analysis["context_stats"].values()) for analysis in analyses]
+    duplicates = [sum(stats["duplicates"] for stats in analysis["context_stats"].values()) for analysis in analyses]
+    return {
+        "raw_tokens_mean": float(np.mean(raw)),
+        "tokens_mean": float(np.mean(packed)),
+        "savings_pct": float((1 - sum(packed) / sum(raw)) * 100) if sum(raw) else 0.0,
+        "duplicates_mean": float(np.mean(duplicates)),
+    }
+
+
+def quantization_tradeoffs(store: LocalVectorStore, embeddings, queries: List[str], k: int = 10) -> Dict:
+    """量子化方式ごとの、全精度の厳密検索に対する recall@k・検索レイテンシ・ベクトルのバイト数"""
+    ids, texts, metadatas = [], [], []
+    for doc_id, doc in store.iter_documents():
+        ids.append(doc_id)
+        texts.append(doc.page_content)
+        metadatas.append(doc.metadata)
+    vectors = embeddings.embed_documents(texts)
+    query_vectors = embeddings.embed_documents(queries)
+    expected = [{doc.page_content for doc, _ in store.similarity_search_by_vector_with_score(query, k=k)}
+                for query in query_vectors]
+
+    variants = {
+        "float32": {},
+        "float16": {"quantization": "float16"},
+        "int8": {"quantization": "int8"},
+        "pq": {"quantization": "pq"},
+        "pq_no_rerank": {"quantization": "pq", "rerank_factor": 0},
+    }
+    results = {}
+    for name, options in variants.items():
+        variant = LocalVectorStore(embeddings, **options)
+        variant.add_embeddings(texts, vectors, metadatas, ids)
+        found = [{doc.page_content for doc, _ in variant.similarity_search_by_vector_with_score(query, k=k)}
+                 for query in query_vectors]
+        footprint = variant.footprint()
+        results[name] = {
+            f"recall_at_{k}": float(np.mean([len(a & b) / len(a) for a, b in zip(expected, found) if a])),
+            **percentiles(timed(lambda query: variant.similarity_search_by_vector_with_score(query, k=k),
+                                query_vectors)),
+            "bytes_per_vector": footprint["bytes_per_vector"],
+            "compression": footprint["compression"],
+        }
+    return results
+
+
+def timed(fn: Callable, items) -> List[float]:
+    samples = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+class LocalStoreRetriever(BaseRetriever):
+    """LocalVectorStore を予測パイプラインのリトリーバーとして使うアダプター"""
+    store: LocalVectorStore
+    k: int = 3
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[LangchainDocument]:
+        return [LangchainDocument(page_content=doc.page_content, metadata=doc.metadata)
+                for doc in self.store.similarity_search(query, k=self.k, filter={"type": "knowledge"})]
+
+
+async def endpoint_throughput(method: str, make_request: Callable[[int], Dict], total: int,
+                              concurrency: int) -> Dict[str, float]:
+    """total 件のリクエストを concurrency 並列で送り、スループットとレイテンシを返す"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    transport = httpx.ASGITransport(app=engine.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        async def one(i: int):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.request(method, **make_request(i))
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+    return {"requests_per_sec": total / elapsed, **percentiles(latencies)}
+
+
+def bench_size(size: int, args) -> Dict:
+    """コーパスサイズ size でのベンチマーク一式"""
+    results: Dict[str, Dict] = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        embeddings = HashEmbeddings(dimension=args.dimension)
+        llm = FakeLatencyChatModel(responses=["1. 原因分析\n2. 対策提案\n3. リスク評価"],
+                                   latency=args.llm_latency)
+        store = LocalVectorStore(embeddings, persist_directory=os.path.join(data_dir, "vectorstore"))
+        analyzer = MaintenanceAnalyzer(
+            embeddings=embeddings, llm=llm, vectorstore=store, data_dir=data_dir,
+            embedding_cache=EmbeddingCache(os.path.join(data_dir, "cache", "embeddings.sqlite"))
+        )
+
+        # 取り込み
+        records = make_records(size)
+        start = time.perf_counter()
+        chunks = analyzer.process_inspection_records(records, batch_size=args.batch_size)
+        elapsed = time.perf_counter() - start
+        for source in ("failure", "knowledge"):
+            texts = [f"{source}事例{i}: {findings} → {recommendations}"
+                     for i, (findings, recommendations) in
+                     enumerate(FINDINGS[j % len(FINDINGS)] for j in range(size // 10))]
+            store.add_texts(texts, [{"type": source} for _ in texts])
+        results["ingestion"] = {
+            "records": size,
+            "chunks": chunks,
+            "seconds": elapsed,
+            "records_per_sec": size / elapsed,
+            "chunks_per_sec": chunks / elapsed,
+        }
+
+        # 検索（問い合わせごとに埋め込み1回＋種類別の検索3件）
+        queries = make_queries(args.queries)
+        results["retrieval"] = percentiles(timed(analyzer.retrieve_context, queries))
+        # 機械IDで点検記録を絞り込んだ検索（類似度計算はその機械の行だけ）
+        results["retrieval_scoped"] = percentiles(timed(
+            lambda query: analyzer.retrieve_context(
+                query, inspection_filter=analyzer.inspection_filter(machine_id=min(extract_machine_ids(query)))),
+            queries))
+
+        # 故障原因分析（LLMは固定遅延のフェイク。キャッシュに当たらないよう毎回別の質問）
+        analyze_queries = make_queries(args.analyze_queries, seed=2)
+        analyses = []
+        results["analyze_failure_cause"] = percentiles(
+            timed(lambda query: analyses.append(analyzer.analyze_failure_cause(query)), analyze_queries))
+        # プロンプトに入れた文脈のトークン数（重複除去・MMR・予算で削った分）
+        results["context"] = context_savings(analyses)
+
+        # ベクトルの量子化（float16 / int8 / 直積量子化）による精度・速度・メモリの比較
+        results["quantization"] = quantization_tradeoffs(store, embeddings, queries)
+
+        # 夜間の全機械分析（バッチジョブ）。所要時間は機械数ではなく同時実行数で決まる
+        machine_ids = sorted({record["machine_id"] for record in records})
+        results["batch_job"] = {"machines": len(machine_ids)}
+        for concurrency in (1, args.concurrency):
+            jobs = AnalysisJobManager(lambda: analyzer, jobs_dir=os.path.join(data_dir, "jobs"))
+            start = time.perf_counter()
+            job = jobs.wait(jobs.submit(machine_ids=machine_ids, concurrency=concurrency)["job_id"])
+            elapsed = time.perf_counter() - start
+            results["batch_job"][f"concurrency_{concurrency}"] = {
+                "seconds": elapsed,
+                "machines_per_sec": job["done"] / elapsed,
+                "shared_retrievals": job["shared_retrievals"],
+            }
+
+        # FastAPI エンドポイントのスループット
+        predict_response.set_pipeline(predict_response.PredictionPipeline(llm, LocalStoreRetriever(store=store)))
+        engine._analyzer = analyzer
+        engine._inspection_index = analyzer.inspection_index
+        measurement_store = engine.measurement_store
+        engine.measurement_store = analyzer.measurement_store
+        endpoints = {
+            "POST /api/predict": ("POST", lambda i: {"url": "/api/predict", "json": {"query": f"ブレーキ不良 {i}"}}),
+            "POST /api/analyze/stream": ("POST", lambda i: {"url": "/api/analyze/stream",
+                                                            "json": {"query": f"モーターM001で振動 {size}-{i}"}}),
+            "GET /api/inspections": ("GET", lambda i: {"url": "/api/inspections",
+                                                       "params": {"machine_id": f"M{i % 50 + 1:03d}", "limit": 20}}),
+            "GET /api/anomalies": ("GET", lambda i: {"url": "/api/anomalies"}),
+        }
+        results["endpoints"] = {
+            name: asyncio.run(endpoint_throughput(method, make_request, args.requests, args.concurrency))
+            for name, (method, make_request) in endpoints.items()
+        }
+        engine._analyzer = None
+        engine._inspection_index = None
+        engine.measurement_store = measurement_store
+        predict_response.set_pipeline(None)
+        analyzer.close()
+    return results
+
+
+def _flatten(results: Dict, prefix: str = "") -> Dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(current: Dict, baseline: Dict):
+    """前回の結果との差分（レイテンシ・スループットの主要指標）を表示する"""
+    now, before = _flatten(current["results"]), _flatten(baseline["results"])
+    for key in sorted(now):
+        if key in before and before[key] and key.endswith(("_per_sec", "p50_ms", "p99_ms", "tokens_mean")):
+            change = (now[key] - before[key]) / before[key] * 100
+            print(f"  {key:60s} {before[key]:10.2f} → {now[key]:10.2f} ({change:+6.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="フェイクのバックエンドで取り込み・検索・分析・APIを計測する")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000], help="コーパスの記録数")
+    parser.add_argument("--queries", type=int, default=200, help="検索レイテンシの計測回数")
+    parser.add_argument("--analyze-queries", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=100, help="エンドポイントごとのリクエスト数")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--output", default=None, help="結果のJSON（既定: data/benchmarks/bench_<日時>.json）")
+    parser.add_argument("--baseline", default=None, help="比較する前回の結果JSON")
+    args = parser.parse_args()
+
+    # ウォームアップ（OpenAI・Pinecone への接続）は行わない
+    os.environ["AI_ENGINE_WARMUP"] = "0"
+    report = {
+        "timestamp": datetime.now().isoformat(),
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "results": {},
+    }
+    for size in args.sizes:
+        print(f"▶ corpus size {size}")
+        results = bench_size(size, args)
+        report["results"][str(size)] = results
+        print(f"✅ ingestion: {results['ingestion']['records_per_sec']:,.0f} records/sec, "
+              f"retrieval p50/p99: {results['retrieval']['p50_ms']:.2f}/{results['retrieval']['p99_ms']:.2f} ms, "
+              f"scoped p50: {results['retrieval_scoped']['p50_ms']:.2f} ms, "
+              f"analyze p50: {results['analyze_failure_cause']['p50_ms']:.1f} ms")
+        print(f"   context tokens/analysis: {results['context']['raw_tokens_mean']:.0f} → "
+              f"{results['context']['tokens_mean']:.0f} ({results['context']['savings_pct']:.1f}% saved)")
+        for name, variant in results["quantization"].items():
+            print(f"   vectors {name:14s} recall@10 {variant['recall_at_10']:.3f}  "
+                  f"p50 {variant['p50_ms']:.2f} ms  {variant['bytes_per_vector']:.0f} B/vector "
+                  f"({variant['compression']:.1f}x)")
+        batch = results["batch_job"]
+        print(f"   batch job ({batch['machines']} machines): "
+              f"{batch['concurrency_1']['seconds']:.2f} s sequential → "
+              f"{batch[f'concurrency_{args.concurrency}']['seconds']:.2f} s with concurrency {args.concurrency}")
+        for name, endpoint in results["endpoints"].items():
+            print(f"   {name:28s} {endpoint['requests_per_sec']:8.1f} req/s  p99 {endpoint['p99_ms']:.1f} ms")
+
+    output = args.output or os.path.join(
+        "data", "benchmarks", f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ 結果を保存しました → {output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            print(f"前回 ({args.baseline}) との比較:")
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
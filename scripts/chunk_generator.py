@@ -2,32 +2,118 @@
 
 import os
 import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
 
 CHUNK_SIZE = 500
 OVERLAP = 50
+# 区切り位置として採用する文末・改行の最小位置（これより前にしかなければ CHUNK_SIZE で切る）
+MIN_BOUNDARY = CHUNK_SIZE // 2
+READ_SIZE = 1024 * 1024
+SENTENCE_ENDS = ("。", "\n")
 
 # 入力・出力パス
 INPUT_PATH = "./data/raw/railway_maintenance_knowledge.txt"
-OUTPUT_PATH = "./data/processed/chunks.json"
-os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
-
-# テキスト読み込み
-with open(INPUT_PATH, "r", encoding="utf-8") as f:
-    text = f.read()
-
-# チャンク分割処理
-chunks = []
-start = 0
-while start < len(text):
-    end = min(start + CHUNK_SIZE, len(text))
-    chunks.append({
-        "id": len(chunks),
-        "content": text[start:end].strip()
-    })
-    start += CHUNK_SIZE - OVERLAP
-
-# 保存
-with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
-    json.dump(chunks, f, ensure_ascii=False, indent=2)
-
-print(f"✅ チャンク {len(chunks)} 件を {OUTPUT_PATH} に保存しました")
+OUTPUT_PATH = "./data/processed/chunks.jsonl"
+
+
+def _chunk_end(window: str) -> int:
+    """ウィンドウ内で最後の文末（。/改行）の直後を返す。見つからなければ末尾"""
+    boundary = max(window.rfind(mark) for mark in SENTENCE_ENDS)
+    if boundary >= MIN_BOUNDARY:
+        return boundary + 1
+    return len(window)
+
+
+def iter_chunks(f):
+    """テキストを少しずつ読みながら、OVERLAP 文字重ねたチャンクを順に返す
+
+    保持するのは読み込みバッファ（READ_SIZE + CHUNK_SIZE 程度）だけなので、
+    入力ファイルの大きさに関係なくメモリ使用量は一定になる。
+    """
+    buffer = ""
+    pos = 0
+    eof = False
+    while True:
+        while not eof and len(buffer) - pos < CHUNK_SIZE:
+            block = f.read(READ_SIZE)
+            if block:
+                buffer = buffer[pos:] + block
+                pos = 0
+            else:
+                eof = True
+        if pos >= len(buffer):
+            return
+
+        window = buffer[pos:pos + CHUNK_SIZE]
+        at_end = eof and pos + len(window) >= len(buffer)
+        end = len(window) if at_end else _chunk_end(window)
+
+        content = window[:end].strip()
+        if content:
+            yield content
+        if at_end:
+            return
+        pos += end - OVERLAP
+
+
+def generate_chunks(input_path: str, output_path: str, source: Optional[str] = None) -> int:
+    """1ファイルをチャンク分割し、JSONL として1行ずつ書き出す（source の既定はファイル名）"""
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    count = 0
+    source = source or os.path.basename(input_path)
+    with open(input_path, "r", encoding="utf-8") as src, open(output_path, "w", encoding="utf-8") as out:
+        for content in iter_chunks(src):
+            out.write(json.dumps({"id": count, "source": source, "content": content}, ensure_ascii=False) + "\n")
+            count += 1
+    return count
+
+
+def output_paths(inputs: List[str], output_dir: str) -> List[Tuple[str, str]]:
+    """複数の入力それぞれの (出力先, source) を返す
+
+    入力に共通する親ディレクトリからの相対パスを使い、output_dir の下に
+    <相対パス（拡張子なし）>.chunks.jsonl として書き出す。同じ名前の入力が別の
+    ディレクトリにあっても出力は衝突しない。それでも衝突する場合（拡張子だけが違うなど）は ValueError。
+    """
+    paths = [os.path.abspath(path) for path in inputs]
+    base = os.path.commonpath([os.path.dirname(path) for path in paths])
+    results, seen = [], {}
+    for path, original in zip(paths, inputs):
+        relative = os.path.relpath(path, base)
+        output_path = os.path.join(output_dir, os.path.splitext(relative)[0] + ".chunks.jsonl")
+        if output_path in seen:
+            raise ValueError(f"{seen[output_path]} と {original} の出力先が同じです: {output_path}")
+        seen[output_path] = original
+        results.append((output_path, relative.replace(os.sep, "/")))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ナレッジテキストのチャンク分割")
+    parser.add_argument("inputs", nargs="*", default=[INPUT_PATH], help="入力テキストファイル")
+    parser.add_argument("--output", default=OUTPUT_PATH, help="出力先（入力が1件のとき）")
+    parser.add_argument("--output-dir", default="./data/processed",
+                        help="出力先ディレクトリ（入力が複数のとき <共通の親からの相対パス>.chunks.jsonl）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if len(args.inputs) == 1:
+        targets = [(args.output, os.path.basename(args.inputs[0]))]
+    else:
+        try:
+            targets = output_paths(args.inputs, args.output_dir)
+        except ValueError as e:
+            parser.error(str(e))
+    outputs = [output_path for output_path, _ in targets]
+    sources = [source for _, source in targets]
+
+    # 複数ファイルはプロセスごとに並列で処理する
+    with ProcessPoolExecutor(max_workers=min(args.workers, len(args.inputs))) as pool:
+        for output_path, count in zip(outputs, pool.map(generate_chunks, args.inputs, outputs, sources)):
+            print(f"✅ チャンク {count} 件を {output_path} に保存しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,25 +2,27 @@
 
 import os
 import json
-import openai
+import time
+import random
+import asyncio
+import argparse
+from types import SimpleNamespace
+from typing import Dict, Optional, Set
+
 from dotenv import load_dotenv
 
 # .env から OPENAI_API_KEY を読み込む
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
 
 # 入出力パス
-INPUT_PATH = "./data/processed/chunks.json"
-OUTPUT_PATH = "./data/processed/qa_data.json"
-os.makedirs(os.path.dirname(OUTPUT_PATH), exist_ok=True)
+INPUT_PATH = "./data/processed/chunks.jsonl"
+OUTPUT_PATH = "./data/processed/qa_data.jsonl"
 
-# チャンク読み込み
-with open(INPUT_PATH, "r", encoding="utf-8") as f:
-    chunks = json.load(f)
+SYSTEM_PROMPT = "あなたは鉄道保守の専門家です。"
 
-# GPTに問い合わせる関数
-def generate_qa(chunk_text):
-    prompt = f"""
+
+def build_prompt(chunk_text: str) -> str:
+    return f"""
 以下の内容に基づいて、1つの質問とその回答を日本語で作成してください。
 
 --- 内容 ---
@@ -28,29 +30,205 @@ def generate_qa(chunk_text):
 --- 出力形式 ---
 {{"question": "...", "answer": "..."}}
 """
-    response = openai.ChatCompletion.create(
-        model="gpt-4",
+
+
+def chunk_key(chunk: Dict) -> str:
+    """チャンクの識別キー（複数ファイルのチャンクが混在しても衝突しない）"""
+    return f"{chunk.get('source', '')}:{chunk['id']}"
+
+
+class TokenBucket:
+    """トークンバケット方式のレート制限（rate 件/秒、最大 capacity 件のバースト）"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: float = 1.0):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+
+class StubChatClient:
+    """テスト用のローカルスタブLLM（OpenAI クライアントと同じ呼び出し形）"""
+
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, model, messages, **kwargs):
+        await asyncio.sleep(self.latency)
+        content = messages[-1]["content"].split("--- 内容 ---")[-1].split("--- 出力形式 ---")[0].strip()
+        answer = json.dumps({"question": f"{content[:20]}とは何ですか？", "answer": content[:100]},
+                            ensure_ascii=False)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=answer))])
+
+
+class InvalidReply(ValueError):
+    """LLMの応答が想定した JSON の形になっていない"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """再試行で回復し得る失敗（レート制限・タイムアウト・接続エラー）か"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    try:
+        import openai
+    except ImportError:
+        return False
+    # APITimeoutError は APIConnectionError のサブクラス
+    return isinstance(error, (openai.RateLimitError, openai.APIConnectionError))
+
+
+# GPTに問い合わせる関数
+async def generate_qa(client, chunk_text: str, model: str) -> Dict:
+    response = await client.chat.completions.create(
+        model=model,
         messages=[
-            {"role": "system", "content": "あなたは鉄道保守の専門家です。"},
-            {"role": "user", "content": prompt}
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": build_prompt(chunk_text)}
         ]
     )
     # 応答からJSON部分だけ抽出
     content = response.choices[0].message.content.strip()
-    return json.loads(content)
-
-# 全チャンクにQ&Aを生成
-qa_data = []
-for chunk in chunks:
     try:
-        qa = generate_qa(chunk["content"])
-        qa["id"] = chunk["id"]
-        qa_data.append(qa)
-    except Exception as e:
-        print(f"❌ chunk {chunk['id']} failed: {e}")
+        qa = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise InvalidReply(f"JSONではない応答です: {content[:100]}") from e
+    # JSONでも形が違う応答（配列・文字列・項目の欠落）はそのチャンクの失敗として扱う
+    if not isinstance(qa, dict) or not all(isinstance(qa.get(key), str) for key in ("question", "answer")):
+        raise InvalidReply(f"想定外の応答形式です: {content[:100]}")
+    return qa
+
+
+def load_done_keys(output_path: str) -> Set[str]:
+    """出力済みのQ&Aのキーを読み込む（再開時にスキップする）"""
+    done = set()
+    if os.path.exists(output_path):
+        with open(output_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    qa = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み途中で中断された行は無視する
+                    continue
+                done.add(f"{qa.get('source', '')}:{qa['id']}")
+    return done
+
+
+async def run(chunks, output_path: str, client, model: str = "gpt-4", concurrency: int = 16,
+              requests_per_minute: float = 500, max_retries: int = 5, base_delay: float = 1.0) -> Dict:
+    """チャンクごとのQ&Aを並列に生成し、完了したものから1行ずつ追記する
+
+    チャンクは生産者タスクが chunks から順に読み、上限付きのキューでワーカーに渡す
+    （入力全体をメモリに載せない）。
+    レート制限・タイムアウト・接続エラーだけを指数バックオフで再試行する。応答の形が
+    不正なチャンクは再試行せずに失敗として数え、それ以外の例外（認証エラーなど）は
+    ほかのワーカーを止めてそのまま送出する。
+    """
+    done = load_done_keys(output_path)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    bucket = TokenBucket(requests_per_minute / 60.0, capacity=concurrency)
+    stats = {"generated": 0, "failed": 0, "skipped": 0}
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+
+    async def producer():
+        for chunk in chunks:
+            if chunk_key(chunk) in done:
+                stats["skipped"] += 1
+            else:
+                await queue.put(chunk)
+        # ワーカーごとに終了の合図を送る（途中で失敗した場合は run() がワーカーを止める）
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        async def worker():
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    return
+                qa = None
+                for attempt in range(max_retries + 1):
+                    await bucket.acquire()
+                    try:
+                        qa = await generate_qa(client, chunk["content"], model)
+                        break
+                    except InvalidReply as e:
+                        print(f"❌ chunk {chunk_key(chunk)} failed: {e}")
+                        stats["failed"] += 1
+                        break
+                    except Exception as e:
+                        if not is_retryable(e):
+                            raise
+                        if attempt == max_retries:
+                            print(f"❌ chunk {chunk_key(chunk)} failed: {e}")
+                            stats["failed"] += 1
+                        else:
+                            # 指数バックオフ（ジッター付き）
+                            await asyncio.sleep(base_delay * (2 ** attempt) * (0.5 + random.random()))
+                if qa is not None:
+                    qa["id"] = chunk["id"]
+                    if "source" in chunk:
+                        qa["source"] = chunk["source"]
+                    out.write(json.dumps(qa, ensure_ascii=False) + "\n")
+                    out.flush()
+                    stats["generated"] += 1
+
+        tasks = [asyncio.create_task(producer())] + [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    return stats
+
+
+def iter_chunks(input_path: str):
+    with open(input_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="チャンクからQ&Aを生成")
+    parser.add_argument("--input", default=INPUT_PATH)
+    parser.add_argument("--output", default=OUTPUT_PATH)
+    parser.add_argument("--model", default="gpt-4")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rpm", type=float, default=500, help="1分あたりの最大リクエスト数")
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--base-url", default=None, help="OpenAI 互換APIのURL（ローカルLLMなど）")
+    parser.add_argument("--stub", action="store_true", help="スタブLLMで実行する（テスト用）")
+    args = parser.parse_args()
+
+    if args.stub:
+        client = StubChatClient()
+    else:
+        from openai import AsyncOpenAI
+        client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=args.base_url)
+
+    start = time.perf_counter()
+    stats = asyncio.run(run(iter_chunks(args.input), args.output, client, model=args.model,
+                            concurrency=args.concurrency, requests_per_minute=args.rpm,
+                            max_retries=args.max_retries))
+    elapsed = time.perf_counter() - start
+    print(f"✅ Q&A生成完了: {stats['generated']} 件を保存しました → {args.output} "
+          f"（スキップ {stats['skipped']} 件, 失敗 {stats['failed']} 件, {elapsed:.1f} 秒）")
 
-# 保存
-with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
-    json.dump(qa_data, f, ensure_ascii=False, indent=2)
 
-print(f"✅ Q&A生成完了: {len(qa_data)} 件を保存しました → {OUTPUT_PATH}")
+if __name__ == "__main__":
+    main()
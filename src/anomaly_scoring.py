@@ -0,0 +1,132 @@
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from measurement_store import MeasurementStore
+
+# 測定項目ごとのしきい値（high: 上限超過、low: 下限割れで異常）
+DEFAULT_THRESHOLDS = {
+    "vibration": {"high": 2.8},      # mm/s
+    "temperature": {"high": 80.0},   # °C
+    "current": {"high": 110.0},      # A
+    "oil_pressure": {"low": 2.5},    # MPa
+}
+
+
+def fleet_matrix(store: MeasurementStore, machine_ids: List[str], measurement: str,
+                 window: int) -> np.ndarray:
+    """各機械の直近 window 件の測定値を右詰めに並べた (機械数, window) の行列を返す
+
+    欠測（NaN）は詰めて数え、値が足りない機械は左側を NaN で埋める。
+    """
+    matrix = np.full((len(machine_ids), window), np.nan)
+    for row, machine_id in enumerate(machine_ids):
+        column = store.series(machine_id, [measurement])[measurement]
+        column = column[~np.isnan(column)][-window:]
+        if len(column):
+            matrix[row, window - len(column):] = column
+    return matrix
+
+
+def score_matrix(values: np.ndarray, z_threshold: float = 3.0, drift_threshold: float = 2.0,
+                 ewma_alpha: float = 0.3, min_history: int = 3, high: Optional[float] = None,
+                 low: Optional[float] = None) -> Dict[str, np.ndarray]:
+    """(機械数, window) の行列を一括で採点する
+
+    最新値（右端）について、それ以前の値を基準とした z スコア、
+    EWMA の基準平均からのずれ（標準偏差単位）、しきい値超過を機械ごとに計算する。
+    """
+    latest = values[:, -1]
+    history = values[:, :-1]
+    valid = ~np.isnan(history)
+    count = valid.sum(axis=1)
+    filled = np.where(valid, history, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = filled.sum(axis=1) / count
+        var = (np.where(valid, history - mean[:, None], 0.0) ** 2).sum(axis=1) / count
+        std = np.sqrt(var)
+        enough = (count >= min_history) & (std > 0) & ~np.isnan(latest)
+        z_score = np.where(enough, (latest - mean) / std, 0.0)
+
+        # EWMA（新しい値ほど重い）を欠測を除いて計算する
+        window = values.shape[1]
+        weights = (1 - ewma_alpha) ** np.arange(window - 1, -1, -1)
+        all_valid = ~np.isnan(values)
+        ewma = (np.where(all_valid, values, 0.0) @ weights) / (all_valid @ weights)
+        drift = np.where(enough, (ewma - mean) / std, 0.0)
+
+    crossed = np.zeros(len(latest), dtype=bool)
+    if high is not None:
+        crossed |= latest > high
+    if low is not None:
+        crossed |= latest < low
+
+    score = np.maximum(np.abs(z_score) / z_threshold, np.abs(drift) / drift_threshold)
+    score = np.where(crossed, np.maximum(score, 1.0), score)
+    return {
+        "latest": latest,
+        "z_score": z_score,
+        "ewma_drift": drift,
+        "threshold_crossed": crossed,
+        "score": score,
+    }
+
+
+def _value(x) -> Optional[float]:
+    return None if np.isnan(x) else round(float(x), 3)
+
+
+def score_fleet(store: MeasurementStore, window: int = 30, thresholds: Optional[Dict] = None,
+                z_threshold: float = 3.0, drift_threshold: float = 2.0,
+                machine_ids: Optional[List[str]] = None) -> List[Dict]:
+    """全機械を測定項目ごとに一括採点し、スコアの高い順に返す
+
+    score が 1 以上の機械を flagged とし、LLM による詳細分析の対象にする。
+    """
+    thresholds = thresholds or DEFAULT_THRESHOLDS
+    machine_ids = machine_ids if machine_ids is not None else store.machine_ids()
+    if not machine_ids:
+        return []
+
+    results = {}
+    for measurement, limits in thresholds.items():
+        matrix = fleet_matrix(store, machine_ids, measurement, window)
+        scores = score_matrix(matrix, z_threshold=z_threshold, drift_threshold=drift_threshold,
+                              high=limits.get("high"), low=limits.get("low"))
+        results[measurement] = scores
+
+    total = np.max(np.vstack([scores["score"] for scores in results.values()]), axis=0)
+    report = []
+    for row, machine_id in enumerate(machine_ids):
+        measurements = {}
+        reasons = []
+        for measurement, scores in results.items():
+            latest = scores["latest"][row]
+            if np.isnan(latest):
+                continue
+            z_score = float(scores["z_score"][row])
+            drift = float(scores["ewma_drift"][row])
+            crossed = bool(scores["threshold_crossed"][row])
+            measurements[measurement] = {
+                "latest": _value(latest),
+                "unit": store.units.get(measurement, ""),
+                "z_score": round(z_score, 3),
+                "ewma_drift": round(drift, 3),
+                "threshold_crossed": crossed,
+            }
+            if crossed:
+                reasons.append(f"{measurement}: しきい値超過 ({_value(latest)}{store.units.get(measurement, '')})")
+            if abs(z_score) >= z_threshold:
+                reasons.append(f"{measurement}: 急変 (z={z_score:.2f})")
+            if abs(drift) >= drift_threshold:
+                reasons.append(f"{measurement}: 傾向変化 (EWMA drift={drift:.2f})")
+        report.append({
+            "machine_id": machine_id,
+            "score": round(float(total[row]), 3),
+            "flagged": bool(total[row] >= 1.0),
+            "reasons": reasons,
+            "measurements": measurements,
+        })
+
+    report.sort(key=lambda item: item["score"], reverse=True)
+    return report
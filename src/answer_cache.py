@@ -0,0 +1,132 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# "モーターM001で…" のように日本語に続く機械IDも拾えるよう、英数字以外を境界とする
+_MACHINE_ID_PATTERN = re.compile(r"(?<![A-Za-z0-9])M\d+(?![A-Za-z0-9])")
+
+
+def extract_machine_ids(text: str) -> FrozenSet[str]:
+    """テキストに含まれる機械ID（M001 など）の集合"""
+    return frozenset(_MACHINE_ID_PATTERN.findall(text or ""))
+
+
+class SemanticAnswerCache:
+    """クエリの埋め込みで引く分析結果のキャッシュ
+
+    新しいクエリの埋め込みとキャッシュ済みの埋め込みのコサイン類似度が
+    similarity_threshold 以上で、言及している機械IDの集合が一致すれば同じ質問とみなす。
+    エントリは ttl 秒で失効し、max_entries を超えると最も長く使われていないものから削除する。
+    エントリには依存する機械IDを記録し、その機械の記録が取り込まれたら invalidate_machines() で破棄する。
+    """
+
+    def __init__(self, similarity_threshold: float = 0.95, ttl: float = 3600.0,
+                 max_entries: int = 1024):
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # スロット番号 -> エントリ（参照順。先頭が最も古い）
+        self._entries: "OrderedDict[int, Dict]" = OrderedDict()
+        self._vectors: Optional[np.ndarray] = None
+        self._free: List[int] = list(range(max_entries - 1, -1, -1))
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _evict(self, slot: int):
+        del self._entries[slot]
+        self._free.append(slot)
+
+    def _expire(self, now: float):
+        expired = [slot for slot, entry in self._entries.items() if entry["expires"] <= now]
+        for slot in expired:
+            self._evict(slot)
+
+    def get(self, query: str, embedding) -> Optional[Tuple[Dict, float]]:
+        """類似クエリの結果があれば (結果, 類似度) を返す"""
+        vector = self._normalize(embedding)
+        machines = extract_machine_ids(query)
+        with self._lock:
+            self._expire(time.monotonic())
+            best_slot, best_score = None, -1.0
+            if self._entries:
+                slots = np.fromiter(self._entries.keys(), dtype=np.int64, count=len(self._entries))
+                scores = self._vectors[slots] @ vector
+                for i in np.argsort(-scores):
+                    if scores[i] < self.similarity_threshold:
+                        break
+                    # 機械IDが異なる質問は埋め込みが近くても別の回答になる
+                    if self._entries[int(slots[i])]["query_machines"] == machines:
+                        best_slot, best_score = int(slots[i]), float(scores[i])
+                        break
+            if best_slot is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_slot)
+            self.hits += 1
+            return self._entries[best_slot]["result"], best_score
+
+    def put(self, query: str, embedding, result: Dict, machine_ids: Iterable[str] = ()):
+        """分析結果を保存する（machine_ids は回答が依存する機械ID）"""
+        vector = self._normalize(embedding)
+        query_machines = extract_machine_ids(query)
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            self._expire(time.monotonic())
+            if not self._free:
+                self._evict(next(iter(self._entries)))
+            slot = self._free.pop()
+            self._vectors[slot] = vector
+            self._entries[slot] = {
+                "result": result,
+                "query_machines": query_machines,
+                "machines": query_machines | frozenset(machine_ids),
+                "expires": time.monotonic() + self.ttl,
+            }
+
+    def invalidate_machines(self, machine_ids: Iterable[str]) -> int:
+        """指定した機械に依存するエントリを破棄し、破棄した件数を返す
+
+        機械IDに依存しない（全体を対象にした）エントリも、新しい記録で回答が変わりうるため破棄する。
+        """
+        machine_ids = frozenset(machine_ids)
+        if not machine_ids:
+            return 0
+        with self._lock:
+            stale = [slot for slot, entry in self._entries.items()
+                     if not entry["machines"] or entry["machines"] & machine_ids]
+            for slot in stale:
+                self._evict(slot)
+            self.invalidations += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            for slot in list(self._entries):
+                self._evict(slot)
+
+    def stats(self) -> Dict:
+        """ヒット・ミスの件数とヒット率"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "invalidations": self.invalidations,
+        }
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import argparse
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from embedding_cache import chunk_id
+from record_log import RecordLog
+from vectorize_and_predict import MaintenanceAnalyzer, CHUNK_SIZE, CHUNK_OVERLAP
+
+
+def iter_records(path: str, after: Optional[str] = None) -> Iterator[Tuple[str, Dict]]:
+    """記録ログ、ディレクトリ内の *.json または JSONL ファイルから (キー, 記録) を順に返す
+
+    キーは記録ID・ファイル名（JSONL は行番号）で、順序は毎回同じになる。
+    after を指定すると、そのキーより後の記録から返す（前回の取り込みの続き）。
+    記録ログに after の記録がない場合は、どこから再開すべきか分からないため ValueError にする。
+    """
+    if RecordLog.is_log_dir(path):
+        log = RecordLog(path, read_only=True)
+        record_ids = log.ids()
+        start = 0
+        if after is not None:
+            try:
+                start = record_ids.index(after) + 1
+            except ValueError:
+                raise ValueError(f"前回取り込んだ最後の記録 {after} が記録ログにありません: {path}") from None
+        for record_id in record_ids[start:]:
+            yield record_id, log.get(record_id)
+    elif os.path.isdir(path):
+        # ファイル名順に取り込むため、前回の最後のファイル名より後ろから再開する
+        filenames = sorted(f for f in os.listdir(path) if f.endswith('.json'))
+        start = bisect_right(filenames, after) if after is not None else 0
+        for filename in filenames[start:]:
+            with open(os.path.join(path, filename), 'r', encoding='utf-8') as f:
+                yield filename, json.load(f)
+    else:
+        last_line = int(after) if after is not None else 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                if line_no <= last_line or not line.strip():
+                    continue
+                yield str(line_no), json.loads(line)
+
+
+def _batched(items: Iterator, size: int) -> Iterator[List]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+_splitter: Optional[RecursiveCharacterTextSplitter] = None
+
+
+def chunk_records(records: List[Dict]) -> List[List[str]]:
+    """記録ごとにテキスト化してチャンクに分割する（ワーカープロセスで実行）"""
+    global _splitter
+    if _splitter is None:
+        _splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    return [_splitter.split_text(MaintenanceAnalyzer._format_record_as_text(record)) for record in records]
+
+
+class IngestManifest:
+    """取り込みの進捗を保存するチェックポイント
+
+    入力ごとに、投入が完了した先頭からの記録数と最後のキーを記録し、再開は最後のキーの次から行う。
+    チャンクIDは内容と記録の識別情報から決まるため、中断直前のバッチを再投入しても重複しない。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.sources: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.sources = json.load(f)
+
+    def get(self, source: str) -> Dict:
+        return self.sources.get(source, {"completed": 0, "last_key": None, "chunks": 0})
+
+    def update(self, source: str, completed: int, last_key: str, chunks: int):
+        self.sources[source] = {"completed": completed, "last_key": last_key, "chunks": chunks}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.sources, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def bulk_ingest(analyzer: MaintenanceAnalyzer, path: str, manifest: IngestManifest, workers: int = 4,
+                batch_size: int = 1000, log_every: int = 10) -> Dict:
+    """記録を並列にチャンク化し、大きなバッチで分析器のベクトルストアへ投入する
+
+    バッチごとに analyzer.after_ingest を呼び、process_inspection_records と同じく
+    全文検索の索引・測定値ストアへの追加と、回答キャッシュの無効化を行う。
+    """
+    source = os.path.abspath(path)
+    state = manifest.get(source)
+    completed, total_chunks = state["completed"], state["chunks"]
+
+    if completed and state["last_key"] is None:
+        raise ValueError(f"チェックポイントに最後のキーがありません: {source}")
+    records = iter_records(path, after=state["last_key"])
+
+    start = time.perf_counter()
+    new_records = new_chunks = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        batches = _batched(records, batch_size)
+        # 先読みしたバッチをワーカーでチャンク化しながら、メインで投入する
+        pending = []
+        for _ in range(workers):
+            batch = next(batches, None)
+            if batch is None:
+                break
+            pending.append((batch, pool.submit(chunk_records, [record for _, record in batch])))
+
+        batch_no = 0
+        while pending:
+            batch, future = pending.pop(0)
+            next_batch = next(batches, None)
+            if next_batch is not None:
+                pending.append((next_batch, pool.submit(chunk_records, [record for _, record in next_batch])))
+
+            record_chunks = future.result()
+            chunks = [chunk for chunks_of_record in record_chunks for chunk in chunks_of_record]
+            metadatas = [MaintenanceAnalyzer._chunk_metadata(record)
+                         for (_, record), chunks_of_record in zip(batch, record_chunks)
+                         for _ in chunks_of_record]
+            ids = [chunk_id(chunk, metadata) for chunk, metadata in zip(chunks, metadatas)]
+            if chunks:
+                analyzer.vectorstore.add_texts(chunks, metadatas=metadatas, ids=ids)
+            analyzer.after_ingest([record for _, record in batch], chunks, metadatas, ids)
+
+            completed += len(batch)
+            total_chunks += len(chunks)
+            new_records += len(batch)
+            new_chunks += len(chunks)
+            manifest.update(source, completed, batch[-1][0], total_chunks)
+
+            batch_no += 1
+            if batch_no % log_every == 0:
+                elapsed = time.perf_counter() - start
+                print(f"  {completed} 件完了 ({new_records / elapsed:.1f} records/sec, "
+                      f"{new_chunks / elapsed:.1f} chunks/sec)")
+
+    elapsed = time.perf_counter() - start
+    return {
+        "records": new_records,
+        "chunks": new_chunks,
+        "completed": completed,
+        "seconds": elapsed,
+        "records_per_sec": new_records / elapsed if elapsed else 0.0,
+        "chunks_per_sec": new_chunks / elapsed if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="点検記録の一括取り込み")
+    parser.add_argument("path", nargs="?", default="data/inspections/log/raw",
+                        help="点検記録のログ・ディレクトリまたは JSONL ファイル"
+                             "（ログへ移行前の data/inspections/raw は record_log で移行するか、直接指定する）")
+    parser.add_argument("--backend", default=None, help="ベクトルストア (pinecone / local)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--batch-size", type=int, default=1000, help="1回の投入にまとめる記録数")
+    parser.add_argument("--manifest", default="data/cache/ingest_manifest.json")
+    args = parser.parse_args()
+
+    analyzer = MaintenanceAnalyzer(vector_backend=args.backend)
+    stats = bulk_ingest(analyzer, args.path, IngestManifest(args.manifest),
+                        workers=args.workers, batch_size=args.batch_size)
+    print(f"✅ {stats['records']} 件 / {stats['chunks']} チャンクを取り込みました "
+          f"({stats['records_per_sec']:.1f} records/sec, {stats['chunks_per_sec']:.1f} chunks/sec)")
+
+
+if __name__ == "__main__":
+    main()
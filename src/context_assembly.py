@@ -0,0 +1,189 @@
+import re
+import math
+from typing import Callable, Dict, Iterable, Optional, Set, Tuple, Union
+
+# 1ソースあたりのプロンプトに入れる文脈のトークン数の既定値
+DEFAULT_TOKEN_BUDGET = 600
+
+_WHITESPACE = re.compile(r"\s+")
+_NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+
+def estimate_tokens(text: str) -> int:
+    """トークン数の概算（日本語は1文字≒1トークン、英数字は4文字≒1トークン）
+
+    トークナイザーの語彙ファイルを読み込まずに済むよう概算で数える。
+    予算の比較に使うだけなので、モデルごとの厳密な値は要らない。
+    """
+    non_ascii = len(_NON_ASCII.findall(text))
+    return non_ascii + math.ceil((len(text) - non_ascii) / 4)
+
+
+def truncate_to_tokens(text: str, budget: int, token_counter: Callable[[str], int] = estimate_tokens) -> str:
+    """token_counter で数えて budget 以内に収まる text の先頭部分（二分探索で求める）"""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if token_counter(text[:mid]) <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo]
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _shingles(text: str, n: int = 2) -> Set[str]:
+    """文字 n-gram の集合（日本語は単語区切りがないため文字単位で比べる）"""
+    text = text.replace(" ", "")
+    if len(text) <= n:
+        return {text}
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def _jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def strip_overlap(packed: str, text: str, min_overlap: int = 20) -> str:
+    """text の先頭・末尾のうち、packed の末尾・先頭と重なる部分を取り除く
+
+    テキスト分割の chunk_overlap により、同じ記録の隣り合うチャンクは
+    前のチャンクの末尾と次のチャンクの先頭が重なる。どちらの順で選ばれても削れるよう両側を見る。
+    """
+    longest = min(len(packed), len(text))
+    for size in range(longest, min_overlap - 1, -1):
+        if packed.endswith(text[:size]):
+            text = text[size:]
+            break
+    longest = min(len(packed), len(text))
+    for size in range(longest, min_overlap - 1, -1):
+        if packed.startswith(text[-size:]):
+            text = text[:-size]
+            break
+    return text
+
+
+class ContextAssembler:
+    """検索結果をトークン予算内の文脈にまとめる
+
+    1. 空白を正規化した本文が同じもの、文字 bigram の Jaccard 類似度が
+       duplicate_threshold 以上のものを重複として除く（スコアの高い方を残す）。
+       正規化は比較にだけ使い、文脈には改行を含む元の本文を入れる
+    2. 最大限界関連性（MMR）で、検索スコアの高さと既に選んだものとの違いを両立する順に並べる
+    3. その順に、選択済みのチャンクと重なる部分を削りながら token_budget に収まる分だけ詰める。
+       先頭のチャンクだけで予算を超える場合は、予算に収まるよう切り詰めて入れる
+       （ソースの文脈が空にならないように）
+    """
+
+    def __init__(self, token_budget: Union[int, Dict[str, int]] = DEFAULT_TOKEN_BUDGET,
+                 max_chunks: int = 3, mmr_lambda: float = 0.7, duplicate_threshold: float = 0.8,
+                 min_overlap: int = 20, token_counter: Callable[[str], int] = estimate_tokens):
+        self.token_budget = token_budget
+        self.max_chunks = max_chunks
+        self.mmr_lambda = mmr_lambda
+        self.duplicate_threshold = duplicate_threshold
+        self.min_overlap = min_overlap
+        self.token_counter = token_counter
+
+    def budget_for(self, source: str) -> int:
+        if isinstance(self.token_budget, dict):
+            return self.token_budget.get(source, DEFAULT_TOKEN_BUDGET)
+        return self.token_budget
+
+    def assemble(self, results: Iterable[Tuple[object, float]], source: Optional[str] = None) -> Dict:
+        """(ドキュメント, スコア) のリスト（スコアの高い順）から文脈を組み立てる
+
+        戻り値は選んだドキュメント、プロンプトに入れるテキスト、統計
+        （raw_tokens は従来どおり上位 max_chunks 件をそのまま連結した場合のトークン数）。
+        """
+        results = list(results)
+        raw_text = "\n".join(doc.page_content for doc, _ in results[:self.max_chunks])
+        stats = {
+            "candidates": len(results),
+            "duplicates": 0,
+            "overlap_chars": 0,
+            "truncated_chars": 0,
+            "raw_tokens": self.token_counter(raw_text) if raw_text else 0,
+        }
+
+        # 1. 重複除去
+        candidates = []
+        seen = set()
+        for doc, score in results:
+            key = _normalize(doc.page_content)
+            shingles = _shingles(key)
+            if not key or key in seen or any(
+                _jaccard(shingles, kept[3]) >= self.duplicate_threshold for kept in candidates
+            ):
+                stats["duplicates"] += 1
+                continue
+            seen.add(key)
+            candidates.append((doc, float(score), doc.page_content.strip(), shingles))
+
+        # 2. MMR（関連度は候補内のスコアを 0〜1 に正規化したもの）
+        if candidates:
+            scores = [score for _, score, _, _ in candidates]
+            low, high = min(scores), max(scores)
+            relevance = [(score - low) / (high - low) if high > low else 1.0 for score in scores]
+        remaining = list(range(len(candidates)))
+        redundancy = [0.0] * len(candidates)
+        order = []
+        while remaining:
+            best = max(remaining, key=lambda i: self.mmr_lambda * relevance[i]
+                       - (1 - self.mmr_lambda) * redundancy[i])
+            remaining.remove(best)
+            order.append(best)
+            for i in remaining:
+                redundancy[i] = max(redundancy[i], _jaccard(candidates[i][3], candidates[best][3]))
+
+        # 3. 重なりを削りながら予算内に詰める
+        budget = self.budget_for(source)
+        documents, texts = [], []
+        tokens = 0
+        for i in order:
+            if len(documents) >= self.max_chunks:
+                break
+            doc, _, text, _ = candidates[i]
+            trimmed = text
+            for packed in texts:
+                if trimmed in packed:
+                    trimmed = ""
+                    break
+                trimmed = strip_overlap(packed, trimmed, self.min_overlap)
+            if not trimmed.strip():
+                stats["duplicates"] += 1
+                continue
+            cost = self.token_counter(trimmed)
+            if tokens + cost > budget:
+                if documents:
+                    continue
+                truncated = truncate_to_tokens(trimmed, budget, self.token_counter)
+                if not truncated:
+                    continue
+                stats["truncated_chars"] += len(trimmed) - len(truncated)
+                trimmed, cost = truncated, self.token_counter(truncated)
+            stats["overlap_chars"] += len(text) - len(trimmed)
+            documents.append(doc)
+            texts.append(trimmed)
+            tokens += cost
+
+        stats.update({"selected": len(documents), "tokens": tokens})
+        return {"documents": documents, "text": "\n".join(texts), "stats": stats}
+
+
+def parse_token_budget(value: Optional[str]) -> Union[int, Dict[str, int]]:
+    """環境変数の予算指定（"600" または "inspection=400,failure=600,knowledge=800"）を読む"""
+    if not value:
+        return DEFAULT_TOKEN_BUDGET
+    if "=" not in value:
+        return int(value)
+    budget: Dict[str, int] = {}
+    for item in value.split(","):
+        source, _, tokens = item.partition("=")
+        budget[source.strip()] = int(tokens)
+    return budget
@@ -0,0 +1,189 @@
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from metrics import CACHE_REQUESTS
+
+
+def embedding_key(text: str, model: str) -> str:
+    """テキストとモデル名から内容アドレスのキーを作る"""
+    return hashlib.sha256(f"{model}\0{text}".encode('utf-8')).hexdigest()
+
+
+def chunk_id(text: str, metadata: Optional[Dict] = None) -> str:
+    """チャンクの内容と記録の識別情報から決まるID（再投入時のアップサートを冪等にする）
+
+    metadata（機械ID・点検日時と絞り込み用の項目）もハッシュに含めるため、本文が同じでも
+    別の記録のチャンクは別のIDになる。
+    """
+    if metadata:
+        text = json.dumps(metadata, sort_keys=True, ensure_ascii=False) + "\0" + text
+    return embedding_key(text, "chunk")
+
+
+class EmbeddingCache:
+    """SQLite に保存する埋め込みキャッシュ（件数上限付きの LRU）"""
+
+    _QUERY_BATCH = 500
+
+    def __init__(self, path: str = "data/cache/embeddings.sqlite", max_entries: int = 200_000):
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used INTEGER NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings(last_used)")
+        self._clock = self._conn.execute("SELECT COALESCE(MAX(last_used), 0) FROM embeddings").fetchone()[0]
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """キャッシュ済みの埋め込みを返し、参照時刻を更新する"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), self._QUERY_BATCH):
+                batch = keys[i:i + self._QUERY_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+            if found:
+                self._clock += 1
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(self._clock, key) for key in found]
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        CACHE_REQUESTS.inc(len(found), cache="embedding", result="hit")
+        CACHE_REQUESTS.inc(len(keys) - len(found), cache="embedding", result="miss")
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """埋め込みを保存し、上限を超えた分を古い順に削除する"""
+        if not items:
+            return
+        with self._lock:
+            self._clock += 1
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), self._clock)
+                 for key, vector in items.items()]
+            )
+            self._size += self._conn.total_changes - before
+            overflow = self._size - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM embeddings WHERE key IN ("
+                    " SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                    (overflow,)
+                )
+                self._size -= overflow
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """埋め込みキャッシュを挟んだ Embeddings ラッパー
+
+    未キャッシュのテキストだけを重複排除してまとめ、batch_size 件ごとに
+    下位の埋め込みモデルへ一括で問い合わせる。langchain のベクトルストア（Pinecone など）は
+    Embeddings のインスタンスでない埋め込みを関数として呼び出すため、Embeddings を継承する。
+    """
+
+    def __init__(self, embeddings, cache: EmbeddingCache, model: Optional[str] = None,
+                 batch_size: int = 1000):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model or getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.batch_size = batch_size
+        self.api_calls = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [embedding_key(text, self.model) for text in texts]
+        vectors = self.cache.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing[key] = text
+        missing_keys = list(missing)
+        for i in range(0, len(missing_keys), self.batch_size):
+            batch_keys = missing_keys[i:i + self.batch_size]
+            embedded = self.embeddings.embed_documents([missing[key] for key in batch_keys])
+            self.api_calls += 1
+            # キャッシュから返る値と一致させるため float32 に揃える
+            new_vectors = {key: np.asarray(vector, dtype=np.float32).tolist()
+                           for key, vector in zip(batch_keys, embedded)}
+            self.cache.put_many(new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = embedding_key(text, self.model)
+        cached = self.cache.get_many([key])
+        if key in cached:
+            return cached[key]
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32).tolist()
+        self.api_calls += 1
+        self.cache.put_many({key: vector})
+        return vector
+
+
+class ChunkBatcher:
+    """複数レコードのチャンクをまとめてベクトルストアへ追加するバッチャー"""
+
+    def __init__(self, vectorstore, batch_size: int = 1000):
+        self.vectorstore = vectorstore
+        self.batch_size = batch_size
+        self._texts: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._ids: List[str] = []
+        self.flushed_chunks = 0
+
+    def add(self, texts: List[str], metadatas: Optional[List[Dict]] = None,
+            ids: Optional[List[str]] = None):
+        metadatas = metadatas or [{} for _ in texts]
+        self._texts.extend(texts)
+        self._metadatas.extend(metadatas)
+        self._ids.extend(ids or [chunk_id(text, metadata) for text, metadata in zip(texts, metadatas)])
+        if len(self._texts) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self._texts:
+            return
+        self.vectorstore.add_texts(self._texts, metadatas=self._metadatas, ids=self._ids)
+        self.flushed_chunks += len(self._texts)
+        self._texts, self._metadatas, self._ids = [], [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
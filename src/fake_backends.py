@@ -0,0 +1,43 @@
+import time
+import hashlib
+from typing import Any, List
+
+import numpy as np
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_core.embeddings import Embeddings
+
+
+class HashEmbeddings(Embeddings):
+    """テキストのハッシュから決定的なベクトルを作る埋め込み（テスト・ベンチマーク用）"""
+
+    def __init__(self, dimension: int = 32):
+        self.dimension = dimension
+
+    def _embed(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+        return np.random.default_rng(seed).standard_normal(self.dimension).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+class FakeLatencyChatModel(FakeListChatModel):
+    """一定の遅延で固定の回答を返すチャットモデル（テスト・ベンチマーク用）
+
+    一括生成は latency 秒待ってから回答を返し、ストリーミングは生成全体で
+    latency 秒かかるように1文字ずつ返す。
+    """
+    latency: float = 0.05
+
+    def _call(self, *args: Any, **kwargs: Any) -> str:
+        time.sleep(self.latency)
+        return super()._call(*args, **kwargs)
+
+    def _stream(self, *args: Any, **kwargs: Any):
+        response = self.responses[self.i]
+        for chunk in super()._stream(*args, **kwargs):
+            time.sleep(self.latency / max(len(response), 1))
+            yield chunk
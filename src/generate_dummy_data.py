@@ -1,134 +1,366 @@
 import json
-import random
+import argparse
 from datetime import datetime, timedelta
 import os
+from typing import Dict, Iterator, List, Optional
 
-def generate_dummy_inspection_data(num_records: int = 10) -> list:
-    """キントーンからの点検記録のダミーデータを生成"""
-    
-    # 機械IDのリスト
-    machine_ids = [f"M{i:03d}" for i in range(1, 21)]
-    
-    # 点検タイプのリスト
-    inspection_types = [
-        "定期点検",
-        "緊急点検",
-        "予防保全",
-        "故障対応",
-        "定期メンテナンス"
+import numpy as np
+
+# 機械の故障モード: 劣化とともに悪化する測定項目と、劣化1.0あたりの変化量
+FAILURE_MODES = {
+    "振動異常": {
+        "findings": "モーターの異常振動を検知",
+        "recommendations": "ベアリングの状態確認が必要",
+        "component": "ベアリング",
+        "drift": {"vibration": 2.5, "noise_level": 10.0},
+    },
+    "温度上昇": {
+        "findings": "モーターの温度が上昇傾向",
+        "recommendations": "冷却システムの点検が必要",
+        "component": "冷却システム",
+        "drift": {"temperature": 30.0, "current": 25.0},
+    },
+    "異音発生": {
+        "findings": "運転中に異常な音が発生",
+        "recommendations": "ギアボックスの点検が必要",
+        "component": "ギアボックス",
+        "drift": {"noise_level": 20.0, "vibration": 1.2},
+    },
+    "油圧低下": {
+        "findings": "油圧が低下傾向",
+        "recommendations": "油圧システムの点検が必要",
+        "component": "油圧システム",
+        "drift": {"oil_pressure": -1.5},
+    },
+}
+
+# 測定項目: (正常時の平均, 機械間のばらつき, 測定ごとのばらつき, 小数桁, 単位)
+MEASUREMENTS = {
+    "vibration": (1.0, 0.2, 0.1, 1, "mm/s"),
+    "temperature": (55.0, 3.0, 1.5, 1, "°C"),
+    "current": (85.0, 4.0, 2.0, 1, "A"),
+    "noise_level": (70.0, 3.0, 1.5, 1, "dB"),
+    "oil_pressure": (3.5, 0.1, 0.05, 2, "MPa"),
+}
+
+INSPECTION_TYPES = ["定期点検", "予防保全", "定期メンテナンス"]
+
+
+class SyntheticFleet:
+    """機械ごとの劣化傾向と故障イベントを持つ点検記録の生成器（NumPy でバッチ単位に生成）
+
+    記録 i は機械 i % num_machines の (i // num_machines) 回目の点検になる。
+    各機械は故障モードを1つ持ち、保全周期ごとに onset 以降で劣化が 0 から 1 へ進み、
+    周期の最後に故障（故障対応の点検）が起きて修理で劣化が戻る。
+    これに加えて fault_rate の確率で突発故障を起こす。
+    同じ seed・batch_size なら同じ記録を生成する。
+    """
+
+    def __init__(self, num_machines: int = 20, seed: Optional[int] = 0,
+                 start: Optional[datetime] = None, interval: timedelta = timedelta(hours=12),
+                 fault_rate: float = 0.002):
+        self.num_machines = num_machines
+        self.seed = seed
+        self.start = start or datetime(2024, 1, 1)
+        self.interval = interval
+        self.fault_rate = fault_rate
+
+        rng = np.random.default_rng(seed)
+        self.machine_ids = np.array([f"M{i:03d}" for i in range(1, num_machines + 1)])
+        mode_names = list(FAILURE_MODES)
+        self.modes = rng.integers(0, len(mode_names), num_machines)
+        self.mode_names = mode_names
+        # 保全周期（点検回数）と、周期内で劣化が始まる位置
+        self.cycle = rng.integers(60, 240, num_machines)
+        self.onset = (self.cycle * rng.uniform(0.3, 0.7, num_machines)).astype(np.int64)
+        # 機械ごとに周期のどこから始まるかをずらす
+        self.phase = rng.integers(0, self.cycle)
+        self.baseline = {name: rng.normal(mean, spread, num_machines)
+                         for name, (mean, spread, _, _, _) in MEASUREMENTS.items()}
+        self.locations = np.array([f"工場{'ABC'[i % 3]}-{i % 5 + 1}階" for i in range(num_machines)])
+
+    def columns(self, first: int, count: int) -> Dict[str, np.ndarray]:
+        """記録 first から count 件分の列（機械・時刻・劣化度・故障・測定値）を生成する"""
+        rng = np.random.default_rng(None if self.seed is None else [self.seed, first])
+        index = np.arange(first, first + count)
+        machine = index % self.num_machines
+        step = index // self.num_machines
+
+        position = (step + self.phase[machine]) % self.cycle[machine]
+        onset = self.onset[machine]
+        span = np.maximum(self.cycle[machine] - 1 - onset, 1)
+        degradation = np.clip((position - onset) / span, 0.0, 1.0)
+        wear_fault = position == self.cycle[machine] - 1
+        sudden_fault = rng.random(count) < self.fault_rate
+        fault = wear_fault | sudden_fault
+        # 突発故障は劣化が進んでいなくても強く表れる
+        severity = np.where(sudden_fault & ~wear_fault, 1.0, degradation)
+
+        # 同じ機械の点検日時が重ならないよう、ずれは点検間隔の半分未満にする
+        interval = self.interval.total_seconds()
+        offset = step * interval + machine * (interval / (2 * self.num_machines)) \
+            + rng.uniform(0, interval / (2 * self.num_machines), count)
+
+        columns = {
+            "machine": machine,
+            "offset": offset,
+            "degradation": degradation,
+            "fault": fault,
+            "sudden_fault": sudden_fault,
+        }
+        modes = self.modes[machine]
+        for name, (_, _, noise, _, _) in MEASUREMENTS.items():
+            values = self.baseline[name][machine] + rng.normal(0.0, noise, count)
+            for mode_no, mode_name in enumerate(self.mode_names):
+                drift = FAILURE_MODES[mode_name]["drift"].get(name)
+                if drift:
+                    values = values + np.where(modes == mode_no, drift * severity, 0.0)
+            columns[name] = values
+        columns["inspection_type"] = rng.integers(0, len(INSPECTION_TYPES), count)
+        columns["inspector"] = rng.integers(1, 6, count)
+        return columns
+
+    def iter_batches(self, num_records: int, batch_size: int = 100_000) -> Iterator[List[Dict]]:
+        """点検記録を batch_size 件ずつのリストで返す"""
+        for first in range(0, num_records, batch_size):
+            yield self._records(self.columns(first, min(batch_size, num_records - first)))
+
+    def iter_records(self, num_records: int, batch_size: int = 100_000) -> Iterator[Dict]:
+        for batch in self.iter_batches(num_records, batch_size):
+            yield from batch
+
+    def _records(self, columns: Dict[str, np.ndarray]) -> List[Dict]:
+        # 文字列化は列単位でまとめて行い、記録ごとのループでは組み立てだけをする
+        formatted = {
+            name: [f"{value:.{digits}f}{unit}" for value in columns[name].tolist()]
+            for name, (_, _, _, digits, unit) in MEASUREMENTS.items()
+        }
+        dates = np.datetime_as_string(
+            np.datetime64(self.start, "s") + columns["offset"].astype("timedelta64[s]"), unit="s"
+        )
+        dates = np.char.replace(dates, "T", " ").tolist()
+        machines = columns["machine"]
+        machine_ids = self.machine_ids[machines].tolist()
+        locations = self.locations[machines].tolist()
+        mode_names = [self.mode_names[mode] for mode in self.modes[machines].tolist()]
+        degradations = np.round(columns["degradation"], 3).tolist()
+        faults = columns["fault"].tolist()
+        sudden_faults = columns["sudden_fault"].tolist()
+        types = [INSPECTION_TYPES[t] for t in columns["inspection_type"].tolist()]
+        inspectors = columns["inspector"].tolist()
+
+        records = []
+        for i, mode_name in enumerate(mode_names):
+            mode = FAILURE_MODES[mode_name]
+            if faults[i]:
+                inspection_type, findings = "故障対応", f"{mode['findings']}（故障発生）"
+                recommendations, status = f"{mode['component']}の交換・修理", "要対応"
+            elif degradations[i] >= 0.5:
+                inspection_type = types[i]
+                findings, recommendations, status = mode["findings"], mode["recommendations"], "要対応"
+            else:
+                inspection_type = types[i]
+                findings, recommendations, status = "異常なし", "通常運転継続", "完了"
+            records.append({
+                "inspection_date": dates[i],
+                "machine_id": machine_ids[i],
+                "inspection_type": inspection_type,
+                "findings": findings,
+                "recommendations": recommendations,
+                "measurements": {name: values[i] for name, values in formatted.items()},
+                "inspector": f"点検員{inspectors[i]}",
+                "location": locations[i],
+                "status": status,
+                # 精度評価用の正解ラベル
+                "ground_truth": {
+                    "failure_mode": mode_name,
+                    "degradation": degradations[i],
+                    "fault_event": faults[i],
+                    "sudden_fault": sudden_faults[i],
+                },
+            })
+        return records
+
+
+def fault_export(record: Dict, session_id: int, message_id: int = 1) -> Dict:
+    """故障対応の点検記録から、fault_001.json と同じ形式の会話エクスポートを作る"""
+    truth = record["ground_truth"]
+    mode = FAILURE_MODES[truth["failure_mode"]]
+    occurred = datetime.strptime(record["inspection_date"], "%Y-%m-%d %H:%M:%S")
+
+    def iso(seconds: float) -> str:
+        return (occurred + timedelta(seconds=seconds)).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+    messages = [
+        ("user", f"{record['machine_id']}で{mode['findings']}"),
+        ("assistant", f"【応急復旧】\n1. 機械を安全に停止させる\n2. {mode['component']}の状態を確認する"),
+        ("user", f"測定値は {json.dumps(record['measurements'], ensure_ascii=False)} です。対応手順を教えてください。"),
+        ("assistant", f"**{truth['failure_mode']} - 推奨対応**\n\n{mode['recommendations']}。\n"
+                      f"{record['recommendations']}を実施してください。\n\n"),
     ]
-    
-    # 異常パターンのリスト
-    failure_patterns = [
-        {
-            "type": "振動異常",
-            "findings": "モーターの異常振動を検知",
-            "recommendations": "ベアリングの状態確認が必要",
-            "measurements": {
-                "vibration": f"{random.uniform(1.5, 4.0):.1f}mm/s",
-                "temperature": f"{random.uniform(65, 85):.1f}°C",
-                "noise_level": f"{random.uniform(75, 95):.1f}dB"
-            }
-        },
-        {
-            "type": "温度上昇",
-            "findings": "モーターの温度が上昇傾向",
-            "recommendations": "冷却システムの点検が必要",
-            "measurements": {
-                "temperature": f"{random.uniform(75, 95):.1f}°C",
-                "current": f"{random.uniform(80, 120):.1f}A",
-                "power_factor": f"{random.uniform(0.7, 0.9):.2f}"
-            }
+    return {
+        "session_id": session_id,
+        "timestamp": iso(150),
+        "user_id": 1,
+        "device_context": {
+            "detected_models": [record["machine_id"]],
+            "environment": f"{record['location']}の{record['machine_id']}で{mode['findings']}。技術支援が必要です。",
+            "last_export": iso(148),
         },
-        {
-            "type": "異音発生",
-            "findings": "運転中に異常な音が発生",
-            "recommendations": "ギアボックスの点検が必要",
-            "measurements": {
-                "noise_level": f"{random.uniform(80, 100):.1f}dB",
-                "vibration": f"{random.uniform(1.0, 3.0):.1f}mm/s",
-                "oil_temperature": f"{random.uniform(60, 80):.1f}°C"
+        "conversation_history": [
+            {
+                "id": message_id + i,
+                "timestamp": iso(30 * i),
+                "role": role,
+                "content": content,
+                "media": [],
+                "base64_images": {},
             }
+            for i, (role, content) in enumerate(messages)
+        ],
+        "diagnostics": {
+            "components": [mode["component"]],
+            "symptoms": [mode["findings"]],
+            "possible_models": [record["machine_id"]],
+            "primary_problem": truth["failure_mode"],
+            "problem_description": f"{record['machine_id']}（{record['location']}）で{mode['findings']}。",
         },
-        {
-            "type": "油圧低下",
-            "findings": "油圧が低下傾向",
-            "recommendations": "油圧システムの点検が必要",
-            "measurements": {
-                "oil_pressure": f"{random.uniform(2.0, 4.0):.1f}MPa",
-                "oil_temperature": f"{random.uniform(50, 70):.1f}°C",
-                "flow_rate": f"{random.uniform(10, 20):.1f}L/min"
-            }
+        "metadata": {
+            "message_count": len(messages),
+            "has_images": False,
+            "extracted_timestamp": iso(150),
+            "version": "1.0.0",
         },
-        {
-            "type": "正常",
-            "findings": "異常なし",
-            "recommendations": "通常運転継続",
-            "measurements": {
-                "vibration": f"{random.uniform(0.5, 1.5):.1f}mm/s",
-                "temperature": f"{random.uniform(45, 65):.1f}°C",
-                "noise_level": f"{random.uniform(60, 80):.1f}dB"
-            }
-        }
-    ]
-    
-    # 点検記録の生成
-    records = []
-    base_date = datetime.now() - timedelta(days=30)
-    
-    for _ in range(num_records):
-        # 日時の生成（過去30日以内）
-        inspection_date = base_date + timedelta(
-            days=random.randint(0, 30),
-            hours=random.randint(0, 23),
-            minutes=random.randint(0, 59)
-        )
-        
-        # 異常パターンの選択
-        pattern = random.choice(failure_patterns)
-        
-        # 記録の生成
-        record = {
-            "inspection_date": inspection_date.strftime("%Y-%m-%d %H:%M:%S"),
-            "machine_id": random.choice(machine_ids),
-            "inspection_type": random.choice(inspection_types),
-            "findings": pattern["findings"],
-            "recommendations": pattern["recommendations"],
-            "measurements": pattern["measurements"],
-            "inspector": f"点検員{random.randint(1, 5)}",
-            "location": f"工場{random.choice(['A', 'B', 'C'])}-{random.randint(1, 5)}階",
-            "status": "完了" if pattern["type"] == "正常" else "要対応"
-        }
-        
-        records.append(record)
-    
-    return records
+    }
+
+
+def write_jsonl(batches: Iterator[List[Dict]], output_path: str) -> int:
+    """記録を JSONL に1行ずつ書き出す（メモリに保持するのは1バッチ分だけ）"""
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    encode = json.JSONEncoder(ensure_ascii=False).encode
+    count = 0
+    with open(output_path, 'w', encoding='utf-8') as f:
+        for batch in batches:
+            f.write("".join(encode(record) + "\n" for record in batch))
+            count += len(batch)
+    return count
+
+
+def write_parquet(batches: Iterator[List[Dict]], output_path: str) -> int:
+    """記録を Parquet に書き出す（測定値・正解ラベルは列に展開する。pyarrow が必要）"""
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    writer = None
+    count = 0
+    try:
+        for batch in batches:
+            table = pa.Table.from_pandas(pd.json_normalize(batch, sep="."), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(output_path, table.schema)
+            writer.write_table(table)
+            count += len(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def write_fault_exports(records: Iterator[Dict], output_dir: str, max_exports: Optional[int] = None) -> int:
+    """故障イベントの記録ごとに fault_NNN.json を書き出す"""
+    os.makedirs(output_dir, exist_ok=True)
+    count = 0
+    for record in records:
+        if not record["ground_truth"]["fault_event"]:
+            continue
+        if max_exports is not None and count >= max_exports:
+            break
+        count += 1
+        with open(os.path.join(output_dir, f"fault_{count:03d}.json"), 'w', encoding='utf-8') as f:
+            json.dump(fault_export(record, session_id=count, message_id=count * 4), f,
+                      ensure_ascii=False, indent=2)
+    return count
+
+
+def generate_dummy_inspection_data(num_records: int = 10, seed: Optional[int] = None,
+                                   num_machines: int = 20) -> list:
+    """キントーンからの点検記録のダミーデータを生成（直近30日に収まるよう点検間隔を調整）"""
+    fleet = SyntheticFleet(
+        num_machines=num_machines,
+        seed=seed,
+        start=datetime.now() - timedelta(days=30),
+        interval=timedelta(days=30) / max(1, -(-num_records // num_machines)),
+    )
+    return list(fleet.iter_records(num_records))
+
 
 def save_dummy_data(records: list, output_dir: str = "data/inspections/raw"):
-    """ダミーデータをJSONファイルとして保存"""
-    
+    """ダミーデータをJSONファイルとして保存（同じ秒の記録はファイル名に連番を付けて区別する）"""
+
     # 出力ディレクトリの作成
     os.makedirs(output_dir, exist_ok=True)
-    
+
     # 各記録を個別のファイルとして保存
-    for i, record in enumerate(records):
+    used = set()
+    for record in records:
         timestamp = datetime.strptime(record["inspection_date"], "%Y-%m-%d %H:%M:%S")
-        filename = f"{timestamp.strftime('%Y%m%d_%H%M%S')}_inspection.json"
-        filepath = os.path.join(output_dir, filename)
-        
+        stem = f"{timestamp.strftime('%Y%m%d_%H%M%S')}_inspection"
+        suffix = 1
+        name = stem
+        while name in used or os.path.exists(os.path.join(output_dir, f"{name}.json")):
+            suffix += 1
+            name = f"{stem}_{suffix}"
+        used.add(name)
+        filepath = os.path.join(output_dir, f"{name}.json")
+
         with open(filepath, 'w', encoding='utf-8') as f:
             json.dump(record, f, ensure_ascii=False, indent=2)
-        
+
         print(f"保存完了: {filepath}")
 
 def main():
-    # ダミーデータの生成（20件）
-    records = generate_dummy_inspection_data(20)
-    
-    # データの保存
-    save_dummy_data(records)
-    
-    print(f"\n合計{len(records)}件のダミーデータを生成しました。")
+    parser = argparse.ArgumentParser(description="点検記録のダミーデータ（劣化傾向・故障イベント付き）を生成")
+    parser.add_argument("--records", type=int, default=20)
+    parser.add_argument("--machines", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=None, help="指定すると毎回同じデータを生成する")
+    parser.add_argument("--format", choices=["files", "jsonl", "parquet"], default="files",
+                        help="files: 1記録1ファイル（従来形式）, jsonl/parquet: 1ファイルにストリーム出力")
+    parser.add_argument("--output", default=None,
+                        help="出力先（files: ディレクトリ, jsonl/parquet: ファイル）")
+    parser.add_argument("--faults-dir", default=None, help="故障イベントの会話エクスポートの出力先")
+    parser.add_argument("--max-faults", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=100_000)
+    args = parser.parse_args()
+
+    # seed 未指定でも、記録と故障エクスポートは同じデータ（同じ台数・seed）から作る
+    seed = args.seed if args.seed is not None else int(np.random.default_rng().integers(2 ** 31))
+    fleet = SyntheticFleet(num_machines=args.machines, seed=seed)
+
+    if args.format == "files":
+        # ダミーデータの生成（既定20件）
+        records = generate_dummy_inspection_data(args.records, seed=seed, num_machines=args.machines)
+
+        # データの保存
+        save_dummy_data(records, args.output or "data/inspections/raw")
+        count = len(records)
+    else:
+        output = args.output or f"data/synthetic/inspections.{args.format}"
+        writer = write_jsonl if args.format == "jsonl" else write_parquet
+        try:
+            count = writer(fleet.iter_batches(args.records, args.batch_size), output)
+        except ImportError as e:
+            print(f"❌ Parquet 出力には pyarrow が必要です（pip install pyarrow）: {e}")
+            return
+        print(f"保存完了: {output}")
+
+    if args.faults_dir:
+        source = records if args.format == "files" else fleet.iter_records(args.records, args.batch_size)
+        exported = write_fault_exports(source, args.faults_dir, args.max_faults)
+        print(f"故障エクスポート: {exported}件 → {args.faults_dir}")
+
+    print(f"\n合計{count}件のダミーデータを生成しました。")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
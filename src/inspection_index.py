@@ -0,0 +1,166 @@
+import os
+import json
+import threading
+from bisect import bisect_left, insort
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from measurement_store import parse_inspection_date
+from record_log import RecordLog
+
+
+class InspectionIndex:
+    """点検記録のインメモリ索引
+
+    machine_id / location / status / inspection_type のハッシュ索引と、
+    点検日時でソートした配列（bisect で範囲検索）を持ち、全件走査せずに絞り込む。
+    記録は add() で1件ずつ追加でき、refresh() で記録ログ・ディレクトリの新しい記録を取り込む。
+    点検日時を解釈できない記録は、日時の条件がない検索の結果の末尾（追加の新しい順）に含める。
+    """
+
+    HASH_FIELDS = ("machine_id", "location", "status", "inspection_type")
+
+    def __init__(self, log: Optional[RecordLog] = None, raw_dir: Optional[str] = None):
+        self.log = log
+        self.raw_dir = raw_dir
+        self._lock = threading.RLock()
+        self._records: Dict[str, Dict] = {}
+        self._timestamps: Dict[str, int] = {}
+        self._hash: Dict[str, Dict[str, Set[str]]] = {field: {} for field in self.HASH_FIELDS}
+        # 点検日時の昇順に並んだ (UNIX 秒, 記録ID)
+        self._dates: List[Tuple[int, str]] = []
+        # 点検日時のない記録 -> 追加順の番号
+        self._undated: Dict[str, int] = {}
+        self._added = 0
+        self._raw_dir_mtime: Optional[int] = None
+        self._log_loaded = False
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def add(self, record_id: str, record: Dict):
+        """記録を索引に追加する（同じIDは置き換える）"""
+        self.add_many([(record_id, record)])
+
+    def add_many(self, records: Iterable[Tuple[str, Dict]]):
+        """複数の記録をまとめて追加する（日時配列の並べ替えは最後に1回だけ行う）"""
+        with self._lock:
+            appended = 0
+            for record_id, record in records:
+                if record_id in self._records:
+                    self._remove(record_id)
+                self._records[record_id] = record
+                for field in self.HASH_FIELDS:
+                    value = record.get(field)
+                    if value is not None:
+                        self._hash[field].setdefault(str(value), set()).add(record_id)
+                timestamp = parse_inspection_date(record.get('inspection_date'))
+                if timestamp is not None:
+                    self._timestamps[record_id] = timestamp
+                    self._dates.append((timestamp, record_id))
+                    appended += 1
+                else:
+                    self._undated[record_id] = self._added
+                self._added += 1
+            if appended == 1 and len(self._dates) > 1 and self._dates[-1] < self._dates[-2]:
+                insort(self._dates, self._dates.pop())
+            elif appended > 1:
+                self._dates.sort()
+
+    def _remove(self, record_id: str):
+        record = self._records.pop(record_id)
+        for field in self.HASH_FIELDS:
+            value = record.get(field)
+            if value is not None:
+                self._hash[field].get(str(value), set()).discard(record_id)
+        self._undated.pop(record_id, None)
+        timestamp = self._timestamps.pop(record_id, None)
+        if timestamp is not None:
+            position = bisect_left(self._dates, (timestamp, record_id))
+            del self._dates[position]
+
+    def refresh(self) -> int:
+        """記録ログとディレクトリから未索引の記録を取り込み、追加件数を返す"""
+        with self._lock:
+            new_records = []
+            if self.log is not None:
+                new_ids = self.log.refresh()
+                if not self._log_loaded:
+                    # 初回はログの全件を対象にする
+                    new_ids = self.log.ids()
+                    self._log_loaded = True
+                for record_id in new_ids:
+                    if record_id not in self._records:
+                        new_records.append((record_id, self.log.get(record_id)))
+            if self.raw_dir and os.path.isdir(self.raw_dir):
+                mtime = os.stat(self.raw_dir).st_mtime_ns
+                if mtime != self._raw_dir_mtime:
+                    for filename in os.listdir(self.raw_dir):
+                        record_id = filename[:-len('.json')]
+                        if filename.endswith('.json') and record_id not in self._records:
+                            with open(os.path.join(self.raw_dir, filename), 'r', encoding='utf-8') as f:
+                                new_records.append((record_id, json.load(f)))
+                    self._raw_dir_mtime = mtime
+            self.add_many(new_records)
+        return len(new_records)
+
+    def _date_range(self, start: Optional[datetime], end: Optional[datetime]) -> Tuple[int, int]:
+        lo = 0 if start is None else bisect_left(self._dates, (int(start.timestamp()), ""))
+        hi = len(self._dates) if end is None else bisect_left(self._dates, (int(end.timestamp()), ""))
+        return lo, hi
+
+    def query(self, machine_id: Optional[str] = None, location: Optional[str] = None,
+              status: Optional[str] = None, inspection_type: Optional[str] = None,
+              start: Optional[datetime] = None, end: Optional[datetime] = None,
+              limit: Optional[int] = None) -> List[Tuple[str, Dict]]:
+        """条件に一致する記録を点検日時の新しい順に返す（start 以上 end 未満）"""
+        conditions = {"machine_id": machine_id, "location": location,
+                      "status": status, "inspection_type": inspection_type}
+        with self._lock:
+            postings = [self._hash[field].get(str(value), set())
+                        for field, value in conditions.items() if value is not None]
+            postings.sort(key=len)
+            lo, hi = self._date_range(start, end)
+            has_date = start is not None or end is not None
+
+            if not postings:
+                # 日時だけの条件: ソート済み配列の範囲をそのまま使う
+                ids = [record_id for _, record_id in reversed(self._dates[lo:hi])]
+                if not has_date:
+                    ids += reversed(self._undated)
+            elif has_date and hi - lo < len(postings[0]):
+                # 日時範囲の方が狭い場合は範囲を走査して残りの条件で絞る
+                ids = [record_id for _, record_id in reversed(self._dates[lo:hi])
+                       if all(record_id in posting for posting in postings)]
+            else:
+                candidates = set(postings[0]).intersection(*postings[1:])
+                if has_date:
+                    candidates = {record_id for record_id in candidates
+                                  if record_id in self._timestamps
+                                  and self._in_range(self._timestamps[record_id], start, end)}
+                ids = sorted((record_id for record_id in candidates if record_id in self._timestamps),
+                             key=self._timestamps.__getitem__, reverse=True)
+                ids += sorted((record_id for record_id in candidates if record_id in self._undated),
+                              key=self._undated.__getitem__, reverse=True)
+
+            if limit is not None:
+                ids = ids[:limit]
+            return [(record_id, self._records[record_id]) for record_id in ids]
+
+    @staticmethod
+    def _in_range(timestamp: int, start: Optional[datetime], end: Optional[datetime]) -> bool:
+        if start is not None and timestamp < int(start.timestamp()):
+            return False
+        if end is not None and timestamp >= int(end.timestamp()):
+            return False
+        return True
+
+    def values(self, field: str) -> List[str]:
+        """ハッシュ索引に登録されている値の一覧"""
+        return sorted(value for value, ids in self._hash[field].items() if ids)
+
+    @classmethod
+    def build(cls, records: Iterable[Tuple[str, Dict]]) -> "InspectionIndex":
+        index = cls()
+        index.add_many(records)
+        return index
@@ -0,0 +1,213 @@
+import os
+import re
+import json
+import math
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from vector_store import Document, is_range_condition, matches_range
+
+# 単語の区切りとみなす空白・句読点（"工場B-5階" の "-" は語の一部として残す）
+_SEPARATORS = re.compile(r"[\s、。，,．.:：;；()（）\[\]「」『』【】→/・]+")
+
+# 機械ID（M123）と設置場所（B-5階）。日本語に続く場合も拾えるよう英数字以外を境界とする
+_IDENTIFIER_PATTERN = re.compile(r"(?<![A-Za-z0-9])(?:M\d+|[A-Za-z]-\d+階?)(?![A-Za-z0-9])")
+
+# 逆順位融合（RRF）の定数。上位の順位差をなだらかにする
+RRF_K = 60
+
+
+def ngram_terms(text: str, sizes: Tuple[int, ...] = (2, 3)) -> List[str]:
+    """文字 n-gram の語（形態素解析なしで日本語を検索できるよう、語の区切りごとに文字単位で切る）"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    terms = []
+    for word in _SEPARATORS.split(text):
+        if not word:
+            continue
+        if len(word) < min(sizes):
+            terms.append(word)
+            continue
+        for size in sizes:
+            terms.extend(word[i:i + size] for i in range(len(word) - size + 1))
+    return terms
+
+
+def is_identifier_query(query: str, max_remainder: int = 6) -> bool:
+    """機械IDや設置場所を引くだけの問い合わせか
+
+    "モーターM123" や "工場B-5階" のように、識別子を除くと数文字しか残らないものは
+    語の一致だけで十分なため、埋め込みを使わずに検索できる。
+    """
+    if not _IDENTIFIER_PATTERN.search(query):
+        return False
+    remainder = _SEPARATORS.sub("", _IDENTIFIER_PATTERN.sub("", query))
+    return len(remainder) <= max_remainder
+
+
+def reciprocal_rank_fusion(*rankings: List[Tuple[Document, float]], k: int = RRF_K,
+                           limit: Optional[int] = None) -> List[Tuple[Document, float]]:
+    """複数の検索結果を順位だけで統合する（スコアの尺度が異なる BM25 とコサイン類似度を混ぜられる）
+
+    同じ本文のドキュメントは同一とみなす（チャンクIDは本文から決まるため）。
+    """
+    fused: Dict[str, List] = {}
+    for ranking in rankings:
+        for rank, (doc, _) in enumerate(ranking):
+            entry = fused.setdefault(doc.page_content, [doc, 0.0])
+            entry[1] += 1.0 / (k + rank + 1)
+    results = sorted(((doc, score) for doc, score in fused.values()), key=lambda item: -item[1])
+    return results[:limit] if limit is not None else results
+
+
+class NgramBM25Index:
+    """文字 bigram・trigram の転置インデックスによる BM25 検索
+
+    チャンクは追加した分だけ索引に反映され、全体の再構築は要らない。
+    persist_directory を指定すると documents.jsonl に追記し、起動時にそこから索引を作り直す。
+    メタデータのフィルタ（完全一致・$eq・$in・数値の範囲）は LocalVectorStore と同じ書式で指定できる。
+    """
+
+    DOCUMENTS_FILE = "documents.jsonl"
+
+    def __init__(self, persist_directory: Optional[str] = None, k1: float = 1.2, b: float = 0.75):
+        self.persist_directory = persist_directory
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._ids: Dict[str, int] = {}
+        self._texts: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._lengths: List[int] = []
+        self._norm: Optional[np.ndarray] = None
+        self._total_length = 0
+        # 語 -> (行番号のリスト, 出現回数のリスト)。検索時に NumPy 配列へ変換したものを保持し、
+        # 追加があった語は増えた分だけ連結する
+        self._postings: Dict[str, Tuple[List[int], List[int]]] = {}
+        self._arrays: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._metadata_postings: Dict[str, Dict[object, List[int]]] = {}
+
+        if persist_directory:
+            os.makedirs(persist_directory, exist_ok=True)
+            self._load()
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._ids
+
+    def _load(self):
+        path = os.path.join(self.persist_directory, self.DOCUMENTS_FILE)
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # 書き込み途中で中断された末尾の行
+                    continue
+                if row["id"] not in self._ids:
+                    self._index(row["id"], row["text"], row["metadata"])
+
+    def _index(self, doc_id: str, text: str, metadata: Dict):
+        row = len(self._texts)
+        self._ids[doc_id] = row
+        self._texts.append(text)
+        self._metadatas.append(metadata)
+        terms = Counter(ngram_terms(text))
+        length = sum(terms.values())
+        self._lengths.append(length)
+        self._norm = None
+        self._total_length += length
+        for term, count in terms.items():
+            rows, counts = self._postings.setdefault(term, ([], []))
+            rows.append(row)
+            counts.append(count)
+        for key, value in metadata.items():
+            if isinstance(value, (str, int, float, bool)):
+                self._metadata_postings.setdefault(key, {}).setdefault(value, []).append(row)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[Dict]] = None,
+                  ids: Optional[List[str]] = None) -> int:
+        """チャンクを索引に追加する（登録済みのIDは無視する）。追加した件数を返す"""
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(i + len(self._texts)) for i in range(len(texts))]
+        with self._lock:
+            new = []
+            for doc_id, text, metadata in zip(ids, texts, metadatas):
+                if doc_id not in self._ids:
+                    self._index(doc_id, text, dict(metadata))
+                    new.append({"id": doc_id, "text": text, "metadata": metadata})
+            if new and self.persist_directory:
+                with open(os.path.join(self.persist_directory, self.DOCUMENTS_FILE), 'a', encoding='utf-8') as f:
+                    f.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in new))
+        return len(new)
+
+    def _candidate_mask(self, filter: Optional[Dict]) -> Optional[np.ndarray]:
+        if not filter:
+            return None
+        mask = np.ones(len(self._texts), dtype=bool)
+        for key, condition in filter.items():
+            postings = self._metadata_postings.get(key, {})
+            if is_range_condition(condition):
+                values = [value for value in postings if matches_range(value, condition)]
+            elif isinstance(condition, dict):
+                if "$eq" in condition:
+                    values = [condition["$eq"]]
+                elif "$in" in condition:
+                    values = condition["$in"]
+                else:
+                    raise ValueError(f"未対応のフィルタ条件です: {condition}")
+            else:
+                values = [condition]
+            matched = np.zeros(len(self._texts), dtype=bool)
+            for value in values:
+                matched[postings.get(value, [])] = True
+            mask &= matched
+        return mask
+
+    def _term_arrays(self, term: str) -> Tuple[np.ndarray, np.ndarray]:
+        rows, counts = self._postings[term]
+        cached = self._arrays.get(term)
+        done = 0 if cached is None else cached[0].shape[0]
+        if done < len(rows):
+            new_rows = np.asarray(rows[done:], dtype=np.int64)
+            new_counts = np.asarray(counts[done:], dtype=np.float32)
+            cached = (new_rows, new_counts) if cached is None else (
+                np.concatenate([cached[0], new_rows]), np.concatenate([cached[1], new_counts]))
+            self._arrays[term] = cached
+        return cached
+
+    def search(self, query: str, k: int = 4, filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """BM25 スコアの上位 k 件を返す（問い合わせの語を1つも含まないものは返さない）"""
+        with self._lock:
+            count = len(self._texts)
+            if count == 0 or k <= 0:
+                return []
+            if self._norm is None:
+                lengths = np.asarray(self._lengths, dtype=np.float32)
+                self._norm = self.k1 * (1 - self.b + self.b * lengths / (self._total_length / count))
+            norm = self._norm
+            scores = np.zeros(count, dtype=np.float32)
+            for term in set(ngram_terms(query)):
+                if term not in self._postings:
+                    continue
+                rows, tf = self._term_arrays(term)
+                idf = math.log(1 + (count - len(rows) + 0.5) / (len(rows) + 0.5))
+                scores[rows] += idf * tf * (self.k1 + 1) / (tf + norm[rows])
+
+            mask = self._candidate_mask(filter)
+            if mask is not None:
+                scores[~mask] = 0
+            hits = np.flatnonzero(scores > 0)
+            if hits.size > k:
+                hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+            hits = hits[np.argsort(-scores[hits], kind="stable")]
+            return [(Document(page_content=self._texts[row], metadata=dict(self._metadatas[row])),
+                     float(scores[row])) for row in hits]
@@ -0,0 +1,343 @@
+import os
+import re
+import io
+import json
+import time
+import uuid
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from record_log import iter_record_sources
+
+try:
+    import fcntl
+except ImportError:  # Windows ではプロセス間のロックを取らない
+    fcntl = None
+
+_VALUE_PATTERN = re.compile(r"^\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*(.*?)\s*$")
+# ファイル名に使うため、機械IDは英数字・"_"・"-" のみ許可する
+MACHINE_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+# 保存済みの単位と異なる単位の値の換算（(値の単位, 保存済みの単位) → 換算式）
+UNIT_CONVERSIONS: Dict[Tuple[str, str], Callable[[float], float]] = {
+    ("°F", "°C"): lambda v: (v - 32) * 5 / 9,
+    ("°C", "°F"): lambda v: v * 9 / 5 + 32,
+    ("K", "°C"): lambda v: v - 273.15,
+    ("°C", "K"): lambda v: v + 273.15,
+    ("mA", "A"): lambda v: v / 1000,
+    ("A", "mA"): lambda v: v * 1000,
+    ("m/s", "mm/s"): lambda v: v * 1000,
+    ("mm/s", "m/s"): lambda v: v / 1000,
+    ("kPa", "MPa"): lambda v: v / 1000,
+    ("MPa", "kPa"): lambda v: v * 1000,
+    ("bar", "MPa"): lambda v: v / 10,
+    ("MPa", "bar"): lambda v: v * 10,
+}
+
+
+def parse_measurement(value) -> Tuple[Optional[float], str]:
+    """"88.2°C" のような単位付きの測定値を (数値, 単位) に分解する"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value), ""
+    if not isinstance(value, str):
+        return None, ""
+    match = _VALUE_PATTERN.match(value)
+    if not match:
+        return None, ""
+    return float(match.group(1)), match.group(2)
+
+
+def convert_unit(value: float, unit: str, target: str) -> Optional[float]:
+    """value を単位 target に換算する（単位なしの値は target とみなす。換算できなければ None）"""
+    if not unit or unit == target:
+        return value
+    convert = UNIT_CONVERSIONS.get((unit, target))
+    return None if convert is None else convert(value)
+
+
+def parse_inspection_date(value: str) -> Optional[int]:
+    """点検日時を UNIX 秒に変換する（"2025-03-31 21:40:40" / "2024-02-20" 形式）"""
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def _merge_columns(parts: List[Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    """列の組を連結して時刻順に並べる（ない項目は NaN）
+
+    同じ時刻の行はすべて残し、時刻とすべての値が一致する行（同じ記録の再取り込み）だけを1行にする。
+    """
+    count = sum(len(part["timestamp"]) for part in parts)
+    names = {name for part in parts for name in part}
+    names.discard("timestamp")
+    merged = {"timestamp": np.concatenate([np.empty(0, dtype=np.int64)] +
+                                          [part["timestamp"] for part in parts])}
+    for name in names:
+        column = np.full(count, np.nan)
+        offset = 0
+        for part in parts:
+            size = len(part["timestamp"])
+            if name in part:
+                column[offset:offset + size] = part[name]
+            offset += size
+        merged[name] = column
+
+    if not count:
+        return merged
+    # 時刻順（同じ時刻の中は値の順）に並べ、隣り合う行が完全に一致するものを除く
+    ordered = sorted(names)
+    order = np.lexsort([merged[name] for name in reversed(ordered)] + [merged["timestamp"]])
+    sorted_columns = {name: column[order] for name, column in merged.items()}
+    duplicate = sorted_columns["timestamp"][1:] == sorted_columns["timestamp"][:-1]
+    for name in ordered:
+        column = sorted_columns[name]
+        same = (column[1:] == column[:-1]) | (np.isnan(column[1:]) & np.isnan(column[:-1]))
+        duplicate &= same
+    keep = np.append(True, ~duplicate)
+    return {name: column[keep] for name, column in sorted_columns.items()}
+
+
+def _write_npz(path: str, columns: Dict[str, np.ndarray]):
+    buffer = io.BytesIO()
+    np.savez(buffer, **columns)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(buffer.getvalue())
+    os.replace(tmp_path, path)
+
+
+class MeasurementStore:
+    """点検記録の測定値を機械ごとの列形式で保持するストア
+
+    機械ごとに、時刻順に並んだ timestamp 列と測定項目ごとの float64 列（欠測は NaN）を持つ。
+    append() は追加分だけを <root>/<machine_id>.segments/ に1つの npz として書き出し、
+    読み込み時に統合済みの <root>/<machine_id>.npz と連結する。書き込みは追加した行数に比例し、
+    セグメントが COMPACT_SEGMENTS 個たまった機械は全体を <machine_id>.npz に統合し直す
+    （機械の行数に比例するこのコストは COMPACT_SEGMENTS 回の append に1回だけかかる）。
+    単位は測定項目ごとに最初の値のものを units.json に保存し、以降の値はその単位に換算する。
+    units.json の読み直しと更新はロックファイル（flock）で複数プロセスの append を直列化する。
+    時系列の取り出しは np.searchsorted による範囲指定で行うため、ディレクトリの走査は不要。
+    """
+
+    UNITS_FILE = "units.json"
+    UNITS_LOCK_FILE = ".units.lock"
+    SEGMENTS_SUFFIX = ".segments"
+    COMPACT_SEGMENTS = 64
+
+    def __init__(self, root: str = "data/measurements"):
+        self.root = root
+        self._lock = threading.Lock()
+        self._cache: Dict[str, Tuple[Tuple, Dict[str, np.ndarray]]] = {}
+        self.units: Dict[str, str] = {}
+        self._load_units()
+
+    def _load_units(self):
+        units_path = os.path.join(self.root, self.UNITS_FILE)
+        if os.path.exists(units_path):
+            with open(units_path, 'r', encoding='utf-8') as f:
+                self.units = json.load(f)
+
+    @contextmanager
+    def _units_lock(self):
+        """他プロセスと排他して units.json を読み直す（ブロックの中で単位を決めて保存する）"""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, self.UNITS_LOCK_FILE), 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                self._load_units()
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _machine_path(self, machine_id: str) -> str:
+        if not MACHINE_ID_PATTERN.match(machine_id):
+            raise ValueError(f"機械IDに使えない文字が含まれています: {machine_id!r}")
+        return os.path.join(self.root, f"{machine_id}.npz")
+
+    def _segments_dir(self, machine_id: str) -> str:
+        return self._machine_path(machine_id)[:-4] + self.SEGMENTS_SUFFIX
+
+    def machine_ids(self) -> List[str]:
+        """測定値が保存されている機械IDの一覧"""
+        if not os.path.isdir(self.root):
+            return []
+        ids = set()
+        for name in os.listdir(self.root):
+            if name.endswith('.npz'):
+                ids.add(name[:-4])
+            elif name.endswith(self.SEGMENTS_SUFFIX):
+                ids.add(name[:-len(self.SEGMENTS_SUFFIX)])
+        return sorted(ids)
+
+    def _version(self, machine_id: str) -> Tuple[Optional[int], Tuple[str, ...]]:
+        """統合済みファイルの更新時刻とセグメント名の一覧（他プロセスの更新を検出する）"""
+        try:
+            mtime = os.stat(self._machine_path(machine_id)).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        try:
+            segments = tuple(sorted(f for f in os.listdir(self._segments_dir(machine_id))
+                                    if f.endswith('.npz')))
+        except FileNotFoundError:
+            segments = ()
+        return mtime, segments
+
+    def _load(self, machine_id: str) -> Dict[str, np.ndarray]:
+        """機械の列を読み込む（ファイルが他プロセスで更新されていれば読み直す）"""
+        while True:
+            version = self._version(machine_id)
+            cached = self._cache.get(machine_id)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+            mtime, segments = version
+            paths = ([self._machine_path(machine_id)] if mtime is not None else []) + [
+                os.path.join(self._segments_dir(machine_id), name) for name in segments
+            ]
+            parts = []
+            try:
+                for path in paths:
+                    with np.load(path) as data:
+                        parts.append({name: data[name] for name in data.files})
+            except FileNotFoundError:
+                # 読み込み中に他プロセスが統合した。一覧を取り直す
+                continue
+            columns = _merge_columns(parts)
+            self._cache[machine_id] = (version, columns)
+            return columns
+
+    def _compact(self, machine_id: str, columns: Dict[str, np.ndarray], segments: Tuple[str, ...]):
+        """セグメントを統合済みファイルにまとめ、まとめたセグメントを削除する"""
+        _write_npz(self._machine_path(machine_id), columns)
+        segments_dir = self._segments_dir(machine_id)
+        for name in segments:
+            try:
+                os.remove(os.path.join(segments_dir, name))
+            except FileNotFoundError:
+                pass
+
+    def _save_units(self):
+        tmp_path = os.path.join(self.root, self.UNITS_FILE + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.units, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, os.path.join(self.root, self.UNITS_FILE))
+
+    def append(self, records: Iterable[Dict]) -> int:
+        """点検記録の measurements を数値列に正規化して追加し、増えた行数を返す
+
+        機械IDがファイル名に使えない記録と、保存済みの単位に換算できない値は取り込まない。
+        """
+        rows: Dict[str, List[Tuple[int, Dict[str, float]]]] = {}
+        units_changed = False
+        # 単位の決定から保存までを排他し、他プロセスが先に決めた単位を上書きしない
+        with self._units_lock():
+            for record in records:
+                machine_id = record.get('machine_id')
+                timestamp = parse_inspection_date(record.get('inspection_date'))
+                measurements = record.get('measurements')
+                if not machine_id or timestamp is None or not isinstance(measurements, dict):
+                    continue
+                machine_id = str(machine_id)
+                if not MACHINE_ID_PATTERN.match(machine_id):
+                    print(f"⚠️ 機械ID {machine_id!r} の測定値は取り込みません（英数字・_・- 以外を含む）")
+                    continue
+                values = {}
+                for name, raw in measurements.items():
+                    number, unit = parse_measurement(raw)
+                    if number is None:
+                        continue
+                    if name in self.units:
+                        converted = convert_unit(number, unit, self.units[name])
+                        if converted is None:
+                            print(f"⚠️ {machine_id} の {name}={raw!r} は単位が {self.units[name]} と異なるため取り込みません")
+                            continue
+                        number = converted
+                    elif unit:
+                        self.units[name] = unit
+                        units_changed = True
+                    values[name] = number
+                rows.setdefault(machine_id, []).append((timestamp, values))
+            if units_changed:
+                self._save_units()
+
+        added = 0
+        with self._lock:
+            for machine_id, new_rows in rows.items():
+                columns = self._load(machine_id)
+                _, segments = self._cache[machine_id][0]
+                names = {name for _, values in new_rows for name in values}
+                segment = _merge_columns([{
+                    "timestamp": np.array([ts for ts, _ in new_rows], dtype=np.int64),
+                    **{name: np.array([values.get(name, np.nan) for _, values in new_rows])
+                       for name in names},
+                }])
+                merged = _merge_columns([columns, segment])
+
+                segments_dir = self._segments_dir(machine_id)
+                os.makedirs(segments_dir, exist_ok=True)
+                # 名前順が書き込み順になるようにする（複数プロセスでも衝突しない）
+                name = f"{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.npz"
+                _write_npz(os.path.join(segments_dir, name), segment)
+                if len(segments) + 1 >= self.COMPACT_SEGMENTS:
+                    self._compact(machine_id, merged, segments + (name,))
+                self._cache[machine_id] = (self._version(machine_id), merged)
+                added += len(merged["timestamp"]) - len(columns["timestamp"])
+        return added
+
+    def series(self, machine_id: str, measurements: Optional[List[str]] = None,
+               start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, np.ndarray]:
+        """機械の時系列を返す（start 以上 end 未満）。キーは timestamp と測定項目名"""
+        with self._lock:
+            columns = self._load(machine_id)
+        timestamps = columns["timestamp"]
+        lo = 0 if start is None else np.searchsorted(timestamps, int(start.timestamp()), side="left")
+        hi = len(timestamps) if end is None else np.searchsorted(timestamps, int(end.timestamp()), side="left")
+        names = measurements if measurements is not None else [n for n in columns if n != "timestamp"]
+        result = {"timestamp": timestamps[lo:hi]}
+        for name in names:
+            column = columns.get(name)
+            result[name] = column[lo:hi] if column is not None else np.full(hi - lo, np.nan)
+        return result
+
+    def frame(self, machine_id: str, **kwargs):
+        """series() の結果を pandas の DataFrame（時刻インデックス）で返す"""
+        import pandas as pd
+        data = self.series(machine_id, **kwargs)
+        index = pd.to_datetime(data.pop("timestamp"), unit="s")
+        return pd.DataFrame(data, index=index)
+
+    def build_from_directory(self, directory: str = "data/inspections/log/raw",
+                             raw_dir: Optional[str] = "data/inspections/raw") -> int:
+        """点検記録を1回だけ走査してストアに取り込む
+
+        directory は記録ログまたは1記録1ファイルのディレクトリ。raw_dir のまだログへ
+        移行していない記録も合わせて読む（同じ記録IDは1回だけ）。
+        """
+        sources = [directory] + ([raw_dir] if raw_dir else [])
+        return self.append([record for _, record in iter_record_sources(sources)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="点検記録の測定値を列形式ストアに取り込む")
+    parser.add_argument("directory", nargs="?", default="data/inspections/log/raw",
+                        help="点検記録のログまたはディレクトリ")
+    parser.add_argument("--raw-dir", default="data/inspections/raw",
+                        help="合わせて読む、ログへ移行前の点検記録ディレクトリ（空文字で読まない）")
+    parser.add_argument("--store", default="data/measurements")
+    args = parser.parse_args()
+
+    store = MeasurementStore(args.store)
+    added = store.build_from_directory(args.directory, args.raw_dir or None)
+    print(f"{added}件の測定値を取り込みました（機械 {len(store.machine_ids())} 台）")
+    print("単位:", store.units)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+import os
+import json
+import uuid
+import argparse
+import threading
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows では排他ロックを取らない
+    fcntl = None
+
+
+class LogLockedError(RuntimeError):
+    """他のインスタンスが書き込み用にログを開いている"""
+
+
+def new_record_id() -> str:
+    """時刻順に並び、同じ秒に保存しても衝突しない記録ID"""
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}_{uuid.uuid4().hex[:6]}"
+
+
+class RecordLog:
+    """追記専用のセグメント化された記録ログ
+
+    記録は segment-NNNNNN.jsonl に1行ずつ追記し、segment_size を超えると次のセグメントへ切り替える。
+    各セグメントの .idx には「ID<TAB>オフセット<TAB>長さ」を記録し、ID から1回のシークで読み出せる。
+    fsync は fsync_every 件ごと（および sync()/close() 時）にまとめて行う。
+    1つのログに書き込むのは1つのインスタンスだけで、書き込み用に開くとディレクトリの
+    .writer.lock に排他ロック（flock）を取り、2つ目の書き手は LogLockedError で拒否する
+    （末尾の復旧処理が、書き込み中の行を切り詰めてしまわないように）。
+    他のプロセスは read_only で開き、refresh() で追記された記録を取り込める。
+    """
+
+    SEGMENT_PREFIX = "segment-"
+    LOCK_FILE = ".writer.lock"
+
+    def __init__(self, directory: str, segment_size: int = 64 * 1024 * 1024, fsync_every: int = 64,
+                 read_only: bool = False):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync_every = fsync_every
+        self.read_only = read_only
+        self._lock = threading.Lock()
+        self._offsets: Dict[str, Tuple[int, int, int]] = {}
+        self._order: List[str] = []
+        self._index_positions: Dict[int, int] = {}
+        self._segment_no = 0
+        self._segment = None
+        self._index = None
+        self._lock_file = None
+        self._unsynced = 0
+        if read_only:
+            self.refresh()
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self._acquire_writer_lock()
+            self._open()
+
+    def _acquire_writer_lock(self):
+        if fcntl is None:
+            return
+        lock_file = open(os.path.join(self.directory, self.LOCK_FILE), 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise LogLockedError(f"ログは既に書き込み用に開かれています: {self.directory}")
+        self._lock_file = lock_file
+
+    @classmethod
+    def is_log_dir(cls, directory: str) -> bool:
+        return os.path.isdir(directory) and any(
+            f.startswith(cls.SEGMENT_PREFIX) and f.endswith('.jsonl') for f in os.listdir(directory)
+        )
+
+    def _segment_path(self, segment_no: int, ext: str = "jsonl") -> str:
+        return os.path.join(self.directory, f"{self.SEGMENT_PREFIX}{segment_no:06d}.{ext}")
+
+    def _segment_numbers(self) -> List[int]:
+        if not os.path.isdir(self.directory):
+            return []
+        numbers = []
+        for filename in os.listdir(self.directory):
+            if filename.startswith(self.SEGMENT_PREFIX) and filename.endswith('.jsonl'):
+                numbers.append(int(filename[len(self.SEGMENT_PREFIX):-len('.jsonl')]))
+        return sorted(numbers)
+
+    def _open(self):
+        """既存のセグメントと索引を読み込む（中断された書き込みは切り詰めて復旧する）"""
+        numbers = self._segment_numbers()
+        for segment_no in numbers:
+            self._read_index(segment_no)
+        if numbers:
+            last = numbers[-1]
+            indexed_end = max([offset + length for segment_no, offset, length in self._offsets.values()
+                               if segment_no == last], default=0)
+            self._recover_tail(last, indexed_end)
+
+        self._segment_no = numbers[-1] if numbers else 1
+        self._open_segment()
+
+    def _read_index(self, segment_no: int) -> List[str]:
+        """セグメントの索引のうち、前回読んだ位置以降を取り込み、新しい記録IDを返す"""
+        index_path = self._segment_path(segment_no, "idx")
+        if not os.path.exists(index_path):
+            return []
+        position = self._index_positions.get(segment_no, 0)
+        with open(index_path, 'rb') as f:
+            f.seek(position)
+            data = f.read()
+        # 書きかけの行は次回に読む
+        data = data[:data.rfind(b"\n") + 1]
+        self._index_positions[segment_no] = position + len(data)
+
+        new_ids = []
+        for line in data.decode('utf-8').splitlines():
+            parts = line.split("\t")
+            if len(parts) != 3:
+                continue
+            record_id = parts[0]
+            if self._add_offset(record_id, segment_no, int(parts[1]), int(parts[2])):
+                new_ids.append(record_id)
+        return new_ids
+
+    def refresh(self) -> List[str]:
+        """他のプロセスが追記した記録を取り込み、新しい記録IDを返す"""
+        with self._lock:
+            new_ids = []
+            for segment_no in self._segment_numbers():
+                new_ids.extend(self._read_index(segment_no))
+            return new_ids
+
+    def _recover_tail(self, segment_no: int, indexed_end: int):
+        """索引に載っていない末尾の行を索引に追加し、不完全な行を削除する"""
+        path = self._segment_path(segment_no)
+        with open(path, 'rb') as f:
+            f.seek(indexed_end)
+            tail = f.read()
+        offset = indexed_end
+        recovered = []
+        for line in tail.split(b"\n")[:-1]:
+            length = len(line) + 1
+            try:
+                record_id = json.loads(line)["id"]
+                recovered.append((record_id, offset, length))
+            except (ValueError, KeyError):
+                break
+            offset += length
+        if offset < indexed_end + len(tail):
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+        if recovered:
+            with open(self._segment_path(segment_no, "idx"), 'a', encoding='utf-8') as f:
+                for record_id, record_offset, length in recovered:
+                    f.write(f"{record_id}\t{record_offset}\t{length}\n")
+                    self._add_offset(record_id, segment_no, record_offset, length)
+
+    def _add_offset(self, record_id: str, segment_no: int, offset: int, length: int) -> bool:
+        is_new = record_id not in self._offsets
+        if is_new:
+            self._order.append(record_id)
+        self._offsets[record_id] = (segment_no, offset, length)
+        return is_new
+
+    def _open_segment(self):
+        self._segment = open(self._segment_path(self._segment_no), 'ab')
+        self._index = open(self._segment_path(self._segment_no, "idx"), 'a', encoding='utf-8')
+
+    def _rotate(self):
+        self._sync_locked()
+        self._segment.close()
+        self._index.close()
+        self._segment_no += 1
+        self._open_segment()
+
+    def _sync_locked(self):
+        if self._unsynced:
+            self._segment.flush()
+            self._index.flush()
+            os.fsync(self._segment.fileno())
+            os.fsync(self._index.fileno())
+            self._unsynced = 0
+
+    def append(self, record: Dict, record_id: Optional[str] = None) -> str:
+        """記録を追記して記録IDを返す"""
+        record_id = record_id or new_record_id()
+        if "\t" in record_id or "\n" in record_id:
+            raise ValueError(f"記録IDにタブや改行は使用できません: {record_id!r}")
+        line = (json.dumps({"id": record_id, "record": record}, ensure_ascii=False) + "\n").encode('utf-8')
+
+        if self.read_only:
+            raise ValueError("読み取り専用のログには追記できません")
+        with self._lock:
+            offset = self._segment.tell()
+            if offset and offset + len(line) > self.segment_size:
+                self._rotate()
+                offset = 0
+            self._segment.write(line)
+            self._segment.flush()
+            self._index.write(f"{record_id}\t{offset}\t{len(line)}\n")
+            self._index.flush()
+            self._add_offset(record_id, self._segment_no, offset, len(line))
+            self._unsynced += 1
+            if self._unsynced >= self.fsync_every:
+                self._sync_locked()
+        return record_id
+
+    def get(self, record_id: str) -> Optional[Dict]:
+        """記録IDで記録を読み出す（存在しなければ None）"""
+        location = self._offsets.get(record_id)
+        if location is None:
+            return None
+        segment_no, offset, length = location
+        with open(self._segment_path(segment_no), 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.read(length))["record"]
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self._offsets
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def ids(self) -> List[str]:
+        """追記順の記録ID一覧"""
+        return list(self._order)
+
+    def __iter__(self) -> Iterator[Tuple[str, Dict]]:
+        """(記録ID, 記録) を追記順に返す（セグメントを先頭から順に読む）"""
+        with self._lock:
+            if self._segment is not None:
+                self._segment.flush()
+            numbers = self._segment_numbers()
+        for segment_no in numbers:
+            offset = 0
+            with open(self._segment_path(segment_no), 'rb') as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break
+                    entry = json.loads(line)
+                    # 同じIDが再追記されている場合は最新の位置のものだけを返す
+                    if self._offsets.get(entry["id"]) == (segment_no, offset, len(line)):
+                        yield entry["id"], entry["record"]
+                    offset += len(line)
+
+    def sync(self):
+        """未同期の追記をディスクへ書き出す"""
+        with self._lock:
+            if self._segment is not None:
+                self._sync_locked()
+
+    def close(self):
+        with self._lock:
+            if self._segment is not None:
+                self._sync_locked()
+                self._segment.close()
+                self._index.close()
+                self._segment = self._index = None
+            if self._lock_file is not None:
+                # ファイルを閉じるとロックも外れる
+                self._lock_file.close()
+                self._lock_file = None
+
+
+def iter_record_sources(sources: Iterable[str]) -> Iterator[Tuple[str, Dict]]:
+    """記録ログまたは1記録1ファイルの JSON ディレクトリを順に読み、(記録ID, 記録) を返す
+
+    ディレクトリのファイル名（拡張子なし）を記録IDとし、存在しないソースは飛ばす。
+    同じ記録ID（ログへ移行済みのファイルなど）は最初に読んだものだけを返す。
+    """
+    seen = set()
+    for source in sources:
+        if RecordLog.is_log_dir(source):
+            records = iter(RecordLog(source, read_only=True))
+        elif os.path.isdir(source):
+            records = _iter_directory(source)
+        else:
+            continue
+        for record_id, record in records:
+            if record_id not in seen:
+                seen.add(record_id)
+                yield record_id, record
+
+
+def _iter_directory(directory: str) -> Iterator[Tuple[str, Dict]]:
+    for filename in sorted(os.listdir(directory)):
+        if filename.endswith('.json'):
+            with open(os.path.join(directory, filename), 'r', encoding='utf-8') as f:
+                yield filename[:-len('.json')], json.load(f)
+
+
+def migrate_directory(source_dir: str, log: RecordLog, delete_source: bool = False) -> int:
+    """1記録1ファイルの JSON ディレクトリをログへ移行する
+
+    ファイル名（拡張子なし）を記録IDとして引き継ぎ、移行済みのIDはスキップする。
+    """
+    migrated = 0
+    paths = []
+    for filename in sorted(os.listdir(source_dir)):
+        if not filename.endswith('.json'):
+            continue
+        record_id = filename[:-len('.json')]
+        path = os.path.join(source_dir, filename)
+        if record_id not in log:
+            with open(path, 'r', encoding='utf-8') as f:
+                log.append(json.load(f), record_id=record_id)
+            migrated += 1
+        paths.append(path)
+    log.sync()
+    if delete_source:
+        for path in paths:
+            os.remove(path)
+    return migrated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="点検記録ディレクトリを追記専用ログへ移行する")
+    parser.add_argument("source", nargs="?", default="data/inspections/raw")
+    parser.add_argument("log_dir", nargs="?", default="data/inspections/log/raw")
+    parser.add_argument("--delete-source", action="store_true", help="移行後に元のファイルを削除する")
+    args = parser.parse_args()
+
+    log = RecordLog(args.log_dir)
+    migrated = migrate_directory(args.source, log, delete_source=args.delete_source)
+    log.close()
+    print(f"{migrated}件の記録を {args.log_dir} に移行しました（合計 {len(log)} 件）")
+
+
+if __name__ == "__main__":
+    main()
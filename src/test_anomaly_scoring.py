@@ -0,0 +1,49 @@
+import tempfile
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from anomaly_scoring import score_fleet, score_matrix
+from measurement_store import MeasurementStore
+
+
+def test_score_matrix_flags_spike_and_threshold():
+    rng = np.random.default_rng(0)
+    values = 60 + rng.normal(0, 1, size=(3, 20))
+    values[1, -1] = 75.0          # 急変（しきい値未満）
+    values[2, -1] = 85.0          # しきい値超過
+    values[0, :10] = np.nan       # 履歴が短い機械も扱える
+    scores = score_matrix(values, high=80.0)
+    assert scores["z_score"][1] > 3.0
+    assert scores["threshold_crossed"].tolist() == [False, False, True]
+    assert scores["score"][0] < 1.0 and scores["score"][1] >= 1.0 and scores["score"][2] >= 1.0
+
+
+def test_score_fleet_ranks_flagged_machines():
+    base = datetime(2025, 1, 1)
+    records = []
+    for day in range(30):
+        for machine in range(5):
+            temperature = 60.0 + (day % 3) * 0.5
+            # M003 は直近で温度が上昇し続ける
+            if machine == 3 and day >= 25:
+                temperature += (day - 24) * 4
+            records.append({
+                "machine_id": f"M{machine:03d}",
+                "inspection_date": (base + timedelta(days=day)).isoformat(sep=" "),
+                "measurements": {"temperature": f"{temperature:.1f}°C", "oil_pressure": "3.2MPa"},
+            })
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MeasurementStore(tmp_dir)
+        store.append(records)
+        report = score_fleet(store, window=30)
+
+    assert len(report) == 5
+    assert report[0]["machine_id"] == "M003" and report[0]["flagged"]
+    assert report[0]["measurements"]["temperature"]["latest"] == 81.0
+    assert not any(item["flagged"] for item in report[1:])
+
+
+if __name__ == "__main__":
+    test_score_matrix_flags_spike_and_threshold()
+    test_score_fleet_ranks_flagged_machines()
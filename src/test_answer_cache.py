@@ -0,0 +1,85 @@
+import time
+import tempfile
+
+import numpy as np
+from langchain_community.chat_models.fake import FakeListChatModel
+
+from answer_cache import SemanticAnswerCache, extract_machine_ids
+from embedding_cache import EmbeddingCache
+from fake_backends import HashEmbeddings
+from vector_store import LocalVectorStore
+from vectorize_and_predict import MaintenanceAnalyzer, RETRIEVAL_SOURCES
+
+
+def test_extract_machine_ids():
+    assert extract_machine_ids("モーターM001で温度上昇、M12も確認") == {"M001", "M12"}
+    assert extract_machine_ids("ABM001 や M001A は機械IDではない") == frozenset()
+
+
+def test_similar_queries_hit_and_machine_ids_must_match():
+    cache = SemanticAnswerCache(similarity_threshold=0.95)
+    base = np.random.default_rng(0).standard_normal(16)
+    near = base + 0.01 * np.random.default_rng(1).standard_normal(16)
+    cache.put("モーターM001で温度上昇", base, {"analysis": "A"})
+
+    result, similarity = cache.get("M001のモーターの温度が上昇", near)
+    assert result == {"analysis": "A"}
+    assert similarity >= 0.95
+    # 埋め込みが近くても別の機械についての質問はミス
+    assert cache.get("モーターM002で温度上昇", near) is None
+    assert cache.get("M001", -base) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+
+def test_ttl_lru_and_invalidation():
+    cache = SemanticAnswerCache(ttl=0.05, max_entries=2)
+    vectors = np.eye(4)
+    cache.put("M001", vectors[0], {"n": 0})
+    time.sleep(0.06)
+    assert cache.get("M001", vectors[0]) is None
+
+    cache = SemanticAnswerCache(max_entries=2)
+    cache.put("M001", vectors[0], {"n": 0})
+    cache.put("M002", vectors[1], {"n": 1}, machine_ids=["M003"])
+    cache.get("M001", vectors[0])
+    cache.put("全体の傾向", vectors[2], {"n": 2})
+    # 最も長く使われていない M002 のエントリが追い出される
+    assert cache.get("M002", vectors[1]) is None
+    assert len(cache) == 2
+
+    cache.put("M002", vectors[1], {"n": 1}, machine_ids=["M003"])
+    cache.clear()
+    cache.put("M001", vectors[0], {"n": 0})
+    cache.put("M002", vectors[1], {"n": 1}, machine_ids=["M003"])
+    # 回答の根拠に含まれる機械の記録が増えたら破棄する
+    assert cache.invalidate_machines(["M003"]) == 1
+    assert cache.get("M001", vectors[0]) is not None
+
+
+def test_analyzer_answers_repeat_questions_from_cache():
+    embeddings = HashEmbeddings()
+    store = LocalVectorStore(embeddings)
+    store.add_texts(["点検記録", "故障事例", "技術ナレッジ"],
+                    [{"type": source} for source in RETRIEVAL_SOURCES])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        analyzer = MaintenanceAnalyzer(
+            embeddings=embeddings, vectorstore=store, data_dir=tmp_dir,
+            llm=FakeListChatModel(responses=["1回目の分析", "2回目の分析"]),
+            embedding_cache=EmbeddingCache(":memory:")
+        )
+        query = "モーターM001で温度上昇と異常振動"
+        first = analyzer.analyze_failure_cause(query)
+        second = analyzer.analyze_failure_cause(query)
+        assert not first["cached"]
+        assert second["cached"]
+        assert second["analysis"] == "1回目の分析"
+
+        # 同じ機械の記録を取り込むとキャッシュは無効になる
+        analyzer.process_inspection_record({"machine_id": "M001", "inspection_date": "2024-02-20",
+                                            "measurements": {"temperature": "90°C"}})
+        third = analyzer.analyze_failure_cause(query)
+        assert not third["cached"]
+        assert third["analysis"] == "2回目の分析"
+        assert analyzer.answer_cache.stats()["hits"] == 1
@@ -0,0 +1,117 @@
+import os
+import json
+import base64
+import asyncio
+import hashlib
+import tempfile
+
+import httpx
+import pytest
+
+from ai_engine import main as engine
+from ai_engine.blob_store import BlobStore
+from ai_engine.fault_data_loader import FaultDataLoader
+
+PNG = b"\x89PNG\r\n\x1a\n" + os.urandom(4096)
+
+
+def _get(loader: FaultDataLoader, url: str) -> httpx.Response:
+    async def run():
+        transport = httpx.ASGITransport(app=engine.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get(url)
+
+    original = engine.fault_loader
+    engine.fault_loader = loader
+    try:
+        return asyncio.run(run())
+    finally:
+        engine.fault_loader = original
+
+
+def test_digest_round_trip():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = BlobStore(tmp_dir)
+        digest = store.put(PNG)
+        assert digest == hashlib.sha256(PNG).hexdigest()
+        assert store.put(PNG) == digest
+        assert store.get(digest) == PNG
+        assert store.content_type(digest) == "image/png"
+        assert store.path(digest) == os.path.join(tmp_dir, digest[:2], digest)
+
+        encoded = base64.b64encode(PNG).decode()
+        assert store.offload_base64(encoded) == {"blob": digest, "content_type": "application/octet-stream",
+                                                 "size": len(PNG), "encoding": "base64"}
+        assert store.offload_base64("data:image/png;base64," + encoded)["content_type"] == "image/png"
+        # 短い文字列・base64 でない文字列はそのまま残す
+        assert store.offload_inline({"caption": "ベアリング", "images": ["abc"]}) == \
+            {"caption": "ベアリング", "images": ["abc"]}
+
+
+def test_digests_cannot_address_other_files():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = BlobStore(tmp_dir)
+        for digest in ("../etc/passwd", "A" * 64, "0" * 63, "0" * 64 + "/..", ""):
+            with pytest.raises(ValueError):
+                store.path(digest)
+
+
+def test_fault_history_references_served_blobs():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = os.path.join(tmp_dir, "exports")
+        os.makedirs(data_dir)
+        export = {"conversation_history": [
+            {"id": 1, "content": "写真", "media": [],
+             "base64_images": {"belt.png": "data:image/png;base64," + base64.b64encode(PNG).decode()}},
+        ]}
+        with open(os.path.join(data_dir, "export.json"), 'w', encoding='utf-8') as f:
+            json.dump(export, f)
+        loader = FaultDataLoader(data_dir, blob_store=BlobStore(os.path.join(tmp_dir, "blobs")))
+
+        history = _get(loader, "/api/fault-history").json()["history"]
+        reference = history[0]["base64_images"]["belt.png"]
+        assert reference == {"blob": hashlib.sha256(PNG).hexdigest(), "content_type": "image/png",
+                             "size": len(PNG), "encoding": "data_uri"}
+
+        response = _get(loader, f"/api/blobs/{reference['blob']}")
+        assert response.status_code == 200
+        assert response.content == PNG
+        assert response.headers["content-type"] == "image/png"
+        assert "immutable" in response.headers["cache-control"]
+
+        assert _get(loader, f"/api/blobs/{'0' * 64}").status_code == 404
+        assert _get(loader, "/api/blobs/not-a-digest").status_code == 400
+        assert _get(loader, "/api/blobs/..%2F..%2Fexport.json").status_code in (400, 404)
+
+
+def test_truncated_export_has_no_history():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = os.path.join(tmp_dir, "exports")
+        os.makedirs(data_dir)
+        text = json.dumps({"diagnostics": {}, "conversation_history": [{"id": 1, "content": "途中"}]})
+        with open(os.path.join(data_dir, "export.json"), 'w', encoding='utf-8') as f:
+            f.write(text[:-10])
+        loader = FaultDataLoader(data_dir, blob_store=BlobStore(os.path.join(tmp_dir, "blobs")))
+        assert loader.get_fault_history(os.path.join(data_dir, "export.json")) == []
+        assert _get(loader, "/api/fault-history").json() == {"status": "success", "history": []}
+
+
+def test_export_without_history_section_has_empty_history():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = os.path.join(tmp_dir, "exports")
+        os.makedirs(data_dir)
+        with open(os.path.join(data_dir, "export.json"), 'w', encoding='utf-8') as f:
+            json.dump({"diagnostics": {"code": "E01"}}, f)
+        loader = FaultDataLoader(data_dir, blob_store=BlobStore(os.path.join(tmp_dir, "blobs")))
+        assert _get(loader, "/api/fault-history").json() == {"status": "success", "history": []}
+        # 故障情報ファイルがなければエラー
+        os.remove(os.path.join(data_dir, "export.json"))
+        assert _get(loader, "/api/fault-history").json()["status"] == "error"
+
+
+if __name__ == "__main__":
+    test_digest_round_trip()
+    test_digests_cannot_address_other_files()
+    test_fault_history_references_served_blobs()
+    test_truncated_export_has_no_history()
+    test_export_without_history_section_has_empty_history()
@@ -0,0 +1,110 @@
+import os
+import json
+import tempfile
+
+import pytest
+
+from bulk_ingest import IngestManifest, bulk_ingest, iter_records
+from embedding_cache import EmbeddingCache
+from fake_backends import HashEmbeddings
+from record_log import RecordLog
+from vector_store import LocalVectorStore
+from vectorize_and_predict import MaintenanceAnalyzer
+
+
+class FailingVectorStore(LocalVectorStore):
+    """テスト用: 指定回数の投入後に失敗するストア（取り込みの中断を再現する）"""
+
+    def __init__(self, embeddings, fail_after):
+        super().__init__(embeddings)
+        self.fail_after = fail_after
+
+    def add_texts(self, texts, metadatas=None, ids=None):
+        if self.fail_after == 0:
+            raise RuntimeError("中断")
+        self.fail_after -= 1
+        return super().add_texts(texts, metadatas, ids)
+
+
+def _write_jsonl(path, count):
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            record = {"inspection_date": f"2025-04-01 00:{i // 60:02d}:{i % 60:02d}",
+                      "machine_id": f"M{i % 20:03d}", "findings": "異常なし",
+                      "measurements": {"temperature": f"{60 + i % 7}°C"}}
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def test_bulk_ingest_resumes_from_manifest():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        source = os.path.join(tmp_dir, "records.jsonl")
+        _write_jsonl(source, 95)
+        manifest_path = os.path.join(tmp_dir, "manifest.json")
+
+        # 3バッチ投入した時点で中断する
+        store = FailingVectorStore(HashEmbeddings(), fail_after=3)
+        analyzer = MaintenanceAnalyzer(embeddings=store.embeddings, vectorstore=store, llm=object(),
+                                       data_dir=tmp_dir, embedding_cache=EmbeddingCache(":memory:"))
+        invalidated = []
+        invalidate_machines = analyzer.answer_cache.invalidate_machines
+
+        def recording_invalidate(machine_ids):
+            invalidated.append(set(machine_ids))
+            return invalidate_machines(machine_ids)
+        analyzer.answer_cache.invalidate_machines = recording_invalidate
+        try:
+            bulk_ingest(analyzer, source, IngestManifest(manifest_path), workers=2, batch_size=10)
+        except RuntimeError:
+            pass
+        assert IngestManifest(manifest_path).get(os.path.abspath(source))["completed"] == 30
+
+        # 再実行すると残りの記録だけを取り込む
+        store.fail_after = -1
+        stats = bulk_ingest(analyzer, source, IngestManifest(manifest_path), workers=2, batch_size=10)
+        assert stats["records"] == 65
+        assert stats["completed"] == 95
+        assert len(store) == 95
+
+        stats = bulk_ingest(analyzer, source, IngestManifest(manifest_path), workers=2, batch_size=10)
+        assert stats["records"] == 0
+
+        # 1件ずつの取り込みと同じく、全文検索の索引・測定値ストア・回答キャッシュにも反映される
+        assert len(analyzer.lexical_index) == 95
+        assert analyzer.measurement_store.machine_ids() == [f"M{i:03d}" for i in range(20)]
+        assert sum(len(analyzer.measurement_store.series(machine_id)["timestamp"])
+                   for machine_id in analyzer.measurement_store.machine_ids()) == 95
+        assert len(invalidated) == 10
+        assert set().union(*invalidated) == {f"M{i:03d}" for i in range(20)}
+
+
+def test_resume_starts_after_the_last_key():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # ディレクトリ: 前回の後に名前順で手前へ追加されたファイルがあっても、最後のファイルの次から再開する
+        records_dir = os.path.join(tmp_dir, "records")
+        os.makedirs(records_dir)
+        for name in ("b.json", "d.json", "a.json", "e.json"):
+            with open(os.path.join(records_dir, name), 'w', encoding='utf-8') as f:
+                json.dump({"name": name}, f)
+        assert [key for key, _ in iter_records(records_dir, after="b.json")] == ["d.json", "e.json"]
+        os.remove(os.path.join(records_dir, "b.json"))
+        assert [key for key, _ in iter_records(records_dir, after="b.json")] == ["d.json", "e.json"]
+
+        # JSONL: 行番号の次の行から再開する（空行は数えない）
+        source = os.path.join(tmp_dir, "records.jsonl")
+        with open(source, 'w', encoding='utf-8') as f:
+            f.write('{"i": 1}\n\n{"i": 2}\n{"i": 3}\n')
+        assert [record["i"] for _, record in iter_records(source, after="3")] == [3]
+
+        # 記録ログ: 最後の記録IDの次から再開し、その記録がなければ失敗する
+        log = RecordLog(os.path.join(tmp_dir, "log"))
+        record_ids = [log.append({"i": i}) for i in range(4)]
+        log.close()
+        log_dir = os.path.join(tmp_dir, "log")
+        assert [key for key, _ in iter_records(log_dir, after=record_ids[1])] == record_ids[2:]
+        with pytest.raises(ValueError):
+            list(iter_records(log_dir, after="missing"))
+
+
+if __name__ == "__main__":
+    test_bulk_ingest_resumes_from_manifest()
+    test_resume_starts_after_the_last_key()
@@ -0,0 +1,90 @@
+import os
+import sys
+import json
+import random
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+from chunk_generator import CHUNK_SIZE, OVERLAP, READ_SIZE, generate_chunks, output_paths  # noqa: E402
+
+
+def _write_text(path: str, size: int, seed: int = 0) -> str:
+    """文末（。）で終わる長さの異なる文と、文末のない長い段落を混ぜたテキスト"""
+    rng = random.Random(seed)
+    parts, length = [], 0
+    while length < size:
+        if rng.random() < 0.02:
+            part = "区切りのない長い段落" * rng.randint(60, 120)
+        else:
+            part = f"第{len(parts)}項の点検では" + "軸受" * rng.randint(5, 40) + "の摩耗を確認した。"
+        parts.append(part)
+        length += len(part)
+    text = "".join(parts)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+    return text
+
+
+def test_large_input_boundaries_and_overlap():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        input_path = os.path.join(tmp_dir, "knowledge.txt")
+        output_path = os.path.join(tmp_dir, "chunks.jsonl")
+        # 読み込み単位（READ_SIZE）をまたぐ数MBの入力
+        text = _write_text(input_path, 3 * READ_SIZE + 12345)
+        count = generate_chunks(input_path, output_path)
+
+        with open(output_path, "r", encoding="utf-8") as f:
+            chunks = [json.loads(line) for line in f]
+        assert len(chunks) == count
+        assert [chunk["id"] for chunk in chunks] == list(range(count))
+        assert all(chunk["source"] == "knowledge.txt" for chunk in chunks)
+        contents = [chunk["content"] for chunk in chunks]
+
+        assert all(len(content) <= CHUNK_SIZE for content in contents)
+        sentence_ends = 0
+        for previous, current in zip(contents, contents[1:]):
+            # 隣り合うチャンクは OVERLAP 文字だけ重なる
+            assert current[:OVERLAP] == previous[-OVERLAP:]
+            # 文末で切れないのは、ウィンドウの後半に文末がない（CHUNK_SIZE で切った）ときだけ
+            if previous.endswith("。"):
+                sentence_ends += 1
+            else:
+                assert len(previous) == CHUNK_SIZE
+                assert "。" not in previous[CHUNK_SIZE // 2:]
+        assert sentence_ends > len(contents) // 2
+        # 重なりを除いてつなげると元のテキストに戻る
+        assert contents[0] + "".join(content[OVERLAP:] for content in contents[1:]) == text
+
+
+def test_output_paths_keep_same_named_inputs_apart():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        inputs = [os.path.join(tmp_dir, "line_a", "manual.txt"), os.path.join(tmp_dir, "line_b", "manual.txt"),
+                  os.path.join(tmp_dir, "line_b", "sub", "manual.txt")]
+        for path in inputs:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            _write_text(path, 2000, seed=len(path))
+
+        out_dir = os.path.join(tmp_dir, "processed")
+        targets = output_paths(inputs, out_dir)
+        assert targets == [
+            (os.path.join(out_dir, "line_a", "manual.chunks.jsonl"), "line_a/manual.txt"),
+            (os.path.join(out_dir, "line_b", "manual.chunks.jsonl"), "line_b/manual.txt"),
+            (os.path.join(out_dir, "line_b", "sub", "manual.chunks.jsonl"), "line_b/sub/manual.txt"),
+        ]
+        for input_path, (output_path, source) in zip(inputs, targets):
+            generate_chunks(input_path, output_path, source)
+        with open(targets[1][0], "r", encoding="utf-8") as f:
+            assert json.loads(f.readline())["source"] == "line_b/manual.txt"
+
+        # 拡張子だけが違う入力や同じ入力の重複は、上書きせずにエラーにする
+        with pytest.raises(ValueError):
+            output_paths([os.path.join(tmp_dir, "manual.txt"), os.path.join(tmp_dir, "manual.md")], out_dir)
+        with pytest.raises(ValueError):
+            output_paths([inputs[0], inputs[0]], out_dir)
+
+
+if __name__ == "__main__":
+    test_large_input_boundaries_and_overlap()
+    test_output_paths_keep_same_named_inputs_apart()
@@ -0,0 +1,65 @@
+from langchain_core.documents import Document
+
+from context_assembly import (ContextAssembler, estimate_tokens, parse_token_budget, strip_overlap,
+                              truncate_to_tokens)
+
+
+def _results(*texts):
+    return [(Document(page_content=text), 1.0 - i * 0.01) for i, text in enumerate(texts)]
+
+
+def test_duplicates_are_removed_and_diverse_chunks_kept():
+    assembler = ContextAssembler(max_chunks=3)
+    result = assembler.assemble(_results(
+        "事例1: モーターの異常振動を検知 → ベアリングの状態確認が必要",
+        "事例1:   モーターの異常振動を検知 →\n ベアリングの状態確認が必要",
+        "事例7: モーターの異常振動を検知 → ベアリングの状態確認が必要",
+        "事例3: 油圧が低下傾向 → 油圧システムの点検が必要",
+        "事例4: 運転中に異常な音が発生 → ギアボックスの点検が必要",
+    ))
+    assert result["text"].splitlines() == [
+        "事例1: モーターの異常振動を検知 → ベアリングの状態確認が必要",
+        "事例3: 油圧が低下傾向 → 油圧システムの点検が必要",
+        "事例4: 運転中に異常な音が発生 → ギアボックスの点検が必要",
+    ]
+    assert result["stats"]["duplicates"] == 2
+    assert result["stats"]["tokens"] <= result["stats"]["raw_tokens"]
+
+
+def test_overlapping_chunks_are_trimmed():
+    record = "".join(f"測定項目{i}は基準値内。" for i in range(40))
+    first, second = record[:200], record[150:]
+    assert strip_overlap(first, second) == record[200:]
+    assert strip_overlap(second, first) == record[:150]
+
+    result = ContextAssembler().assemble(_results(first, second))
+    assert result["text"] == record[:200] + "\n" + record[200:]
+    assert result["stats"]["overlap_chars"] == 50
+
+
+def test_token_budget_per_source():
+    texts = [f"{topic}の点検記録" * 10 for topic in ("振動", "温度", "油圧")]
+    assembler = ContextAssembler(token_budget=parse_token_budget("inspection=100,knowledge=1000"))
+    assert len(assembler.assemble(_results(*texts), source="inspection")["documents"]) == 1
+    assert len(assembler.assemble(_results(*texts), source="knowledge")["documents"]) == 3
+    assert estimate_tokens("abcdefgh振動") == 4
+
+
+def test_chunk_larger_than_the_budget_is_truncated():
+    large = "\n".join(f"{i}行目: 振動値が基準を超過" for i in range(100))
+    small = "温度は基準値内"
+    result = ContextAssembler(token_budget=50).assemble(_results(large, small))
+    # 予算を超える先頭のチャンクも、切り詰めて文脈に入れる
+    assert result["documents"][0].page_content == large
+    assert result["text"].startswith("0行目: 振動値が基準を超過\n1行目")
+    assert large.startswith(result["text"].split("\n" + small)[0])
+    assert result["stats"]["tokens"] <= 50
+    assert result["stats"]["truncated_chars"] > 0
+    assert truncate_to_tokens("abcdefgh振動", 2) == "abcdefgh"
+
+
+if __name__ == "__main__":
+    test_duplicates_are_removed_and_diverse_chunks_kept()
+    test_overlapping_chunks_are_trimmed()
+    test_token_budget_per_source()
+    test_chunk_larger_than_the_budget_is_truncated()
@@ -0,0 +1,133 @@
+import os
+import json
+import tempfile
+import warnings
+from types import SimpleNamespace
+
+import pinecone
+from langchain_community.vectorstores.pinecone import Pinecone as LangchainPinecone
+
+from embedding_cache import EmbeddingCache, CachedEmbeddings
+from fake_backends import HashEmbeddings
+from vectorize_and_predict import MaintenanceAnalyzer
+
+
+class CountingEmbeddings(HashEmbeddings):
+    """テスト用: 埋め込みAPIの呼び出し回数と件数を数える"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+        self.texts = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return super().embed_documents(texts)
+
+
+class FakePineconeIndex(pinecone.Index):
+    """テスト用: 受け取ったベクトルを保持するだけの Pinecone インデックス（通信しない）"""
+
+    def __init__(self):
+        self.vectors = {}
+
+    def upsert(self, vectors, namespace=None, async_req=False, **kwargs):
+        for vector_id, values, metadata in vectors:
+            self.vectors[vector_id] = (values, metadata)
+        return SimpleNamespace(get=lambda: None)
+
+
+def test_cache_lru_eviction():
+    cache = EmbeddingCache(":memory:", max_entries=3)
+    cache.put_many({"a": [1.0], "b": [2.0], "c": [3.0]})
+    # "a" を参照して最近使用にする
+    assert cache.get_many(["a"]) == {"a": [1.0]}
+    cache.put_many({"d": [4.0]})
+    assert len(cache) == 3
+    assert set(cache.get_many(["a", "b", "c", "d"])) == {"a", "c", "d"}
+
+
+def test_cached_embeddings_batches_and_dedupes():
+    base = CountingEmbeddings()
+    embeddings = CachedEmbeddings(base, EmbeddingCache(":memory:"), batch_size=4)
+    texts = [f"チャンク{i % 6}" for i in range(12)]
+    first = embeddings.embed_documents(texts)
+    assert base.texts == 6 and base.calls == 2
+    # 2回目はキャッシュから返り、APIは呼ばれない
+    assert embeddings.embed_documents(texts) == first
+    assert base.calls == 2
+
+
+def test_reingest_directory_uses_cache():
+    base = CountingEmbeddings()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        analyzer = MaintenanceAnalyzer(
+            vector_backend="local", embeddings=base, llm=object(), data_dir=tmp_dir,
+            embedding_cache=EmbeddingCache(os.path.join(tmp_dir, "cache.sqlite"))
+        )
+        raw_dir = os.path.join(tmp_dir, "inspections", "raw")
+        for i in range(20):
+            record = {"inspection_date": f"2025-04-{i + 1:02d}", "machine_id": f"M{i:03d}",
+                      "findings": "異常なし", "measurements": {"vibration": "1.0mm/s"}}
+            with open(os.path.join(raw_dir, f"{i}.json"), 'w', encoding='utf-8') as f:
+                json.dump(record, f, ensure_ascii=False)
+
+        # 記録ログに保存された記録も合わせて取り込む
+        for i in range(20, 25):
+            analyzer.save_inspection_record({"inspection_date": f"2025-04-{i + 1:02d}", "machine_id": f"M{i:03d}",
+                                             "findings": "異常なし", "measurements": {"vibration": "1.0mm/s"}})
+
+        assert analyzer.ingest_inspection_directory() == 25
+        assert base.calls == 1
+        analyzer.ingest_inspection_directory()
+        assert base.calls == 1
+        assert len(analyzer.vectorstore) == 25
+
+
+def test_records_with_identical_text_keep_their_own_chunks():
+    base = CountingEmbeddings()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        analyzer = MaintenanceAnalyzer(
+            vector_backend="local", embeddings=base, llm=object(), data_dir=tmp_dir,
+            embedding_cache=EmbeddingCache(":memory:")
+        )
+        # 本文に現れない設置場所・状態だけが異なる記録
+        records = [{"inspection_date": "2025-04-01", "machine_id": "M001", "findings": "異常なし",
+                    "location": location, "status": status}
+                   for location, status in (("工場A", "normal"), ("工場B", "normal"), ("工場A", "warning"))]
+        analyzer.process_inspection_records(records)
+        analyzer.process_inspection_records(records)
+        assert len(analyzer.vectorstore) == 3
+        # 埋め込みは本文で共有する
+        assert base.calls == 1
+        for location in ("工場A", "工場B"):
+            docs = analyzer.vectorstore.similarity_search("異常なし", k=3, filter={"location": location})
+            assert docs and all(doc.metadata["location"] == location for doc in docs)
+
+
+def test_pinecone_store_uses_cached_embeddings():
+    base = CountingEmbeddings()
+    embeddings = CachedEmbeddings(base, EmbeddingCache(":memory:"))
+    index = FakePineconeIndex()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        store = LangchainPinecone(index, embeddings, "text")
+    # Embeddings でないものを渡すと、langchain は関数として呼び出す旨の警告を出す
+    assert not [w for w in caught if "Callable" in str(w.message)]
+    assert store.embeddings is embeddings
+
+    texts = ["ベアリングの摩耗", "ファンベルトの緩み"]
+    store.add_texts(texts, metadatas=[{"type": "inspection"} for _ in texts], ids=["a", "b"])
+    store.add_texts(texts, metadatas=[{"type": "inspection"} for _ in texts], ids=["a", "b"])
+    assert base.calls == 1
+    assert index.vectors["a"][0] == embeddings.embed_query("ベアリングの摩耗")
+    assert index.vectors["b"][1] == {"type": "inspection", "text": "ファンベルトの緩み"}
+
+
+if __name__ == "__main__":
+    test_cache_lru_eviction()
+    test_cached_embeddings_batches_and_dedupes()
+    test_reingest_directory_uses_cache()
+    test_records_with_identical_text_keep_their_own_chunks()
+    test_pinecone_store_uses_cached_embeddings()
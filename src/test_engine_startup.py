@@ -0,0 +1,95 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 新しいプロセスで ai_engine.main を読み込み、ネットワーク接続と重いクライアントの構築を調べる
+STARTUP_SCRIPT = r'''
+import sys
+import json
+import socket
+import asyncio
+
+connections = []
+
+
+def refuse(*args, **kwargs):
+    connections.append(repr(args[1:] if args and isinstance(args[0], socket.socket) else args))
+    raise OSError("network access is not allowed during this test")
+
+
+socket.socket.connect = refuse
+socket.socket.connect_ex = refuse
+socket.create_connection = refuse
+socket.getaddrinfo = refuse
+
+CLIENT_PACKAGES = ("openai", "pinecone", "langchain", "langchain_core", "langchain_community", "tiktoken")
+
+
+def loaded_clients():
+    return sorted(name for name in sys.modules if name.split(".")[0] in CLIENT_PACKAGES)
+
+
+from ai_engine import main as engine, predict_response
+
+report = {"after_import": loaded_clients()}
+
+import httpx
+# ai_engine が src/ を import パスに加えている
+from test_predict_response import _pipeline
+
+builds = []
+
+
+def build():
+    builds.append(1)
+    return _pipeline("ベルトを交換してください")
+
+
+predict_response.build_pipeline = build
+
+
+async def run():
+    async with engine.app.router.lifespan_context(engine.app):
+        transport = httpx.ASGITransport(app=engine.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            report["health"] = (await client.get("/api/health")).json()
+            report["builds_before_request"] = len(builds)
+            report["answers"] = [(await client.post("/api/predict", json={"query": "異音"})).json()
+                                 for _ in range(2)]
+
+asyncio.run(run())
+report["builds"] = len(builds)
+report["connections"] = connections
+print(json.dumps(report, ensure_ascii=False))
+'''
+
+
+def test_import_is_offline_and_pipeline_is_built_on_first_use():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = {**os.environ, "AI_ENGINE_WARMUP": "0", "ANALYSIS_JOBS_RESUME": "0",
+               "PYTHONPATH": ROOT_DIR, "OPENAI_API_KEY": "test", "PINECONE_API_KEY": "test"}
+        # 相対パスのデータディレクトリは一時ディレクトリに作らせる
+        script = os.path.join(tmp_dir, "startup.py")
+        with open(script, 'w', encoding='utf-8') as f:
+            f.write(STARTUP_SCRIPT)
+        result = subprocess.run([sys.executable, script], cwd=tmp_dir, env=env,
+                                capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+
+    # import 時は OpenAI・Pinecone・langchain を読み込まず、接続もしない
+    assert report["after_import"] == []
+    assert report["connections"] == []
+    # AI_ENGINE_WARMUP=0 では起動時に構築せず、最初のリクエストで1回だけ構築する
+    assert report["health"]["warmup"]["state"] == "pending"
+    assert report["builds_before_request"] == 0
+    assert report["builds"] == 1
+    assert report["answers"] == [{"answer": "ベルトを交換してください"}] * 2
+
+
+if __name__ == "__main__":
+    test_import_is_offline_and_pipeline_is_built_on_first_use()
@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import tempfile
+
+from ai_engine.blob_store import BlobStore
+from ai_engine.fault_data_loader import FaultDataLoader
+
+
+def _write_export(path, diagnostics, history=()):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"device_context": {"machine_id": "M001"}, "diagnostics": diagnostics,
+                   "conversation_history": list(history)}, f, ensure_ascii=False)
+
+
+def _loader(tmp_dir, **kwargs):
+    data_dir = os.path.join(tmp_dir, "exports")
+    os.makedirs(data_dir, exist_ok=True)
+    kwargs.setdefault("poll_interval", 0)
+    return FaultDataLoader(data_dir, blob_store=BlobStore(os.path.join(tmp_dir, "blobs")), **kwargs)
+
+
+def test_sections_are_cached_per_file_signature():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        loader = _loader(tmp_dir)
+        path = os.path.join(loader.data_dir, "export.json")
+        _write_export(path, {"code": "E01"})
+        os.utime(path, ns=(1_000_000_000, 1_000_000_000))
+
+        first = loader.get_diagnostics(path)
+        assert first == {"code": "E01"}
+        assert loader.get_diagnostics(path) is first
+        assert loader.load_fault_data(path)["device_context"] == {"machine_id": "M001"}
+
+        # 同じサイズで書き換えても mtime が変われば読み直す
+        _write_export(path, {"code": "E02"})
+        os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+        assert loader.get_diagnostics(path) == {"code": "E02"}
+
+        # mtime が同じでもサイズが変われば読み直す
+        _write_export(path, {"code": "E003"})
+        os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+        assert loader.get_diagnostics(path) == {"code": "E003"}
+
+        assert loader.load_section(path, "missing", "default") == "default"
+        assert loader.get_diagnostics(os.path.join(loader.data_dir, "none.json")) == {}
+
+
+def test_document_cache_is_bounded():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        loader = _loader(tmp_dir, max_cached_files=2)
+        paths = [os.path.join(loader.data_dir, f"{i}.json") for i in range(3)]
+        for i, path in enumerate(paths):
+            _write_export(path, {"code": i})
+            assert loader.get_diagnostics(path) == {"code": i}
+        assert list(loader._documents) == paths[1:]
+
+
+def test_latest_file_follows_in_place_rewrites():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        loader = _loader(tmp_dir)
+        first = os.path.join(loader.data_dir, "a.json")
+        second = os.path.join(loader.data_dir, "b.json")
+        _write_export(first, {"code": "A"})
+        # ctime の粒度より間を空ける
+        time.sleep(0.05)
+        _write_export(second, {"code": "B"})
+        assert loader.get_latest_fault_file() == second
+        assert loader.get_latest_section("diagnostics") == {"code": "B"}
+
+        # 既存ファイルの上書きはディレクトリの mtime を変えないため、リクエストではファイルを
+        # stat せず、次の走査で最新として選ばれる
+        dir_mtime = os.stat(loader.data_dir).st_mtime_ns
+        time.sleep(0.05)
+        _write_export(first, {"code": "A2"})
+        assert os.stat(loader.data_dir).st_mtime_ns == dir_mtime
+        assert loader.get_latest_fault_file() == second
+        assert loader.rescan() == first
+        assert loader.get_latest_fault_file() == first
+        assert loader.get_latest_fault_data()["diagnostics"] == {"code": "A2"}
+
+        # 追加・削除はディレクトリの一覧を読み直して反映する
+        time.sleep(0.05)
+        third = os.path.join(loader.data_dir, "c.json")
+        _write_export(third, {"code": "C"})
+        assert loader.get_latest_fault_file() == third
+        os.remove(third)
+        assert loader.get_latest_fault_file() == first
+        for path in (first, second):
+            os.remove(path)
+        assert loader.get_latest_fault_file() is None
+        assert loader.get_latest_fault_data() is None
+
+
+def test_background_poll_picks_up_in_place_rewrites():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        loader = _loader(tmp_dir, poll_interval=0.02)
+        try:
+            first = os.path.join(loader.data_dir, "a.json")
+            second = os.path.join(loader.data_dir, "b.json")
+            _write_export(first, {"code": "A"})
+            time.sleep(0.05)
+            _write_export(second, {"code": "B"})
+            assert loader.get_latest_fault_file() == second
+
+            time.sleep(0.05)
+            _write_export(first, {"code": "A2"})
+            deadline = time.monotonic() + 5
+            while loader.get_latest_fault_file() != first and time.monotonic() < deadline:
+                time.sleep(0.02)
+            assert loader.get_latest_fault_file() == first
+        finally:
+            loader.close()
+
+
+if __name__ == "__main__":
+    test_sections_are_cached_per_file_signature()
+    test_document_cache_is_bounded()
+    test_latest_file_follows_in_place_rewrites()
+    test_background_poll_picks_up_in_place_rewrites()
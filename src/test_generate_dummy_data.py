@@ -0,0 +1,75 @@
+import os
+import json
+import tempfile
+
+import numpy as np
+
+from generate_dummy_data import (SyntheticFleet, generate_dummy_inspection_data, save_dummy_data,
+                                 write_fault_exports, write_jsonl)
+from measurement_store import parse_inspection_date, parse_measurement
+
+
+def test_records_have_independent_measurements():
+    records = generate_dummy_inspection_data(50, seed=1)
+    assert len(records) == 50
+    assert len({json.dumps(record["measurements"]) for record in records}) == 50
+
+    # 台数を指定すると、その台数の機械だけの記録になる
+    records = generate_dummy_inspection_data(30, seed=1, num_machines=3)
+    assert {record["machine_id"] for record in records} == {"M001", "M002", "M003"}
+
+
+def test_seeded_generation_is_deterministic():
+    first = list(SyntheticFleet(seed=7).iter_records(300, batch_size=300))
+    second = list(SyntheticFleet(seed=7).iter_records(300, batch_size=300))
+    assert first == second
+    assert list(SyntheticFleet(seed=8).iter_records(300)) != first
+
+
+def test_time_series_degrade_and_fail():
+    fleet = SyntheticFleet(num_machines=4, seed=3, fault_rate=0.0)
+    records = list(fleet.iter_records(4 * 500))
+    by_machine = {}
+    for record in records:
+        by_machine.setdefault(record["machine_id"], []).append(record)
+
+    for machine_records in by_machine.values():
+        timestamps = [parse_inspection_date(record["inspection_date"]) for record in machine_records]
+        # 同じ機械の点検日時は重ならず、時刻順に並ぶ
+        assert timestamps == sorted(set(timestamps))
+        # 保全周期の最後に故障が起きる
+        assert any(record["ground_truth"]["fault_event"] for record in machine_records)
+
+    # 劣化が進んだ記録ほど故障モードの測定項目が悪化している
+    vibration_machines = [records for records in by_machine.values()
+                          if records[0]["ground_truth"]["failure_mode"] == "振動異常"]
+    for machine_records in vibration_machines:
+        healthy = [parse_measurement(r["measurements"]["vibration"])[0] for r in machine_records
+                   if r["ground_truth"]["degradation"] == 0]
+        worn = [parse_measurement(r["measurements"]["vibration"])[0] for r in machine_records
+                if r["ground_truth"]["degradation"] > 0.8]
+        assert np.mean(worn) > np.mean(healthy) + 1.5
+
+
+def test_jsonl_and_fault_exports():
+    fleet = SyntheticFleet(num_machines=5, seed=0)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "inspections.jsonl")
+        assert write_jsonl(fleet.iter_batches(1000, batch_size=128), path) == 1000
+        with open(path, 'r', encoding='utf-8') as f:
+            assert sum(1 for _ in f) == 1000
+
+        faults_dir = os.path.join(tmp_dir, "faults")
+        assert write_fault_exports(fleet.iter_records(1000), faults_dir, max_exports=3) == 3
+        with open(os.path.join(faults_dir, "fault_001.json"), 'r', encoding='utf-8') as f:
+            export = json.load(f)
+        assert set(export) == {"session_id", "timestamp", "user_id", "device_context",
+                               "conversation_history", "diagnostics", "metadata"}
+        assert export["metadata"]["message_count"] == len(export["conversation_history"])
+
+
+def test_save_dummy_data_keeps_records_sharing_a_second():
+    record = generate_dummy_inspection_data(1, seed=0)[0]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        save_dummy_data([record, dict(record), dict(record)], tmp_dir)
+        assert len(os.listdir(tmp_dir)) == 3
@@ -0,0 +1,113 @@
+import os
+import json
+import asyncio
+import tempfile
+from datetime import datetime
+
+import httpx
+
+from ai_engine import main as engine
+
+from inspection_index import InspectionIndex
+from record_log import RecordLog
+
+
+def _record(machine_id, date, status="正常", location="東京車両基地"):
+    return {
+        "machine_id": machine_id,
+        "inspection_date": date,
+        "location": location,
+        "inspection_type": "定期点検",
+        "status": status,
+    }
+
+
+def test_query_by_fields_and_date_range():
+    index = InspectionIndex.build([
+        ("a", _record("M001", "2024-01-10 09:00:00")),
+        ("b", _record("M001", "2024-02-10 09:00:00", status="要注意")),
+        ("c", _record("M002", "2024-02-15 09:00:00", status="要注意", location="大阪車両基地")),
+        ("d", _record("M001", "2024-03-10 09:00:00")),
+    ])
+
+    assert [record_id for record_id, _ in index.query(machine_id="M001")] == ["d", "b", "a"]
+    assert [record_id for record_id, _ in index.query(status="要注意")] == ["c", "b"]
+    assert [record_id for record_id, _ in index.query(machine_id="M001", status="要注意")] == ["b"]
+    # 日時範囲は start 以上 end 未満
+    in_february = index.query(start=datetime(2024, 2, 1), end=datetime(2024, 3, 1))
+    assert [record_id for record_id, _ in in_february] == ["c", "b"]
+    assert [record_id for record_id, _ in index.query(machine_id="M001", start=datetime(2024, 2, 1),
+                                                      limit=1)] == ["d"]
+    assert index.query(machine_id="M999") == []
+    assert index.values("location") == ["大阪車両基地", "東京車両基地"]
+
+
+def test_add_replaces_existing_record():
+    index = InspectionIndex()
+    index.add("a", _record("M001", "2024-01-10 09:00:00", status="要注意"))
+    index.add("b", _record("M002", "2024-01-05 09:00:00"))
+    index.add("a", _record("M001", "2024-01-20 09:00:00"))
+
+    assert len(index) == 2
+    assert index.query(status="要注意") == []
+    assert [record_id for record_id, _ in index.query()] == ["a", "b"]
+
+
+def test_refresh_picks_up_records_from_log_and_directory():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_dir = os.path.join(tmp_dir, "log")
+        raw_dir = os.path.join(tmp_dir, "raw")
+        os.makedirs(raw_dir)
+        with open(os.path.join(raw_dir, "legacy.json"), 'w', encoding='utf-8') as f:
+            json.dump(_record("M003", "2023-12-01 09:00:00"), f)
+
+        writer = RecordLog(log_dir)
+        first = writer.append(_record("M001", "2024-01-10 09:00:00"))
+
+        index = InspectionIndex(RecordLog(log_dir, read_only=True), raw_dir=raw_dir)
+        assert index.refresh() == 2
+
+        # 別のプロセスが追記した記録は refresh() で取り込まれる
+        second = writer.append(_record("M001", "2024-02-10 09:00:00"))
+        assert index.refresh() == 1
+        assert index.refresh() == 0
+        assert [record_id for record_id, _ in index.query(machine_id="M001")] == [second, first]
+        assert [record_id for record_id, _ in index.query(end=datetime(2024, 1, 1))] == ["legacy"]
+        writer.close()
+
+
+def test_undated_records_are_returned_without_a_date_condition():
+    index = InspectionIndex.build([
+        ("a", _record("M001", "2024-01-10 09:00:00")),
+        ("x", _record("M001", "不明")),
+        ("b", _record("M002", "2024-02-10 09:00:00")),
+        ("y", _record("M001", None)),
+    ])
+    # 日時のある記録の後に、日時のない記録を追加の新しい順で返す
+    assert [record_id for record_id, _ in index.query()] == ["b", "a", "y", "x"]
+    assert [record_id for record_id, _ in index.query(machine_id="M001")] == ["a", "y", "x"]
+    assert [record_id for record_id, _ in index.query(limit=3)] == ["b", "a", "y"]
+    # 日時の条件がある検索には含めない
+    assert [record_id for record_id, _ in index.query(start=datetime(2024, 1, 1))] == ["b", "a"]
+    assert [record_id for record_id, _ in index.query(machine_id="M001", end=datetime(2025, 1, 1))] == ["a"]
+
+    # 日時を付けて置き換えると日時の順に並ぶ
+    index.add("x", _record("M001", "2024-03-01 09:00:00"))
+    assert [record_id for record_id, _ in index.query()] == ["x", "b", "a", "y"]
+
+
+def test_inspections_limit_must_be_positive():
+    async def run():
+        transport = httpx.ASGITransport(app=engine.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [await client.get("/api/inspections", params={"limit": limit}) for limit in (0, -1)]
+
+    assert [response.status_code for response in asyncio.run(run())] == [422, 422]
+
+
+if __name__ == "__main__":
+    test_query_by_fields_and_date_range()
+    test_add_replaces_existing_record()
+    test_refresh_picks_up_records_from_log_and_directory()
+    test_undated_records_are_returned_without_a_date_condition()
+    test_inspections_limit_must_be_positive()
@@ -0,0 +1,79 @@
+import os
+import json
+import tempfile
+
+import pytest
+
+from ai_engine.json_sections import index_object, iter_array, load_span, read_sections, skip_value
+
+DOCUMENT = {
+    "session_id": 12,
+    "device_context": {"environment": "工場A", "brackets": "{[\"]}", "escaped": "a\\\\\"b"},
+    "conversation_history": [
+        {"id": 1, "content": "ベアリング異常", "base64_images": {"a.png": "QUJD" * 300}},
+        {"id": 2, "content": "", "media": []},
+        3.5,
+        None,
+    ],
+    "flag": True,
+    "diagnostics": {"components": ["ベアリング"], "nested": [[1, 2], {"x": [None]}]},
+}
+
+
+def _encode(document) -> bytes:
+    return json.dumps(document, ensure_ascii=False, indent=1).encode('utf-8')
+
+
+def test_sections_match_json_loads():
+    buf = _encode(DOCUMENT)
+    spans = index_object(buf)
+    assert list(spans) == list(DOCUMENT)
+    for key, span in spans.items():
+        assert load_span(buf, span) == DOCUMENT[key]
+
+    history = [load_span(buf, span) for span in iter_array(buf, spans["conversation_history"])]
+    assert history == DOCUMENT["conversation_history"]
+    assert [load_span(buf, span) for span in iter_array(b"[ ]", (0, 3))] == []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "export.json")
+        with open(path, 'wb') as f:
+            f.write(buf)
+        assert read_sections(path, ["diagnostics", "missing"]) == {"diagnostics": DOCUMENT["diagnostics"]}
+        # 空のファイルはオブジェクトではない
+        open(path, 'wb').close()
+        with pytest.raises(ValueError):
+            read_sections(path, ["diagnostics"])
+
+
+def test_truncated_documents_are_rejected():
+    buf = _encode(DOCUMENT)
+    # キーの途中・長い文字列の途中・入れ子の途中・閉じ括弧の直前で途切れたファイル
+    for end in (1, len(buf) // 4, len(buf) // 2, len(buf) * 9 // 10, len(buf) - 2, len(buf) - 1):
+        with pytest.raises(ValueError):
+            index_object(buf[:end])
+
+
+def test_malformed_documents_are_rejected():
+    for text in (b'[1, 2]', b'{1: 2}', b'{"a" 1}', b'{"a": "unterminated}', b'{"a": [1, 2}', b'   '):
+        with pytest.raises(ValueError):
+            index_object(text)
+
+
+def test_malformed_section_does_not_hide_the_others():
+    # 括弧の対応が崩れたセクションは、そのセクションの読み込みだけが失敗する
+    buf = b'{"broken": [1, {"x": 2]], "ok": {"value": 1}}'
+    spans = index_object(buf)
+    assert load_span(buf, spans["ok"]) == {"value": 1}
+    with pytest.raises(json.JSONDecodeError):
+        load_span(buf, spans["broken"])
+    with pytest.raises(ValueError):
+        list(iter_array(buf, spans["ok"]))
+    assert skip_value(b'12, 3', 0) == 2
+
+
+if __name__ == "__main__":
+    test_sections_match_json_loads()
+    test_truncated_documents_are_rejected()
+    test_malformed_documents_are_rejected()
+    test_malformed_section_does_not_hide_the_others()
@@ -0,0 +1,72 @@
+import tempfile
+
+from langchain_community.chat_models.fake import FakeListChatModel
+
+from embedding_cache import EmbeddingCache
+from fake_backends import HashEmbeddings
+from lexical_index import NgramBM25Index, is_identifier_query, reciprocal_rank_fusion
+from test_retrieval import CountingQueryEmbeddings
+from vector_store import Document, LocalVectorStore
+from vectorize_and_predict import MaintenanceAnalyzer, RETRIEVAL_SOURCES
+
+
+def _record_text(machine_id, location):
+    return f"機械ID: {machine_id} 設置場所: {location} 点検結果: モーターの異常振動を検知"
+
+
+def test_bm25_ranks_exact_identifiers_first():
+    index = NgramBM25Index()
+    index.add_texts([_record_text(machine_id, location) for machine_id, location in
+                     [("M12", "工場A-1階"), ("M123", "工場B-5階"), ("M1234", "工場B-2階"), ("M023", "工場C-5階")]],
+                    ids=["a", "b", "c", "d"])
+    assert index.add_texts([_record_text("M12", "工場A-1階")], ids=["a"]) == 0
+
+    assert "M123 " in index.search("モーターM123", k=1)[0][0].page_content
+    assert "工場B-5階" in index.search("工場B-5階", k=1)[0][0].page_content
+    assert index.search("ギアボックス", k=3) == []
+
+
+def test_index_is_persisted_incrementally():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = NgramBM25Index(tmp_dir)
+        index.add_texts(["油圧が低下傾向"], [{"type": "failure"}], ids=["1"])
+        index.add_texts(["モーターの温度が上昇傾向"], [{"type": "knowledge"}], ids=["2"])
+
+        reloaded = NgramBM25Index(tmp_dir)
+        assert len(reloaded) == 2 and "2" in reloaded
+        assert reloaded.search("上昇", filter={"type": "failure"}) == []
+        assert reloaded.search("上昇", filter={"type": {"$in": ["knowledge"]}})[0][1] > 0
+
+
+def test_rrf_merges_rankings_by_content():
+    a, b, c = (Document(page_content=text) for text in "abc")
+    fused = reciprocal_rank_fusion([(a, 0.9), (b, 0.8)], [(b, 12.0), (c, 3.0)], limit=2)
+    assert [doc.page_content for doc, _ in fused] == ["b", "a"]
+
+
+def test_identifier_queries_skip_the_embedding():
+    assert is_identifier_query("モーターM123")
+    assert is_identifier_query("工場B-5階")
+    assert not is_identifier_query("モーターM001で温度上昇が続いている")
+    assert not is_identifier_query("温度上昇")
+
+    embeddings = CountingQueryEmbeddings()
+    store = LocalVectorStore(HashEmbeddings())
+    texts = [_record_text(f"M{i:03d}", "工場A-1階") for i in range(200)]
+    store.add_texts(texts, [{"type": "inspection"} for _ in texts])
+    store.add_texts(["故障事例", "技術ナレッジ"], [{"type": "failure"}, {"type": "knowledge"}])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        analyzer = MaintenanceAnalyzer(
+            embeddings=embeddings, vectorstore=store, data_dir=tmp_dir,
+            llm=FakeListChatModel(responses=["1. 原因分析"]),
+            embedding_cache=EmbeddingCache(":memory:")
+        )
+        result = analyzer.analyze_failure_cause("モーターM123")
+        assert embeddings.query_calls == 0
+        assert set(result["retrieval_timings"]) == {"total", *RETRIEVAL_SOURCES}
+
+        # ハイブリッド検索では ID が一致する記録が埋め込みの順位に関わらず上位 k 件に入る
+        retrieval = analyzer.retrieve_context("モーターM077の振動について", k=3)
+        assert embeddings.query_calls == 1
+        assert any("M077 " in doc.page_content for doc in retrieval["documents"]["inspection"])
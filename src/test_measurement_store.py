@@ -0,0 +1,134 @@
+import os
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from measurement_store import MeasurementStore, parse_measurement
+
+
+def test_parse_measurement():
+    assert parse_measurement("88.2°C") == (88.2, "°C")
+    assert parse_measurement("114.3A") == (114.3, "A")
+    assert parse_measurement("2.5mm/s") == (2.5, "mm/s")
+    assert parse_measurement("0.76") == (0.76, "")
+    assert parse_measurement("測定不能") == (None, "")
+
+
+def test_series_by_machine_and_time():
+    records = [
+        {"machine_id": "M015", "inspection_date": "2025-04-02 07:05:40",
+         "measurements": {"temperature": "88.2°C", "current": "114.3A"}},
+        {"machine_id": "M015", "inspection_date": "2025-03-31 21:40:40",
+         "measurements": {"vibration": "2.5mm/s", "temperature": "70.0°C"}},
+        {"machine_id": "M001", "inspection_date": "2025-04-01 15:05:40",
+         "measurements": {"oil_pressure": "3.1MPa"}},
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MeasurementStore(tmp_dir)
+        assert store.append(records) == 3
+        # 同じ記録の再取り込みでは行が増えない
+        assert store.append(records) == 0
+
+        # 再読み込みしても時刻順の列として取り出せる
+        store = MeasurementStore(tmp_dir)
+        assert store.machine_ids() == ["M001", "M015"]
+        assert store.units["temperature"] == "°C"
+        series = store.series("M015", ["temperature", "vibration"])
+        assert series["temperature"].tolist() == [70.0, 88.2]
+        assert series["vibration"][0] == 2.5 and np.isnan(series["vibration"][1])
+
+        series = store.series("M015", ["current"], start=datetime(2025, 4, 1))
+        assert series["current"].tolist() == [114.3]
+
+
+def test_machine_ids_cannot_leave_the_store():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        root = os.path.join(tmp_dir, "measurements")
+        store = MeasurementStore(root)
+        records = [{"machine_id": machine_id, "inspection_date": "2025-04-01",
+                    "measurements": {"temperature": "70.0°C"}}
+                   for machine_id in ("../escape", "/tmp/abs", "M 001", "M-001_a")]
+        assert store.append(records) == 1
+        assert store.machine_ids() == ["M-001_a"]
+        assert sorted(os.listdir(tmp_dir)) == ["measurements"]
+        with pytest.raises(ValueError):
+            store.series("../escape")
+
+
+def test_units_are_converted_or_rejected():
+    records = [
+        {"machine_id": "M001", "inspection_date": "2025-04-01", "measurements": {"temperature": "50.0°C"}},
+        {"machine_id": "M001", "inspection_date": "2025-04-02", "measurements": {"temperature": "212°F"}},
+        {"machine_id": "M001", "inspection_date": "2025-04-03", "measurements": {"temperature": 60}},
+        {"machine_id": "M001", "inspection_date": "2025-04-04",
+         "measurements": {"temperature": "3.0mm/s", "current": "1500mA"}},
+        {"machine_id": "M001", "inspection_date": "2025-04-05", "measurements": {"current": "2.0A"}},
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MeasurementStore(tmp_dir)
+        assert store.append(records) == 5
+        assert MeasurementStore(tmp_dir).units == {"temperature": "°C", "current": "mA"}
+        series = store.series("M001")
+        assert np.allclose(series["temperature"][:3], [50.0, 100.0, 60.0])
+        # 換算できない単位の値は欠測になる
+        assert np.isnan(series["temperature"][3])
+        assert series["current"][3:].tolist() == [1500.0, 2000.0]
+
+
+def test_appends_write_segments_and_compact():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MeasurementStore(tmp_dir)
+        reader = MeasurementStore(tmp_dir)
+        segments_dir = os.path.join(tmp_dir, "M001" + MeasurementStore.SEGMENTS_SUFFIX)
+        for day in range(150):
+            record = {"machine_id": "M001", "inspection_date": f"2025-01-01 00:{day // 60:02d}:{day % 60:02d}",
+                      "measurements": {"vibration": f"{day}mm/s"}}
+            assert store.append([record]) == 1
+            # 追加分だけをセグメントに書き、たまったら1つのファイルに統合する
+            assert len(os.listdir(segments_dir)) < MeasurementStore.COMPACT_SEGMENTS
+            if day % 50 == 0:
+                assert reader.series("M001")["vibration"].tolist() == list(map(float, range(day + 1)))
+
+        assert os.path.exists(os.path.join(tmp_dir, "M001.npz"))
+        assert store.machine_ids() == ["M001"]
+        assert MeasurementStore(tmp_dir).series("M001")["vibration"].tolist() == list(map(float, range(150)))
+
+
+def test_records_sharing_a_timestamp_are_kept():
+    records = [
+        {"machine_id": "M001", "inspection_date": "2025-04-01", "measurements": {"vibration": "1.0mm/s"}},
+        {"machine_id": "M001", "inspection_date": "2025-04-01", "measurements": {"vibration": "2.0mm/s"}},
+        {"machine_id": "M001", "inspection_date": "2025-04-01 00:00:00", "measurements": {"temperature": "40°C"}},
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = MeasurementStore(tmp_dir)
+        assert store.append(records) == 3
+        # 同じ記録の再取り込みは行を増やさない
+        assert store.append(records[:2]) == 0
+        series = MeasurementStore(tmp_dir).series("M001")
+        assert len(series["timestamp"]) == 3
+        assert sorted(series["vibration"][~np.isnan(series["vibration"])].tolist()) == [1.0, 2.0]
+
+
+def test_units_written_by_another_store_are_kept():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        first, second = MeasurementStore(tmp_dir), MeasurementStore(tmp_dir)
+        first.append([{"machine_id": "M001", "inspection_date": "2025-04-01",
+                       "measurements": {"temperature": "50°C"}}])
+        # 先に開いた別のストア（別プロセス）も、保存済みの単位を読み直して換算・追記する
+        second.append([{"machine_id": "M002", "inspection_date": "2025-04-01",
+                        "measurements": {"temperature": "212°F", "current": "2.0A"}}])
+        assert MeasurementStore(tmp_dir).units == {"temperature": "°C", "current": "A"}
+        assert second.series("M002")["temperature"].tolist() == [100.0]
+
+
+if __name__ == "__main__":
+    test_parse_measurement()
+    test_series_by_machine_and_time()
+    test_machine_ids_cannot_leave_the_store()
+    test_units_are_converted_or_rejected()
+    test_appends_write_segments_and_compact()
+    test_records_sharing_a_timestamp_are_kept()
+    test_units_written_by_another_store_are_kept()
@@ -0,0 +1,39 @@
+import contextvars
+
+from metrics import (MetricsRegistry, observe_stage, registry, server_timing_header,
+                     stage_timer, start_request_timings)
+
+
+def test_histogram_renders_cumulative_prometheus_buckets():
+    metrics = MetricsRegistry()
+    histogram = metrics.histogram("test_seconds", "test", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value, stage="llm")
+    metrics.counter("test_total", "test").inc(2, cache="answer", result="hit")
+
+    lines = metrics.render().splitlines()
+    assert 'test_seconds_bucket{stage="llm",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{stage="llm",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{stage="llm",le="+Inf"} 4' in lines
+    assert 'test_seconds_count{stage="llm"} 4' in lines
+    assert "# TYPE test_total counter" in lines
+    assert 'test_total{cache="answer",result="hit"} 2' in lines
+
+
+def test_request_timings_are_collected_only_when_enabled():
+    def request():
+        timings = start_request_timings()
+        with stage_timer("embedding"):
+            pass
+        observe_stage("vector_search", 0.002, source="failure")
+        observe_stage("vector_search", 0.003, source="failure")
+        return timings
+
+    timings = contextvars.copy_context().run(request)
+    assert set(timings) == {"embedding", "vector_search_failure"}
+    assert abs(timings["vector_search_failure"] - 0.005) < 1e-9
+    assert server_timing_header({"llm": 0.25}) == "llm;dur=250.00"
+
+    # 有効にしていないコンテキストでは内訳を集計しない（ヒストグラムには記録される）
+    observe_stage("embedding", 0.001)
+    assert 'stage="embedding"' in registry.render()
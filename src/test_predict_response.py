@@ -0,0 +1,72 @@
+import threading
+from typing import List
+
+from langchain_community.chat_models.fake import FakeListChatModel
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+from ai_engine import predict_response
+
+
+class StaticRetriever(BaseRetriever):
+    """テスト用: 常に同じ文書を返すリトリーバー"""
+    texts: List[str]
+
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [Document(page_content=text, metadata={"type": "knowledge"}) for text in self.texts]
+
+
+def _pipeline(answer: str) -> predict_response.PredictionPipeline:
+    return predict_response.PredictionPipeline(FakeListChatModel(responses=[answer] * 10),
+                                               StaticRetriever(texts=["ファンベルトの張りを点検する"]))
+
+
+def test_pipeline_is_built_once_and_shared():
+    builds = []
+    barrier = threading.Barrier(4)
+
+    def build():
+        builds.append(1)
+        return _pipeline("ベルトを交換してください")
+
+    original = predict_response.build_pipeline
+    predict_response.build_pipeline = build
+    predict_response.set_pipeline(None)
+    try:
+        answers = []
+
+        def request():
+            barrier.wait()
+            answers.append(predict_response.generate_response("異音がする"))
+        threads = [threading.Thread(target=request) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        events = list(predict_response.stream_response("異音がする"))
+
+        # 同時の初回リクエストでも構築は1回だけで、以降のリクエストは同じパイプラインを使う
+        assert len(builds) == 1
+        assert answers == ["ベルトを交換してください"] * 4
+        assert events[0]["data"]["sources"][0]["preview"] == "ファンベルトの張りを点検する"
+        assert events[-1]["data"]["answer"] == "ベルトを交換してください"
+        assert predict_response.get_pipeline() is predict_response.get_pipeline()
+
+        # set_pipeline で差し替えたものが使われ、None に戻すと次の利用時に構築し直す
+        replacement = _pipeline("油圧を確認してください")
+        predict_response.set_pipeline(replacement)
+        assert predict_response.get_pipeline() is replacement
+        assert predict_response.generate_response("圧力低下") == "油圧を確認してください"
+        predict_response.set_pipeline(None)
+        rebuilt = predict_response.get_pipeline()
+        assert rebuilt is not replacement
+        assert len(builds) == 2
+    finally:
+        predict_response.build_pipeline = original
+        predict_response.set_pipeline(None)
+
+
+if __name__ == "__main__":
+    test_pipeline_is_built_once_and_shared()
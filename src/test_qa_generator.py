@@ -0,0 +1,139 @@
+import os
+import sys
+import json
+import asyncio
+import tempfile
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+from qa_generator import StubChatClient, run  # noqa: E402
+
+
+def _api_error(error_class, status):
+    request = httpx.Request("POST", "https://api.openai.com/v1/chat/completions")
+    return error_class(f"{status}", response=httpx.Response(status, request=request), body=None)
+
+
+class ScriptedChatClient(StubChatClient):
+    """テスト用: チャンクごとに決めた応答を返すスタブ
+
+    "error" はレート制限、"timeout" はタイムアウト、"auth" は認証エラーの例外を送出し、
+    それ以外は本文として返す。
+    """
+
+    def __init__(self, replies):
+        super().__init__(latency=0)
+        self.replies = replies
+        self.calls = {}
+
+    async def _create(self, model, messages, **kwargs):
+        content = messages[-1]["content"].split("--- 内容 ---")[-1].split("--- 出力形式 ---")[0].strip()
+        self.calls[content] = self.calls.get(content, 0) + 1
+        replies = self.replies.get(content)
+        if replies is None:
+            return await super()._create(model, messages, **kwargs)
+        reply = replies[min(self.calls[content], len(replies)) - 1]
+        if reply == "error":
+            raise _api_error(openai.RateLimitError, 429)
+        if reply == "timeout":
+            raise openai.APITimeoutError(request=httpx.Request("POST", "https://api.openai.com"))
+        if reply == "auth":
+            raise _api_error(openai.AuthenticationError, 401)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+
+def _chunks(count):
+    return [{"id": i, "source": "manual.txt", "content": f"チャンク{i}"} for i in range(count)]
+
+
+def _read(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_retries_then_records_failures():
+    replies = {
+        # 一時的な失敗（レート制限・タイムアウト）のあと成功する
+        "チャンク1": ["error", "timeout", '{"question": "Q1", "answer": "A1"}'],
+        # 形が違う応答は再試行せずに失敗として数え、ほかのチャンクの処理は止めない
+        "チャンク2": ['["Q2", "A2"]'],
+        "チャンク3": ['{"question": "Q3"}'],
+        "チャンク4": ["error"],
+    }
+    client = ScriptedChatClient(replies)
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "qa.jsonl")
+        stats = asyncio.run(run(iter(_chunks(20)), output, client, concurrency=3,
+                                requests_per_minute=60000, max_retries=2, base_delay=0.001))
+
+        assert stats == {"generated": 17, "failed": 3, "skipped": 0}
+        assert client.calls["チャンク1"] == 3
+        assert client.calls["チャンク2"] == 1
+        assert client.calls["チャンク4"] == 3
+        qa_by_id = {qa["id"]: qa for qa in _read(output)}
+        assert set(qa_by_id) == set(range(20)) - {2, 3, 4}
+        assert qa_by_id[1]["question"] == "Q1"
+        assert qa_by_id[1]["source"] == "manual.txt"
+
+
+def test_resume_skips_generated_chunks():
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "qa.jsonl")
+        failing = ScriptedChatClient({f"チャンク{i}": ["error"] for i in range(5, 10)})
+        first = asyncio.run(run(iter(_chunks(10)), output, failing, concurrency=2,
+                                requests_per_minute=60000, max_retries=0))
+        assert first == {"generated": 5, "failed": 5, "skipped": 0}
+        # 書き込み途中で中断された行があっても再開できる
+        with open(output, 'a', encoding='utf-8') as f:
+            f.write('{"question": "途中')
+
+        client = ScriptedChatClient({})
+        second = asyncio.run(run(iter(_chunks(10)), output, client, concurrency=2,
+                                 requests_per_minute=60000, max_retries=0))
+        assert second == {"generated": 5, "failed": 0, "skipped": 5}
+        assert set(client.calls) == {f"チャンク{i}" for i in range(5, 10)}
+
+
+def test_queue_is_fed_incrementally():
+    pulled = []
+
+    def chunks():
+        for chunk in _chunks(100):
+            pulled.append(chunk["id"])
+            yield chunk
+
+    class WatchingClient(StubChatClient):
+        async def _create(self, model, messages, **kwargs):
+            # 最初の応答の時点では、入力はキューの上限程度しか読まれていない
+            self.pulled_at_first_call = getattr(self, "pulled_at_first_call", len(pulled))
+            return await super()._create(model, messages, **kwargs)
+
+    client = WatchingClient(latency=0)
+    with tempfile.TemporaryDirectory() as tmp:
+        stats = asyncio.run(run(chunks(), os.path.join(tmp, "qa.jsonl"), client, concurrency=2,
+                                requests_per_minute=60000))
+    assert stats["generated"] == 100
+    assert client.pulled_at_first_call <= 2 * 2 + 2 + 1
+
+
+def test_other_errors_are_raised_without_retrying():
+    client = ScriptedChatClient({"チャンク3": ["auth"]})
+    with tempfile.TemporaryDirectory() as tmp:
+        with pytest.raises(openai.AuthenticationError):
+            asyncio.run(run(iter(_chunks(20)), os.path.join(tmp, "qa.jsonl"), client, concurrency=2,
+                            requests_per_minute=60000, max_retries=5, base_delay=0.001))
+    assert client.calls["チャンク3"] == 1
+    # 失敗した時点で残りのチャンクは問い合わせない
+    assert len(client.calls) < 20
+
+
+if __name__ == "__main__":
+    test_retries_then_records_failures()
+    test_resume_skips_generated_chunks()
+    test_queue_is_fed_incrementally()
+    test_other_errors_are_raised_without_retrying()
+    print("✅ qa_generator のテストが通りました")
@@ -0,0 +1,147 @@
+import os
+import json
+import tempfile
+import threading
+
+import pytest
+
+from record_log import LogLockedError, RecordLog, iter_record_sources, migrate_directory
+
+
+def test_append_rotate_and_read_by_id():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log = RecordLog(tmp_dir, segment_size=200, fsync_every=4)
+        ids = [log.append({"machine_id": f"M{i:03d}", "findings": "異常なし"}) for i in range(10)]
+        # 同じ秒に保存しても IDは衝突しない
+        assert len(set(ids)) == 10
+        assert len([f for f in os.listdir(tmp_dir) if f.endswith('.jsonl')]) > 1
+        log.close()
+
+        log = RecordLog(tmp_dir)
+        assert log.get(ids[7]) == {"machine_id": "M007", "findings": "異常なし"}
+        assert [record_id for record_id, _ in log] == ids
+
+
+def test_recovers_from_interrupted_write():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log = RecordLog(tmp_dir)
+        first = log.append({"n": 1})
+        log.close()
+        # 索引に載る前に中断された行と、書きかけの行を再現する
+        with open(os.path.join(tmp_dir, "segment-000001.jsonl"), 'ab') as f:
+            f.write(b'{"id": "late", "record": {"n": 2}}\n{"id": "bro')
+
+        log = RecordLog(tmp_dir)
+        assert log.ids() == [first, "late"]
+        third = log.append({"n": 3})
+        assert log.get(third) == {"n": 3}
+        assert log.get("late") == {"n": 2}
+
+
+def test_second_writer_is_refused():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        writer = RecordLog(tmp_dir)
+        first = writer.append({"n": 1})
+        # 書きかけの行（書き手がまだ追記中）
+        writer._segment.write(b'{"id": "pending", "rec')
+        writer._segment.flush()
+
+        with pytest.raises(LogLockedError):
+            RecordLog(tmp_dir)
+        # 2つ目の書き手が末尾を切り詰めていない
+        with open(os.path.join(tmp_dir, "segment-000001.jsonl"), 'rb') as f:
+            assert f.read().endswith(b'{"id": "pending", "rec')
+
+        reader = RecordLog(tmp_dir, read_only=True)
+        assert reader.get(first) == {"n": 1}
+        with pytest.raises(ValueError):
+            reader.append({"n": 2})
+
+        writer._segment.write(b'ord": {"n": 2}}\n')
+        writer.close()
+        reopened = RecordLog(tmp_dir)
+        assert reopened.ids() == [first, "pending"]
+        reopened.close()
+
+
+def test_analyzers_open_the_logs_only_to_write():
+    from fake_backends import HashEmbeddings
+    from vectorize_and_predict import MaintenanceAnalyzer
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ingest = MaintenanceAnalyzer(embeddings=HashEmbeddings(), vector_backend="local", data_dir=tmp_dir)
+        record_id = ingest.save_inspection_record({"machine_id": "M001", "inspection_date": "2024-01-01"})
+        # 検索・参照だけの分析器は書き手にならない
+        reader = MaintenanceAnalyzer(embeddings=HashEmbeddings(), vector_backend="local", data_dir=tmp_dir)
+        assert [record_id for record_id, _ in reader.query_inspections(machine_id="M001")] == [record_id]
+        with pytest.raises(LogLockedError):
+            reader.save_inspection_record({"machine_id": "M002"})
+        ingest.close()
+        reader.save_inspection_record({"machine_id": "M002"})
+        reader.close()
+
+
+def test_inspection_index_is_built_once_under_concurrent_access():
+    from fake_backends import HashEmbeddings
+    from vectorize_and_predict import MaintenanceAnalyzer
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        analyzer = MaintenanceAnalyzer(embeddings=HashEmbeddings(), vector_backend="local", data_dir=tmp_dir)
+        for i in range(200):
+            analyzer.save_inspection_record({"machine_id": f"M{i % 5:03d}", "inspection_date": "2024-01-01"})
+        analyzer.close()
+
+        analyzer = MaintenanceAnalyzer(embeddings=HashEmbeddings(), vector_backend="local", data_dir=tmp_dir)
+        barrier = threading.Barrier(9)
+        indexes = []
+
+        def read():
+            barrier.wait()
+            indexes.append(analyzer.inspection_index)
+
+        def write():
+            barrier.wait()
+            for _ in range(20):
+                analyzer.save_inspection_record({"machine_id": "M999", "inspection_date": "2024-02-01"})
+        threads = [threading.Thread(target=read) for _ in range(8)] + [threading.Thread(target=write)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # 同時に参照しても索引は1つだけで、構築中に保存された記録も含まれる
+        assert len({id(index) for index in indexes}) == 1
+        assert len(analyzer.query_inspections(machine_id="M999")) == 20
+        assert len(analyzer.inspection_index) == 220
+        analyzer.close()
+
+
+def test_migrate_directory_is_idempotent():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        raw_dir = os.path.join(tmp_dir, "raw")
+        os.makedirs(raw_dir)
+        for i in range(3):
+            with open(os.path.join(raw_dir, f"2025040{i}_000000_inspection.json"), 'w', encoding='utf-8') as f:
+                json.dump({"machine_id": f"M00{i}"}, f)
+        log = RecordLog(os.path.join(tmp_dir, "log"))
+        assert migrate_directory(raw_dir, log) == 3
+        assert migrate_directory(raw_dir, log) == 0
+        assert log.get("20250401_000000_inspection") == {"machine_id": "M001"}
+
+        # 移行済みのファイルはログの記録と重複して読まない。存在しないソースは飛ばす
+        log.append({"machine_id": "M003"}, record_id="20250403_000000_inspection")
+        log.close()
+        with open(os.path.join(raw_dir, "20250404_000000_inspection.json"), 'w', encoding='utf-8') as f:
+            json.dump({"machine_id": "M004"}, f)
+        sources = [os.path.join(tmp_dir, "log"), raw_dir, os.path.join(tmp_dir, "missing")]
+        records = list(iter_record_sources(sources))
+        assert [record["machine_id"] for _, record in records] == ["M000", "M001", "M002", "M003", "M004"]
+
+
+if __name__ == "__main__":
+    test_append_rotate_and_read_by_id()
+    test_recovers_from_interrupted_write()
+    test_second_writer_is_refused()
+    test_analyzers_open_the_logs_only_to_write()
+    test_inspection_index_is_built_once_under_concurrent_access()
+    test_migrate_directory_is_idempotent()
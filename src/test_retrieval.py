@@ -0,0 +1,140 @@
+import os
+import json
+import tempfile
+import threading
+from datetime import datetime
+
+from langchain_community.chat_models.fake import FakeListChatModel
+
+from ai_engine.analysis_jobs import AnalysisJobManager
+from embedding_cache import EmbeddingCache
+from test_embedding_cache import CountingEmbeddings
+from vector_store import LocalVectorStore
+from vectorize_and_predict import MaintenanceAnalyzer, RETRIEVAL_SOURCES
+
+
+class BarrierLocalVectorStore(LocalVectorStore):
+    """テスト用: 検索を parties 件がそろうまで待たせる（並行に実行されなければ BrokenBarrierError）
+
+    key を指定した場合は、フィルタにそのキーを含む検索だけを待たせる。
+    """
+
+    def __init__(self, embeddings, parties, key=None):
+        super().__init__(embeddings)
+        self.barrier = threading.Barrier(parties, timeout=5)
+        self.key = key
+
+    def similarity_search_by_vector_with_score(self, embedding, *, k=4, filter=None):
+        if self.barrier is not None and (self.key is None or self.key in (filter or {})):
+            self.barrier.wait()
+        return super().similarity_search_by_vector_with_score(embedding, k=k, filter=filter)
+
+
+class CountingQueryEmbeddings(CountingEmbeddings):
+    def __init__(self):
+        super().__init__()
+        self.query_calls = 0
+
+    def embed_query(self, text):
+        self.query_calls += 1
+        return super().embed_query(text)
+
+
+def test_retrieval_embeds_once_and_runs_concurrently():
+    embeddings = CountingQueryEmbeddings()
+    # 3種類の検索が同時に走らなければ完了しない
+    store = BarrierLocalVectorStore(embeddings, parties=len(RETRIEVAL_SOURCES))
+    store.add_texts(["点検記録", "故障事例", "技術ナレッジ"],
+                    [{"type": source} for source in RETRIEVAL_SOURCES])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        analyzer = MaintenanceAnalyzer(
+            embeddings=embeddings, vectorstore=store, data_dir=tmp_dir,
+            llm=FakeListChatModel(responses=["1. 原因分析"]),
+            embedding_cache=EmbeddingCache(":memory:")
+        )
+        result = analyzer.analyze_failure_cause("モーターM001で温度上昇")
+
+    assert embeddings.query_calls == 1
+    assert result["analysis"] == "1. 原因分析"
+    assert set(result["retrieval_timings"]) == {"embedding", "total", *RETRIEVAL_SOURCES}
+
+
+def test_ingested_chunks_are_filterable_by_machine_and_date():
+    store = LocalVectorStore(CountingEmbeddings())
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        analyzer = MaintenanceAnalyzer(
+            embeddings=store.embeddings, vectorstore=store, data_dir=tmp_dir,
+            llm=FakeListChatModel(responses=["1. 原因分析"]),
+            embedding_cache=EmbeddingCache(":memory:")
+        )
+        analyzer.process_inspection_records([{
+            "inspection_date": f"2024-0{month}-01 09:00:00",
+            "machine_id": machine_id,
+            "location": "工場A-1階",
+            "status": "要対応",
+            "findings": f"{machine_id}のモーターの異常振動",
+        } for month in range(1, 7) for machine_id in ("M001", "M002")])
+
+        docs = analyzer.retrieve_context("振動", k=10)["documents"]["inspection"]
+        assert docs and all(doc.metadata["type"] == "inspection" for doc in docs)
+        assert docs[0].metadata["location"] == "工場A-1階"
+
+        scope = analyzer.inspection_filter("M002", start=datetime(2024, 3, 1), end=datetime(2024, 5, 1))
+        docs = analyzer.retrieve_context("振動", k=10, inspection_filter=scope)["documents"]["inspection"]
+        assert sorted(doc.metadata["inspection_date"] for doc in docs) == [
+            int(datetime(2024, 3, 1, 9).timestamp()), int(datetime(2024, 4, 1, 9).timestamp())]
+        assert {doc.metadata["machine_id"] for doc in docs} == {"M002"}
+
+
+def test_batch_job_shares_retrievals_and_resumes():
+    embeddings = CountingQueryEmbeddings()
+    # 6台分の点検記録の検索がすべて同時に走らなければ完了しない
+    store = BarrierLocalVectorStore(embeddings, parties=6, key="machine_id")
+    store.add_texts(["故障事例", "技術ナレッジ"], [{"type": "failure"}, {"type": "knowledge"}])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        analyzer = MaintenanceAnalyzer(
+            embeddings=embeddings, vectorstore=store, data_dir=tmp_dir,
+            llm=FakeListChatModel(responses=["1. 原因分析"]),
+            embedding_cache=EmbeddingCache(":memory:")
+        )
+        analyzer.process_inspection_records([{
+            "inspection_date": "2024-01-01 09:00:00", "machine_id": f"M00{i}", "location": "工場A-1階",
+            "status": "要対応", "findings": "モーターの異常振動",
+        } for i in range(1, 7)])
+        jobs_dir = os.path.join(tmp_dir, "jobs")
+        manager = AnalysisJobManager(lambda: analyzer, jobs_dir=jobs_dir)
+
+        job = manager.submit(machine_ids=["M001", "M002", "M003", "M004", "M005", "M006", "M001"],
+                             concurrency=6)
+        summary = manager.wait(job["job_id"], timeout=10)
+
+        assert summary["status"] == "completed" and summary["done"] == 7 and summary["errors"] == 0
+        # 機械ごとに絞り込む点検記録の検索だけが並行に走り、故障事例・技術ナレッジの検索は共有される
+        assert summary["shared_retrievals"] == 10
+        items = manager.get(job["job_id"])["items"]
+        assert items[0]["record_id"] == items[6]["record_id"]
+        record = analyzer.analysis_log.get(items[1]["record_id"])
+        assert record["machine_id"] == "M002" and record["job_id"] == job["job_id"]
+        # プロンプトの問い合わせには機械IDが入る
+        assert record["query"].startswith("M002")
+        store.barrier = None
+
+        # 再起動後は完了していない項目だけを分析する
+        with open(os.path.join(jobs_dir, f"{job['job_id']}.json"), 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        saved["status"] = "running"
+        saved["items"][2].update(status="pending", record_id=None)
+        with open(os.path.join(jobs_dir, f"{job['job_id']}.json"), 'w', encoding='utf-8') as f:
+            json.dump(saved, f)
+        records = len(analyzer.analysis_log)
+        restarted = AnalysisJobManager(lambda: analyzer, jobs_dir=jobs_dir)
+        assert restarted.resume() == [job["job_id"]]
+        assert restarted.wait(job["job_id"], timeout=10)["done"] == 7
+        assert len(analyzer.analysis_log) == records + 1
+
+
+if __name__ == "__main__":
+    test_retrieval_embeds_once_and_runs_concurrently()
+    test_ingested_chunks_are_filterable_by_machine_and_date()
+    test_batch_job_shares_retrievals_and_resumes()
@@ -0,0 +1,38 @@
+import tempfile
+
+from langchain_community.chat_models.fake import FakeListChatModel
+
+from embedding_cache import EmbeddingCache
+from fake_backends import HashEmbeddings
+from vector_store import LocalVectorStore
+from vectorize_and_predict import MaintenanceAnalyzer, RETRIEVAL_SOURCES
+
+
+def test_stream_emits_context_then_tokens_then_result():
+    embeddings = HashEmbeddings()
+    store = LocalVectorStore(embeddings)
+    store.add_texts(["点検記録", "故障事例", "技術ナレッジ"],
+                    [{"type": source} for source in RETRIEVAL_SOURCES])
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        analyzer = MaintenanceAnalyzer(
+            embeddings=embeddings, vectorstore=store, data_dir=tmp_dir,
+            llm=FakeListChatModel(responses=["1. 原因分析\n2. 対策提案"]),
+            embedding_cache=EmbeddingCache(":memory:")
+        )
+        query = "モーターM001で温度上昇"
+        events = list(analyzer.stream_failure_cause(query))
+
+        assert events[0]["event"] == "context"
+        assert set(events[0]["data"]["sources"]) == set(RETRIEVAL_SOURCES)
+        assert events[0]["data"]["sources"]["failure"][0]["metadata"] == {"type": "failure"}
+        tokens = [event["data"] for event in events if event["event"] == "token"]
+        assert len(tokens) > 1
+        assert events[-1]["event"] == "done"
+        assert events[-1]["data"]["analysis"] == "".join(tokens) == "1. 原因分析\n2. 対策提案"
+
+        # 2回目はキャッシュから一括で返る
+        cached = list(analyzer.stream_failure_cause(query))
+        assert [event["event"] for event in cached] == ["context", "token", "done"]
+        assert cached[0]["data"]["cached"]
+        assert cached[-1]["data"]["analysis"] == "1. 原因分析\n2. 対策提案"
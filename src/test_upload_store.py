@@ -0,0 +1,152 @@
+import os
+import asyncio
+import hashlib
+import tempfile
+
+import httpx
+import pytest
+
+from ai_engine import main as engine
+from ai_engine.upload_store import UploadStore, safe_filename
+
+BOUNDARY = "test-boundary"
+
+
+def _multipart(data: bytes, filename: str = "点検記録.csv") -> bytes:
+    return (f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="note"\r\n\r\nメモ\r\n'
+            f"--{BOUNDARY}\r\n"
+            f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+            f"Content-Type: text/csv\r\n\r\n").encode() + data + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def _post(upload_dir: str, body, max_size: int, headers=None) -> httpx.Response:
+    async def run():
+        transport = httpx.ASGITransport(app=engine.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/upload", content=body, headers={
+                "Content-Type": f"multipart/form-data; boundary={BOUNDARY}", **(headers or {})})
+
+    original = engine.upload_store
+    engine.upload_store = UploadStore(upload_dir, max_size=max_size)
+    try:
+        return asyncio.run(run())
+    finally:
+        engine.upload_store = original
+
+
+def _upload_dir(tmp_dir: str) -> str:
+    upload_dir = os.path.join(tmp_dir, "raw")
+    os.makedirs(upload_dir)
+    return upload_dir
+
+
+def _leftovers(upload_dir: str):
+    return [name for name in os.listdir(upload_dir) if name.endswith(".part")]
+
+
+def test_upload_is_streamed_to_disk_with_its_digest():
+    data = os.urandom(300 * 1024)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        upload_dir = _upload_dir(tmp_dir)
+        response = _post(upload_dir, _multipart(data), max_size=1024 * 1024)
+        assert response.status_code == 200
+        assert response.json()["sha256"] == hashlib.sha256(data).hexdigest()
+        with open(os.path.join(upload_dir, "点検記録.csv"), 'rb') as f:
+            assert f.read() == data
+        assert _leftovers(upload_dir) == []
+
+        # 同じ内容は保存済みのファイル名を返す
+        again = _post(upload_dir, _multipart(data, filename="copy.csv"), max_size=1024 * 1024)
+        assert again.json()["duplicate"] and again.json()["filename"] == "点検記録.csv"
+
+
+def test_oversize_upload_is_rejected_before_reading_the_body():
+    chunks_read = []
+
+    async def body():
+        for chunk in (_multipart(b"x" * 4096),):
+            chunks_read.append(chunk)
+            yield chunk
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        upload_dir = _upload_dir(tmp_dir)
+        # Content-Length で上限を超えている
+        response = _post(upload_dir, body(), max_size=100,
+                         headers={"Content-Length": str(10 * 1024 * 1024)})
+        assert response.status_code == 413
+        assert chunks_read == [] and os.listdir(upload_dir) == []
+
+
+def test_oversize_chunked_upload_is_aborted_and_cleaned_up():
+    chunks_sent = []
+
+    async def body():
+        payload = _multipart(b"x" * (2 * 1024 * 1024))
+        for start in range(0, len(payload), 64 * 1024):
+            chunks_sent.append(start)
+            yield payload[start:start + 64 * 1024]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        upload_dir = _upload_dir(tmp_dir)
+        response = _post(upload_dir, body(), max_size=256 * 1024)
+        assert response.status_code == 413
+        # 上限を超えた時点で読むのをやめ、書きかけのファイルを残さない
+        assert len(chunks_sent) < 8
+        assert _leftovers(upload_dir) == [] and "点検記録.csv" not in os.listdir(upload_dir)
+
+
+def test_missing_file_field_is_a_bad_request():
+    body = f'--{BOUNDARY}\r\nContent-Disposition: form-data; name="note"\r\n\r\nメモ\r\n--{BOUNDARY}--\r\n'
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        upload_dir = _upload_dir(tmp_dir)
+        assert _post(upload_dir, body.encode(), max_size=1024).status_code == 400
+        assert _leftovers(upload_dir) == []
+
+
+def test_unsafe_filenames_are_rejected():
+    assert safe_filename("C:\\Users\\点検\\記録.csv") == "記録.csv"
+    assert safe_filename("../../etc/report.csv") == "report.csv"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        upload_dir = _upload_dir(tmp_dir)
+        for filename in ("", ".", "..", "dir/..", ".upload_index.jsonl", ".bashrc", "a\nb.csv"):
+            response = _post(upload_dir, _multipart(b"data", filename=filename), max_size=1024)
+            assert response.status_code == 400, filename
+        assert os.listdir(upload_dir) == []
+
+
+def test_index_is_kept_outside_the_upload_directory():
+    data = os.urandom(1024)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        upload_dir = _upload_dir(tmp_dir)
+        assert _post(upload_dir, _multipart(data), max_size=4096).status_code == 200
+        store = UploadStore(upload_dir)
+        assert not store.index_path.startswith(upload_dir + os.sep)
+        assert os.path.exists(store.index_path)
+        # 以前の版の索引と同じ名前のファイルがあっても（壊れた行があっても）読み込める
+        with open(os.path.join(upload_dir, UploadStore.LEGACY_INDEX_FILE), 'w') as f:
+            f.write("not json\n")
+        with open(store.index_path, 'a') as f:
+            f.write("{broken\n")
+        again = _post(upload_dir, _multipart(data, filename="copy.csv"), max_size=4096)
+        assert again.json()["duplicate"] and again.json()["filename"] == "点検記録.csv"
+
+
+def test_failed_commit_removes_the_partial_file():
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        upload_dir = _upload_dir(tmp_dir)
+        # 保存先の名前がディレクトリで置き換えられない
+        os.makedirs(os.path.join(upload_dir, "点検記録.csv", "sub"))
+        with pytest.raises(OSError):
+            _post(upload_dir, _multipart(b"data"), max_size=1024)
+        assert _leftovers(upload_dir) == []
+
+
+if __name__ == "__main__":
+    test_upload_is_streamed_to_disk_with_its_digest()
+    test_oversize_upload_is_rejected_before_reading_the_body()
+    test_oversize_chunked_upload_is_aborted_and_cleaned_up()
+    test_missing_file_field_is_a_bad_request()
+    test_unsafe_filenames_are_rejected()
+    test_index_is_kept_outside_the_upload_directory()
+    test_failed_commit_removes_the_partial_file()
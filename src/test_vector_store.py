@@ -0,0 +1,165 @@
+import tempfile
+import threading
+
+import numpy as np
+
+from fake_backends import HashEmbeddings
+from vector_store import LocalVectorStore
+
+
+def test_local_vector_store_search():
+    store = LocalVectorStore(HashEmbeddings(), initial_capacity=2)
+    texts = [f"機械M{i:03d}の点検記録" for i in range(10)]
+    metadatas = [{"type": "inspection" if i % 2 == 0 else "failure"} for i in range(10)]
+    store.add_texts(texts, metadatas)
+
+    # 同じテキストで検索すると自分自身が最上位になる
+    docs = store.similarity_search(texts[4], k=3)
+    assert len(docs) == 3
+    assert docs[0].page_content == texts[4]
+
+    # フィルタに一致するドキュメントだけが返る
+    docs = store.similarity_search(texts[4], k=3, filter={"type": "failure"})
+    assert all(doc.metadata["type"] == "failure" for doc in docs)
+    assert store.similarity_search(texts[4], filter={"type": "knowledge"}) == []
+
+
+def test_local_vector_store_persist_and_reload():
+    embeddings = HashEmbeddings()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = LocalVectorStore(embeddings, persist_directory=tmp_dir, initial_capacity=4)
+        store.add_texts([f"テキスト{i}" for i in range(5)], [{"type": "knowledge"}] * 5)
+        store.add_texts(["追加テキスト"], [{"type": "inspection"}])
+        del store
+
+        # 再読み込み時には埋め込みを呼ばない
+        reloaded = LocalVectorStore(None, persist_directory=tmp_dir)
+        assert len(reloaded) == 6
+        results = reloaded.similarity_search_by_vector_with_score(
+            embeddings.embed_query("追加テキスト"), k=1, filter={"type": "inspection"}
+        )
+        assert results[0][0].page_content == "追加テキスト"
+        assert abs(results[0][1] - 1.0) < 1e-5
+
+
+def test_interrupted_append_is_truncated_on_reload():
+    embeddings = HashEmbeddings()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = LocalVectorStore(embeddings, persist_directory=tmp_dir)
+        store.add_texts(["テキスト0", "テキスト1"], ids=["0", "1"])
+        # メタデータは書けたがヘッダを更新する前に中断された追記（最後の行は書きかけ）
+        with open(f"{tmp_dir}/{LocalVectorStore.METADATA_FILE}", 'a', encoding='utf-8') as f:
+            f.write('{"id": "lost", "text": "失われた行", "metadata": {}}\n{"id": "bro')
+        del store
+
+        store = LocalVectorStore(embeddings, persist_directory=tmp_dir)
+        assert len(store) == 2
+        store.add_texts(["テキスト2"], ids=["2"])
+        del store
+
+        reloaded = LocalVectorStore(embeddings, persist_directory=tmp_dir)
+        assert [doc_id for doc_id, _ in reloaded.iter_documents()] == ["0", "1", "2"]
+        for text in ("テキスト0", "テキスト1", "テキスト2"):
+            doc, score = reloaded.similarity_search_with_score(text, k=1)[0]
+            assert doc.page_content == text and abs(score - 1.0) < 1e-5
+
+
+def test_local_vector_store_range_filters():
+    store = LocalVectorStore(HashEmbeddings())
+    texts = [f"機械M{i % 3:03d}の点検記録{i}" for i in range(30)]
+    store.add_texts(texts, [{"machine_id": f"M{i % 3:03d}", "inspection_date": 1000 + i} for i in range(30)])
+
+    window = {"$gte": 1010, "$lt": 1020}
+    docs = store.similarity_search(texts[0], k=30, filter={"inspection_date": window})
+    assert sorted(doc.metadata["inspection_date"] for doc in docs) == list(range(1010, 1020))
+
+    # 機械IDで絞った行だけが期間の判定と類似度計算の対象になる
+    docs = store.similarity_search(texts[0], k=30, filter={"machine_id": "M001", "inspection_date": window})
+    assert sorted(doc.metadata["inspection_date"] for doc in docs) == [1010, 1013, 1016, 1019]
+    assert store.similarity_search(texts[0], filter={"machine_id": "M001",
+                                                     "inspection_date": {"$gt": 1028}}) == []
+
+
+def _recall(store, exact, queries, k=10):
+    hits = 0
+    for query in queries:
+        expected = {doc.page_content for doc, _ in exact.similarity_search_by_vector_with_score(query, k=k)}
+        hits += len(expected & {doc.page_content for doc, _ in
+                                store.similarity_search_by_vector_with_score(query, k=k)})
+    return hits / (k * len(queries))
+
+
+def test_quantized_stores_match_exact_search():
+    embeddings = HashEmbeddings(dimension=64)
+    texts = [f"点検記録{i}" for i in range(2000)]
+    vectors = embeddings.embed_documents(texts)
+    rng = np.random.default_rng(0)
+    # 記録に近いクエリ（記録のベクトルに雑音を加えたもの）
+    queries = [np.asarray(vectors[i]) + rng.normal(0, 0.5, 64) for i in range(0, 2000, 100)]
+    exact = LocalVectorStore(embeddings)
+    exact.add_embeddings(texts, vectors)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for quantization, compression in [("float16", 2), ("int8", 3.5), ("pq", 32)]:
+            store = LocalVectorStore(embeddings, persist_directory=f"{tmp_dir}/{quantization}",
+                                     quantization=quantization, train_size=1000)
+            store.add_embeddings(texts[:500], vectors[:500])
+            store.add_embeddings(texts[500:], vectors[500:])
+            assert store.quantized and store.footprint()["compression"] >= compression
+            # 上位候補を全精度で採点し直すため、スコアは厳密な値になる
+            doc, score = store.similarity_search_by_vector_with_score(vectors[7], k=1)[0]
+            assert doc.page_content == texts[7] and abs(score - 1.0) < 1e-5
+            recall = _recall(store, exact, queries)
+            assert recall >= (0.7 if quantization == "pq" else 0.99)
+            store.rerank_factor = 0
+            assert _recall(store, exact, queries) <= recall
+
+            reloaded = LocalVectorStore(None, persist_directory=f"{tmp_dir}/{quantization}",
+                                        quantization=quantization)
+            assert reloaded.quantized and reloaded._encoded == 2000
+            assert _recall(reloaded, exact, queries) == recall
+
+        # 量子化なしで作ったストアも、開き直すときに符号化できる
+        converted = LocalVectorStore(None, persist_directory=f"{tmp_dir}/float16", quantization="int8")
+        assert converted.quantized and _recall(converted, exact, queries) >= 0.99
+
+
+def test_searches_run_safely_while_the_store_grows():
+    embeddings = HashEmbeddings()
+    query = embeddings.embed_query("機械M000の点検記録")
+    for persist in (False, True):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = LocalVectorStore(embeddings, persist_directory=tmp_dir if persist else None,
+                                     initial_capacity=1)
+            store.add_texts(["機械M000の点検記録"])
+            errors = []
+            done = threading.Event()
+
+            def search():
+                try:
+                    while not done.is_set():
+                        results = store.similarity_search_by_vector_with_score(query, k=3)
+                        assert results[0][0].page_content == "機械M000の点検記録"
+                except Exception as e:
+                    errors.append(e)
+
+            searchers = [threading.Thread(target=search) for _ in range(4)]
+            for thread in searchers:
+                thread.start()
+            # 容量 1 から追加を繰り返し、検索中に何度も行列を拡張させる
+            for i in range(1, 100):
+                store.add_texts([f"機械M{i:03d}の整備記録"])
+            done.set()
+            for thread in searchers:
+                thread.join()
+            assert errors == []
+            assert len(store) == 100
+
+
+if __name__ == "__main__":
+    test_local_vector_store_search()
+    test_local_vector_store_persist_and_reload()
+    test_interrupted_append_is_truncated_on_reload()
+    test_local_vector_store_range_filters()
+    test_quantized_stores_match_exact_search()
+    test_searches_run_safely_while_the_store_grows()
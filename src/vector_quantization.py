@@ -0,0 +1,196 @@
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Type
+
+import numpy as np
+
+# 一度に float32 へ戻して計算する行数（一時配列をキャッシュに収まる大きさに抑える）
+BLOCK_ROWS = 4096
+
+
+def _blockwise(codes: np.ndarray, score_block) -> np.ndarray:
+    scores = np.empty(codes.shape[0], dtype=np.float32)
+    for start in range(0, codes.shape[0], BLOCK_ROWS):
+        scores[start:start + BLOCK_ROWS] = score_block(codes[start:start + BLOCK_ROWS])
+    return scores
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """各ベクトルに最も近い重心の番号（二乗ユークリッド距離）"""
+    distances = (centroids * centroids).sum(axis=1) - 2 * vectors @ centroids.T
+    return np.argmin(distances, axis=1)
+
+
+def kmeans(vectors: np.ndarray, clusters: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """Lloyd 法による k-means の重心（空になったクラスタは前回の重心を残す）"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(vectors.shape[0], clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest(vectors, centroids)
+        counts = np.bincount(assignment, minlength=clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class VectorCodec(ABC):
+    """正規化済みベクトルの圧縮表現
+
+    符号は1ベクトルあたり code_size バイトの uint8 の行として保持し、
+    scores() は符号のまま（または小さな単位で float32 に戻して）内積を近似する。
+    """
+
+    name = ""
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+
+    @property
+    @abstractmethod
+    def code_size(self) -> int:
+        """1ベクトルの符号のバイト数"""
+
+    @property
+    def trained(self) -> bool:
+        return True
+
+    def train(self, sample: np.ndarray):
+        """符号化に学習が必要な方式は sample から学習する"""
+
+    def state(self) -> Optional[Dict[str, np.ndarray]]:
+        """保存が必要な学習結果（なければ None）"""
+        return None
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        pass
+
+    @abstractmethod
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """(n, dimension) の float32 を (n, code_size) の uint8 に符号化する"""
+
+    @abstractmethod
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """符号と正規化済みクエリの近似内積"""
+
+
+class Float16Codec(VectorCodec):
+    """半精度浮動小数点（2バイト/次元）"""
+
+    name = "float16"
+
+    @property
+    def code_size(self) -> int:
+        return self.dimension * 2
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.ascontiguousarray(vectors, dtype=np.float16).view(np.uint8)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        codes = np.ascontiguousarray(codes)
+        return _blockwise(codes, lambda block: block.view(np.float16).astype(np.float32) @ query)
+
+
+class Int8Codec(VectorCodec):
+    """行ごとの倍率によるスカラー量子化（1バイト/次元＋倍率の float32）
+
+    各行の最大絶対値を 127 に合わせるため、学習なしで追加したベクトルから順に符号化できる。
+    """
+
+    name = "int8"
+
+    @property
+    def code_size(self) -> int:
+        return self.dimension + 4
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        scale = np.abs(vectors).max(axis=1) / 127
+        scale[scale == 0] = 1.0
+        codes = np.empty((vectors.shape[0], self.code_size), dtype=np.uint8)
+        codes[:, :self.dimension] = np.rint(vectors / scale[:, None]).astype(np.int8).view(np.uint8)
+        codes[:, self.dimension:] = scale.astype(np.float32)[:, None].view(np.uint8)
+        return codes
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        def score_block(block):
+            scale = np.ascontiguousarray(block[:, self.dimension:]).view(np.float32)[:, 0]
+            return (block[:, :self.dimension].view(np.int8).astype(np.float32) @ query) * scale
+        return _blockwise(codes, score_block)
+
+
+class ProductQuantizer(VectorCodec):
+    """直積量子化（PQ）: 次元を subvectors 個に分け、部分ごとに 256 個の重心の番号（1バイト）で表す
+
+    検索はクエリと各重心の内積の表を引いて足し合わせる（非対称距離計算）。
+    重心は train() で k-means により学習する。
+    """
+
+    name = "pq"
+    CLUSTERS = 256
+
+    def __init__(self, dimension: int, subvectors: Optional[int] = None, iterations: int = 20):
+        super().__init__(dimension)
+        self.subvectors = subvectors or max(1, dimension // 8)
+        if dimension % self.subvectors:
+            raise ValueError(f"次元 {dimension} は部分ベクトル数 {self.subvectors} で割り切れません")
+        self.iterations = iterations
+        self.codebook: Optional[np.ndarray] = None
+
+    @property
+    def code_size(self) -> int:
+        return self.subvectors
+
+    @property
+    def trained(self) -> bool:
+        return self.codebook is not None
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """(n, dimension) を (subvectors, n, 部分の次元) に並べ替える"""
+        return vectors.reshape(vectors.shape[0], self.subvectors, -1).transpose(1, 0, 2)
+
+    def train(self, sample: np.ndarray):
+        clusters = min(self.CLUSTERS, sample.shape[0])
+        self.codebook = np.stack([kmeans(part, clusters, self.iterations, seed=i)
+                                  for i, part in enumerate(self._split(sample.astype(np.float32)))])
+
+    def state(self) -> Optional[Dict[str, np.ndarray]]:
+        return None if self.codebook is None else {"codebook": self.codebook}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        self.codebook = state["codebook"]
+        self.subvectors = self.codebook.shape[0]
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        if self.codebook is None:
+            raise ValueError("直積量子化の重心が学習されていません")
+        codes = np.empty((vectors.shape[0], self.subvectors), dtype=np.uint8)
+        for start in range(0, vectors.shape[0], BLOCK_ROWS):
+            parts = self._split(vectors[start:start + BLOCK_ROWS])
+            for i, part in enumerate(parts):
+                codes[start:start + BLOCK_ROWS, i] = _nearest(part, self.codebook[i])
+        return codes
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        # 部分ごとの クエリ・重心 の内積の表（subvectors × 256）
+        table = np.einsum("scd,sd->sc", self.codebook, query.reshape(self.subvectors, -1))
+
+        def score_block(block):
+            scores = np.zeros(block.shape[0], dtype=np.float32)
+            for i in range(self.subvectors):
+                scores += table[i].take(block[:, i])
+            return scores
+        return _blockwise(codes, score_block)
+
+
+CODECS: Dict[str, Type[VectorCodec]] = {
+    codec.name: codec for codec in (Float16Codec, Int8Codec, ProductQuantizer)
+}
+
+
+def make_codec(quantization: str, dimension: int, **options) -> VectorCodec:
+    """quantization（"float16" / "int8" / "pq"）の符号化方式を作る"""
+    if quantization not in CODECS:
+        raise ValueError(f"未対応の量子化方式です: {quantization}（{', '.join(CODECS)} のいずれか）")
+    if quantization == "pq":
+        return ProductQuantizer(dimension, **options)
+    return CODECS[quantization](dimension)
@@ -0,0 +1,477 @@
+import os
+import json
+import uuid
+import threading
+from bisect import bisect_left, bisect_right, insort
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from vector_quantization import BLOCK_ROWS, VectorCodec, make_codec
+
+# 数値メタデータ（点検日時の UNIX 秒など）に使える範囲条件
+RANGE_OPERATORS = {"$gt", "$gte", "$lt", "$lte"}
+
+
+def is_number(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def is_range_condition(condition: Any) -> bool:
+    return isinstance(condition, dict) and bool(condition) and set(condition) <= RANGE_OPERATORS
+
+
+def matches_range(value: Any, condition: Dict) -> bool:
+    """数値 value が $gt/$gte/$lt/$lte の条件をすべて満たすか（数値以外は一致しない）"""
+    if not is_number(value):
+        return False
+    return (("$gt" not in condition or value > condition["$gt"])
+            and ("$gte" not in condition or value >= condition["$gte"])
+            and ("$lt" not in condition or value < condition["$lt"])
+            and ("$lte" not in condition or value <= condition["$lte"]))
+
+
+@dataclass
+class Document:
+    """検索結果のドキュメント（LangChain の Document と同じ属性を持つ）"""
+    page_content: str
+    metadata: Dict[str, Any] = field(default_factory=dict)
+
+
+class VectorStore(ABC):
+    """MaintenanceAnalyzer が利用するベクトルストアのインターフェース
+
+    メソッド名と引数は LangChain の VectorStore に合わせているため、
+    LangChain の Pinecone ストアもそのまま差し替えて利用できる。
+    """
+
+    # クエリの埋め込みに使う Embeddings（embed_query() を持つもの）。実装側で設定する
+    embeddings: Any
+
+    @abstractmethod
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[Dict]] = None,
+                  ids: Optional[List[str]] = None) -> List[str]:
+        """テキストを埋め込んで追加し、IDのリストを返す"""
+
+    @abstractmethod
+    def similarity_search_by_vector_with_score(self, embedding: List[float], *, k: int = 4,
+                                               filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """埋め込みベクトルに類似したドキュメントをスコア付きで返す"""
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4,
+                                    filter: Optional[Dict] = None) -> List[Document]:
+        """埋め込みベクトルに類似したドキュメントを返す"""
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k=k, filter=filter)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4,
+                                     filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """クエリに類似したドキュメントをスコア付きで返す"""
+        return self.similarity_search_by_vector_with_score(self.embeddings.embed_query(query), k=k, filter=filter)
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict] = None) -> List[Document]:
+        """クエリに類似したドキュメントを返す"""
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)]
+
+
+class LocalVectorStore(VectorStore):
+    """NumPy によるローカル埋め込みベクトルストア
+
+    埋め込みは正規化済みの float32 行列としてメモリマップファイル（vectors.f32）に、
+    テキストとメタデータは行ごとに metadata.jsonl に保存する。
+    コサイン類似度の top-k は行列積で一括計算するため、検索ごとのネットワーク往復が発生しない。
+    persist_directory を指定しない場合はメモリ上のみで動作する。
+    追加（行列の拡張を含む）と検索はロックで直列化するため、複数のスレッドから利用できる。
+
+    quantization（"float16" / "int8" / "pq"）を指定すると、圧縮した符号（codes.<方式>）を
+    別に持ち、検索ではそれだけを走査する。上位 k × rerank_factor 件の候補は全精度のベクトルで
+    採点し直す（rerank_factor=0 なら近似スコアのまま返す）。全精度のベクトルはメモリマップの
+    ファイルに残るが、読まれるのは候補の行だけなので、常駐するのは符号の分で済む。
+    直積量子化（pq）は記録数が train_size に達した時点で重心を学習し、それまでは全精度で検索する。
+    """
+
+    VECTORS_FILE = "vectors.f32"
+    METADATA_FILE = "metadata.jsonl"
+    HEADER_FILE = "store.json"
+    CODEBOOK_FILE = "codebook.npz"
+
+    def __init__(self, embeddings, persist_directory: Optional[str] = None,
+                 dimension: Optional[int] = None, initial_capacity: int = 1024,
+                 quantization: Optional[str] = None, rerank_factor: int = 4,
+                 pq_subvectors: Optional[int] = None, train_size: int = 10000):
+        self.embeddings = embeddings
+        self.persist_directory = persist_directory
+        self.dimension = dimension
+        self.quantization = quantization
+        self.rerank_factor = rerank_factor
+        self.pq_subvectors = pq_subvectors
+        self.train_size = train_size
+        self._initial_capacity = initial_capacity
+        # 追加（行列の拡張を含む）と検索を直列化する
+        self._lock = threading.RLock()
+        self._count = 0
+        self._vectors: Optional[np.ndarray] = None
+        self._codec: Optional[VectorCodec] = None
+        self._codes: Optional[np.ndarray] = None
+        # 符号化済みの行数（pq の学習前は 0 のまま）
+        self._encoded = 0
+        self._ids: List[str] = []
+        self._id_rows: Dict[str, int] = {}
+        self._texts: List[str] = []
+        self._metadatas: List[Dict] = []
+        self._postings: Dict[str, Dict[Any, List[int]]] = {}
+        # 数値メタデータの値の昇順リスト（範囲条件を二分探索で引くため）
+        self._numeric_values: Dict[str, List[float]] = {}
+
+        if persist_directory:
+            os.makedirs(persist_directory, exist_ok=True)
+            self._load()
+
+    def __len__(self) -> int:
+        return self._count
+
+    # ---- 永続化 ----
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_directory, name)
+
+    def _load(self):
+        """保存済みのストアを再埋め込みなしで読み込む"""
+        header_path = self._path(self.HEADER_FILE)
+        if not os.path.exists(header_path):
+            return
+        with open(header_path, 'r', encoding='utf-8') as f:
+            header = json.load(f)
+        self.dimension = header["dimension"]
+        capacity = header["capacity"]
+        self._init_codec()
+
+        rows = []
+        valid_end = 0
+        metadata_path = self._path(self.METADATA_FILE)
+        if os.path.exists(metadata_path):
+            with open(metadata_path, 'rb') as f:
+                for line in f:
+                    # ヘッダ更新前に中断された場合は、両方に揃っている行だけを有効とする
+                    if len(rows) >= header["count"] or not line.endswith(b"\n"):
+                        break
+                    valid_end += len(line)
+                    if line.strip():
+                        rows.append(json.loads(line))
+            # 余分な行を残すと次の追記がその後ろに続き、ベクトルの行とずれてしまう
+            if os.path.getsize(metadata_path) > valid_end:
+                with open(metadata_path, 'r+b') as f:
+                    f.truncate(valid_end)
+
+        self._vectors = np.memmap(self._path(self.VECTORS_FILE), dtype=np.float32,
+                                  mode='r+', shape=(capacity, self.dimension))
+        if self._codec is not None:
+            # 方式が変わった・符号のファイルがない場合は全精度のベクトルから符号化し直す
+            codes_path = self._path(self._codes_file())
+            if header.get("quantization") == self.quantization and os.path.exists(codes_path):
+                self._codes = np.memmap(codes_path, dtype=np.uint8, mode='r+',
+                                        shape=(capacity, self._codec.code_size))
+                self._encoded = min(header.get("encoded", 0), len(rows))
+            else:
+                self._codes = self._grow(None, self._codes_file(), self._codec.code_size, capacity)
+        for row in rows:
+            self._append_row(row["id"], row["text"], row["metadata"])
+        self._encode_pending()
+
+    def _write_header(self):
+        header = {
+            "dimension": self.dimension,
+            "capacity": self._vectors.shape[0],
+            "count": self._count,
+            "quantization": self.quantization,
+            "encoded": self._encoded,
+        }
+        tmp_path = self._path(self.HEADER_FILE) + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(header, f)
+        os.replace(tmp_path, self._path(self.HEADER_FILE))
+
+    def persist(self):
+        """メモリマップの内容をディスクへ書き出す"""
+        with self._lock:
+            if self.persist_directory and self._vectors is not None:
+                self._vectors.flush()
+                if self._codes is not None:
+                    self._codes.flush()
+                self._write_header()
+
+    def _grow(self, array: Optional[np.ndarray], name: str, width: int, capacity: int,
+              dtype=np.uint8) -> np.ndarray:
+        """array を capacity 行に広げる（永続化する場合はファイルを伸ばしてマップし直す）"""
+        if not self.persist_directory:
+            grown = np.zeros((capacity, width), dtype=dtype)
+            if array is not None:
+                grown[:self._count] = array[:self._count]
+            return grown
+
+        if array is not None:
+            array.flush()
+            del array
+        path = self._path(name)
+        with open(path, 'ab') as f:
+            f.truncate(capacity * width * np.dtype(dtype).itemsize)
+        return np.memmap(path, dtype=dtype, mode='r+', shape=(capacity, width))
+
+    def _ensure_capacity(self, required: int):
+        if self._vectors is not None and self._vectors.shape[0] >= required:
+            return
+        capacity = self._initial_capacity if self._vectors is None else self._vectors.shape[0]
+        while capacity < required:
+            capacity *= 2
+
+        # 新しい配列を作ってから1回の代入で差し替える（途中の状態を見せない）
+        self._vectors = self._grow(self._vectors, self.VECTORS_FILE, self.dimension, capacity, np.float32)
+        if self._codec is not None:
+            self._codes = self._grow(self._codes, self._codes_file(), self._codec.code_size, capacity)
+
+    # ---- 量子化 ----
+
+    def _codes_file(self) -> str:
+        return f"codes.{self.quantization}"
+
+    def _init_codec(self):
+        if self.quantization is None or self._codec is not None:
+            return
+        options = {"subvectors": self.pq_subvectors} if self.quantization == "pq" else {}
+        self._codec = make_codec(self.quantization, self.dimension, **options)
+        codebook_path = self._path(self.CODEBOOK_FILE) if self.persist_directory else None
+        if codebook_path and os.path.exists(codebook_path):
+            with np.load(codebook_path) as state:
+                self._codec.load_state(dict(state))
+
+    def _encode_pending(self):
+        """まだ符号化していない行を符号化する（pq は必要なら先に重心を学習する）"""
+        if self._codec is None or self._encoded >= self._count:
+            return
+        if not self._codec.trained:
+            if self._count < self.train_size:
+                return
+            rng = np.random.default_rng(0)
+            sample = np.sort(rng.choice(self._count, min(self._count, self.train_size), replace=False))
+            self._codec.train(np.asarray(self._vectors[sample]))
+            if self.persist_directory:
+                tmp_path = self._path(self.CODEBOOK_FILE + ".tmp.npz")
+                np.savez(tmp_path, **self._codec.state())
+                os.replace(tmp_path, self._path(self.CODEBOOK_FILE))
+        for start in range(self._encoded, self._count, BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, self._count)
+            self._codes[start:end] = self._codec.encode(np.asarray(self._vectors[start:end]))
+        self._encoded = self._count
+
+    @property
+    def quantized(self) -> bool:
+        """検索が圧縮した符号で行われるか"""
+        return self._codec is not None and self._count > 0 and self._encoded == self._count
+
+    def footprint(self) -> Dict[str, float]:
+        """検索で走査するベクトル表現のバイト数（全精度の float32 との比較）"""
+        full = self._count * (self.dimension or 0) * 4
+        scanned = self._count * self._codec.code_size if self.quantized else full
+        return {
+            "float32_bytes": full,
+            "search_bytes": scanned,
+            "bytes_per_vector": scanned / self._count if self._count else 0.0,
+            "compression": full / scanned if scanned else 1.0,
+        }
+
+    # ---- 追加 ----
+
+    def _append_row(self, doc_id: str, text: str, metadata: Dict):
+        row = len(self._ids)
+        self._ids.append(doc_id)
+        self._id_rows[doc_id] = row
+        self._texts.append(text)
+        self._metadatas.append(metadata)
+        for key, value in metadata.items():
+            if isinstance(value, (str, int, float, bool)):
+                postings = self._postings.setdefault(key, {})
+                if value not in postings and is_number(value):
+                    insort(self._numeric_values.setdefault(key, []), value)
+                postings.setdefault(value, []).append(row)
+        self._count = row + 1
+
+    def _new_rows(self, ids: List[str]) -> List[int]:
+        """未登録のIDを持つ位置だけを返す（同一IDの再追加はスキップする）"""
+        seen = set()
+        positions = []
+        for i, doc_id in enumerate(ids):
+            if doc_id not in self._id_rows and doc_id not in seen:
+                seen.add(doc_id)
+                positions.append(i)
+        return positions
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[Dict]] = None,
+                  ids: Optional[List[str]] = None) -> List[str]:
+        """テキストを埋め込んで追加する"""
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        with self._lock:
+            new = self._new_rows(ids)
+        if new:
+            new_texts = [texts[i] for i in new]
+            self.add_embeddings(new_texts, self.embeddings.embed_documents(new_texts),
+                                [metadatas[i] for i in new], [ids[i] for i in new])
+        return ids
+
+    def add_embeddings(self, texts: List[str], embeddings: List[List[float]],
+                       metadatas: Optional[List[Dict]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        """埋め込み済みのベクトルをテキストと共に追加する"""
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        with self._lock:
+            new = self._new_rows(ids)
+            if not new:
+                return ids
+            if len(new) < len(ids):
+                texts = [texts[i] for i in new]
+                embeddings = [embeddings[i] for i in new]
+                metadatas = [metadatas[i] for i in new]
+            new_ids = [ids[i] for i in new]
+
+            matrix = np.asarray(embeddings, dtype=np.float32)
+            if self.dimension is None:
+                self.dimension = matrix.shape[1]
+            if matrix.shape[1] != self.dimension:
+                raise ValueError(f"埋め込みの次元が一致しません: {matrix.shape[1]} != {self.dimension}")
+            self._init_codec()
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            matrix /= norms
+
+            start = self._count
+            self._ensure_capacity(start + len(texts))
+            self._vectors[start:start + len(texts)] = matrix
+
+            if self.persist_directory:
+                with open(self._path(self.METADATA_FILE), 'a', encoding='utf-8') as f:
+                    for doc_id, text, metadata in zip(new_ids, texts, metadatas):
+                        f.write(json.dumps({"id": doc_id, "text": text, "metadata": metadata},
+                                           ensure_ascii=False) + "\n")
+            for doc_id, text, metadata in zip(new_ids, texts, metadatas):
+                self._append_row(doc_id, text, dict(metadata))
+
+            self._encode_pending()
+            self.persist()
+            return ids
+
+    def iter_documents(self, start: int = 0) -> Iterator[Tuple[str, Document]]:
+        """start 行目以降の (ID, ドキュメント) を追加順に返す"""
+        with self._lock:
+            count = self._count
+        for row in range(start, count):
+            yield self._ids[row], Document(page_content=self._texts[row], metadata=dict(self._metadatas[row]))
+
+    # ---- 検索 ----
+
+    def _values_in_range(self, key: str, condition: Dict) -> List[float]:
+        values = self._numeric_values.get(key, [])
+        lo, hi = 0, len(values)
+        if "$gte" in condition:
+            lo = max(lo, bisect_left(values, condition["$gte"]))
+        if "$gt" in condition:
+            lo = max(lo, bisect_right(values, condition["$gt"]))
+        if "$lte" in condition:
+            hi = min(hi, bisect_right(values, condition["$lte"]))
+        if "$lt" in condition:
+            hi = min(hi, bisect_left(values, condition["$lt"]))
+        return values[lo:hi]
+
+    def _candidate_rows(self, filter: Optional[Dict]) -> Optional[np.ndarray]:
+        """メタデータフィルタに一致する行番号を返す（フィルタなしは None）
+
+        一致条件で候補を絞ってから範囲条件を見るため、機械IDと期間を組み合わせた
+        検索では、その機械の行だけを確かめればよい。
+        """
+        if not filter:
+            return None
+        rows: Optional[np.ndarray] = None
+        for key, condition in sorted(filter.items(), key=lambda item: is_range_condition(item[1])):
+            postings = self._postings.get(key, {})
+            if is_range_condition(condition):
+                if rows is not None:
+                    keep = [matches_range(self._metadatas[row].get(key), condition) for row in rows.tolist()]
+                    rows = rows[np.asarray(keep, dtype=bool)]
+                    if rows.size == 0:
+                        break
+                    continue
+                values = self._values_in_range(key, condition)
+            elif isinstance(condition, dict):
+                if "$eq" in condition:
+                    values = [condition["$eq"]]
+                elif "$in" in condition:
+                    values = condition["$in"]
+                else:
+                    raise ValueError(f"未対応のフィルタ条件です: {condition}")
+            else:
+                values = [condition]
+            # 各値の行番号リストは追加順（昇順）に並んでいる
+            lists = [postings[value] for value in values if value in postings]
+            if len(lists) == 1:
+                matched = np.asarray(lists[0], dtype=np.int64)
+            else:
+                matched = np.unique(np.fromiter((row for rows_of_value in lists for row in rows_of_value),
+                                                dtype=np.int64))
+            rows = matched if rows is None else np.intersect1d(rows, matched, assume_unique=True)
+            if rows.size == 0:
+                break
+        return rows
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], *, k: int = 4,
+                                               filter: Optional[Dict] = None) -> List[Tuple[Document, float]]:
+        """コサイン類似度で上位 k 件をスコア付きで返す"""
+        with self._lock:
+            return self._search(embedding, k, filter)
+
+    def _search(self, embedding: List[float], k: int,
+                filter: Optional[Dict]) -> List[Tuple[Document, float]]:
+        if self._count == 0 or k <= 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+
+        quantized = self.quantized
+        if quantized:
+            matrix, score = self._codes, self._codec.scores
+        else:
+            matrix, score = self._vectors, np.matmul
+
+        rows = self._candidate_rows(filter)
+        if rows is None:
+            scores = score(matrix[:self._count], query)
+        elif rows.size == 0:
+            return []
+        elif rows.size > self._count // 2:
+            # 候補が多い場合は行を集めるより全行の連続した行列積の方が速い
+            scores = score(matrix[:self._count], query)[rows]
+        else:
+            scores = score(matrix[rows], query)
+
+        rerank = quantized and self.rerank_factor > 0
+        fetch = min(k * self.rerank_factor if rerank else k, scores.shape[0])
+        top = np.argpartition(-scores, fetch - 1)[:fetch]
+        top_rows = top if rows is None else rows[top]
+        top_scores = scores[top]
+        if rerank:
+            # 符号で絞った候補だけを全精度のベクトルで採点し直す
+            top_scores = self._vectors[top_rows] @ query
+        order = np.argsort(-top_scores)[:k]
+
+        results = []
+        for i in order:
+            row = int(top_rows[i])
+            doc = Document(page_content=self._texts[row], metadata=dict(self._metadatas[row]))
+            results.append((doc, float(top_scores[i])))
+        return results
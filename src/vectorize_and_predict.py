@@ -1,33 +1,277 @@
 import os
 import json
-from typing import List, Dict, Tuple
+import time
+import threading
+from functools import partial
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Iterator, List, Dict, Tuple, Optional
 from datetime import datetime
 from dotenv import load_dotenv
-from pinecone import Pinecone, ServerlessSpec
-from langchain_openai import OpenAIEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores.pinecone import Pinecone as LangchainPinecone
-from langchain_openai import ChatOpenAI
-from langchain.prompts import ChatPromptTemplate
-from langchain.chains import LLMChain
+from vector_store import VectorStore, LocalVectorStore
+from embedding_cache import EmbeddingCache, CachedEmbeddings, ChunkBatcher, chunk_id
+from measurement_store import MeasurementStore, parse_inspection_date
+from record_log import RecordLog, iter_record_sources
+from inspection_index import InspectionIndex
+from answer_cache import SemanticAnswerCache, extract_machine_ids
+from context_assembly import ContextAssembler, parse_token_budget
+from lexical_index import NgramBM25Index, is_identifier_query, reciprocal_rank_fusion
+from metrics import count_cache, observe_stage, stage_timer
 
 # Load environment variables
 load_dotenv()
 
+# Metadata "type" values searched for each analysis, in prompt order
+RETRIEVAL_SOURCES = ("inspection", "failure", "knowledge")
+
+# Text splitter settings for inspection records
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+# Candidates fetched per source before dedup/MMR picks what goes into the prompt
+CONTEXT_FETCH_K = 8
+
+# Prompt for analyze_failure_cause / stream_failure_cause
+ANALYSIS_TEMPLATE = """
+        以下の情報に基づいて、機械故障の原因分析と対策を提案してください：
+
+        類似の点検記録:
+        {inspection_context}
+
+        類似の故障事例:
+        {failure_context}
+
+        関連する技術ナレッジ:
+        {knowledge_context}
+
+        現在の状況:
+        {query}
+
+        以下の形式で回答してください：
+
+        1. 原因分析
+        - 考えられる原因
+        - 発生メカニズム
+        - 影響範囲
+
+        2. 対策提案
+        - 緊急対応
+        - 予防対策
+        - 長期的な改善案
+
+        3. リスク評価
+        - 発生確率
+        - 影響度
+        - 優先度
+        """
+
+class SharedRetrievals:
+    """Per-source searches shared across the analyses of one batch.
+
+    Analyses that run the same search (same query text, source filter and k)
+    wait on the first one's result instead of searching again. With max_workers
+    the batch's searches run on their own pool of that size instead of the
+    analyzer's per-request pool, so they scale with the batch concurrency.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self._lock = threading.Lock()
+        self._futures: Dict[Tuple, Future] = {}
+        self.hits = 0
+        self.pool = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="shared-retrieval"
+        ) if max_workers else None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+
+    def get_or_submit(self, key: Tuple, submit: Callable[[], Future]) -> Future:
+        with self._lock:
+            future = self._futures.get(key)
+            if future is None:
+                future = self._futures[key] = submit()
+            else:
+                self.hits += 1
+            return future
+
 class MaintenanceAnalyzer:
-    def __init__(self):
-        # Initialize Pinecone
-        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-        
-        # Initialize OpenAI embeddings
-        self.embeddings = OpenAIEmbeddings()
+    """Failure analysis over inspection records, failure cases and technical knowledge.
+
+    The langchain stack, OpenAI clients and the vector store connection are
+    imported and built on first use (or by warm_up()), so constructing the
+    analyzer is cheap and needs no network access.
+    """
+
+    def __init__(self, vector_backend: Optional[str] = None, embeddings=None, llm=None,
+                 vectorstore: Optional[VectorStore] = None,
+                 embedding_cache: Optional[EmbeddingCache] = None, data_dir: str = "data",
+                 answer_cache: Optional[SemanticAnswerCache] = None,
+                 context_assembler: Optional[ContextAssembler] = None,
+                 lexical_index: Optional[NgramBM25Index] = None):
+        self.data_dir = data_dir
+        self._init_lock = threading.RLock()
         
-        # Initialize LLM
-        self.llm = ChatOpenAI(temperature=0)
+        # Embeddings, LLM and vector store are built lazily (see the properties below)
+        self._base_embeddings = embeddings
+        self._embedding_cache = embedding_cache
+        self._embeddings: Optional[CachedEmbeddings] = None
+        self._llm = llm
+        self._vectorstore = vectorstore
+        self._text_splitter = None
         
-        # Create index if it doesn't exist
         self.index_name = "maintenance-analysis"
         
+        # Select vector store backend ("pinecone" or "local")
+        self.vector_backend = vector_backend or os.getenv("VECTOR_STORE_BACKEND", "pinecone")
+        if vectorstore is None and self.vector_backend not in ("local", "pinecone"):
+            raise ValueError(f"Unknown vector store backend: {self.vector_backend}")
+        
+        # Thread pool for running the per-source searches concurrently
+        self._retrieval_pool = ThreadPoolExecutor(
+            max_workers=len(RETRIEVAL_SOURCES), thread_name_prefix="retrieval"
+        )
+        
+        # Create necessary directories
+        self.create_data_directories()
+        
+        # Append-only logs for raw inspection records and analysis results,
+        # opened for writing on first append (see the properties below)
+        self._inspection_log: Optional[RecordLog] = None
+        self._analysis_log: Optional[RecordLog] = None
+        
+        # Typed, per-machine columnar store of the numeric measurements
+        self.measurement_store = MeasurementStore(os.path.join(data_dir, "measurements"))
+
+        # Semantic cache of analysis results for near-identical questions
+        self.answer_cache = answer_cache or SemanticAnswerCache(
+            similarity_threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95")),
+            ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+        )
+
+        # Dedup, MMR and per-source token budget for the prompt context
+        self.context_assembler = context_assembler or ContextAssembler(
+            token_budget=parse_token_budget(os.getenv("CONTEXT_TOKEN_BUDGET")),
+            mmr_lambda=float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+        )
+
+        # Secondary indexes over inspection records, built on first query
+        self._inspection_index: Optional[InspectionIndex] = None
+
+        # Character n-gram BM25 index fused with the vector results (HYBRID_RETRIEVAL=0 disables)
+        self.hybrid_retrieval = os.getenv("HYBRID_RETRIEVAL", "1") != "0"
+        self._lexical_index = lexical_index
+        self._lexical_synced_rows = 0
+
+    @property
+    def embeddings(self) -> CachedEmbeddings:
+        """OpenAI embeddings behind a persistent content-addressed cache."""
+        if self._embeddings is None:
+            with self._init_lock:
+                if self._embeddings is None:
+                    base = self._base_embeddings
+                    if base is None:
+                        from langchain_openai import OpenAIEmbeddings
+                        base = OpenAIEmbeddings()
+                    if self._embedding_cache is None:
+                        self._embedding_cache = EmbeddingCache(os.getenv(
+                            "EMBEDDING_CACHE_PATH",
+                            os.path.join(self.data_dir, "cache", "embeddings.sqlite")
+                        ))
+                    self._embeddings = CachedEmbeddings(base, self._embedding_cache)
+        return self._embeddings
+
+    @property
+    def embedding_cache(self) -> EmbeddingCache:
+        # The cache is created together with the embeddings
+        self.embeddings
+        return self._embedding_cache
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            with self._init_lock:
+                if self._llm is None:
+                    from langchain_openai import ChatOpenAI
+                    self._llm = ChatOpenAI(temperature=0)
+        return self._llm
+
+    @property
+    def vectorstore(self) -> VectorStore:
+        if self._vectorstore is None:
+            with self._init_lock:
+                if self._vectorstore is None:
+                    if self.vector_backend == "local":
+                        self._vectorstore = LocalVectorStore(
+                            self.embeddings,
+                            persist_directory=os.getenv("LOCAL_VECTOR_STORE_DIR",
+                                                        os.path.join(self.data_dir, "vectorstore")),
+                            # float16 / int8 / pq: search compressed codes, re-rank at full precision
+                            quantization=os.getenv("LOCAL_VECTOR_QUANTIZATION") or None,
+                            rerank_factor=int(os.getenv("LOCAL_VECTOR_RERANK", "4"))
+                        )
+                    else:
+                        self._vectorstore = self._init_pinecone_vectorstore()
+        return self._vectorstore
+
+    @property
+    def text_splitter(self):
+        if self._text_splitter is None:
+            with self._init_lock:
+                if self._text_splitter is None:
+                    from langchain.text_splitter import RecursiveCharacterTextSplitter
+                    self._text_splitter = RecursiveCharacterTextSplitter(
+                        chunk_size=CHUNK_SIZE,
+                        chunk_overlap=CHUNK_OVERLAP
+                    )
+        return self._text_splitter
+
+    @property
+    def lexical_index(self) -> NgramBM25Index:
+        """BM25 index over the chunks, built lazily.
+
+        With the local backend it mirrors the vector store and lives in memory;
+        otherwise it is persisted under data/lexical and holds the chunks
+        ingested through this analyzer.
+        """
+        if self._lexical_index is None:
+            with self._init_lock:
+                if self._lexical_index is None:
+                    local = isinstance(self.vectorstore, LocalVectorStore)
+                    self._lexical_index = NgramBM25Index(
+                        None if local else os.path.join(self.data_dir, "lexical")
+                    )
+        return self._lexical_index
+
+    def _sync_lexical_index(self):
+        """Index rows added to a local vector store directly (failure cases, knowledge)."""
+        store = self.vectorstore
+        if not isinstance(store, LocalVectorStore) or len(store) == self._lexical_synced_rows:
+            return
+        with self._init_lock:
+            start = self._lexical_synced_rows
+            rows = list(store.iter_documents(start))
+            self.lexical_index.add_texts([doc.page_content for _, doc in rows],
+                                         [doc.metadata for _, doc in rows],
+                                         [doc_id for doc_id, _ in rows])
+            self._lexical_synced_rows = start + len(rows)
+
+    def warm_up(self):
+        """Import the langchain stack and build every client ahead of the first request."""
+        self.embeddings
+        self.llm
+        self.vectorstore
+        self.text_splitter
+        from langchain.chains import LLMChain  # noqa: F401
+        from langchain.prompts import ChatPromptTemplate  # noqa: F401
+
+    def _init_pinecone_vectorstore(self):
+        """Connect to the Pinecone index, creating it if necessary."""
+        from pinecone import Pinecone, ServerlessSpec
+        from langchain_community.vectorstores.pinecone import Pinecone as LangchainPinecone
+
+        # Initialize Pinecone
+        pc = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
+        
         # Check if index exists
         if self.index_name not in [index.name for index in pc.list_indexes()]:
             # Create index if it doesn't exist
@@ -42,148 +286,423 @@ class MaintenanceAnalyzer:
             )
         
         self.index = pc.Index(self.index_name)
-        self.vectorstore = LangchainPinecone(self.index, self.embeddings, "text")
-        
-        # Create necessary directories
-        self.create_data_directories()
+        return LangchainPinecone(self.index, self.embeddings, "text")
 
     def create_data_directories(self):
         """Create necessary directories for data storage."""
         directories = [
-            "data/inspections",
-            "data/inspections/raw",
-            "data/inspections/processed"
+            "inspections",
+            "inspections/raw",
+            "inspections/processed"
         ]
         for directory in directories:
-            os.makedirs(directory, exist_ok=True)
+            os.makedirs(os.path.join(self.data_dir, directory), exist_ok=True)
+
+    def _log_dir(self, name: str) -> str:
+        return os.path.join(self.data_dir, "inspections", "log", name)
+
+    @property
+    def inspection_log(self) -> RecordLog:
+        """Writable log of raw inspection records, opened on first use.
+
+        A log has a single writer (RecordLog refuses a second one), so only the
+        ingest path opens it; processes that merely read never become writers.
+        """
+        if self._inspection_log is None:
+            with self._init_lock:
+                if self._inspection_log is None:
+                    self._inspection_log = RecordLog(self._log_dir("raw"))
+        return self._inspection_log
+
+    @property
+    def analysis_log(self) -> RecordLog:
+        """Writable log of analysis results, opened on the first save_analysis_result."""
+        if self._analysis_log is None:
+            with self._init_lock:
+                if self._analysis_log is None:
+                    self._analysis_log = RecordLog(self._log_dir("processed"))
+        return self._analysis_log
+
+    def close(self):
+        """Sync and close the logs this analyzer has opened for writing."""
+        with self._init_lock:
+            for log in (self._inspection_log, self._analysis_log):
+                if log is not None:
+                    log.close()
+            self._inspection_log = self._analysis_log = None
 
     def save_inspection_record(self, record: Dict) -> str:
-        """Save inspection record to file and return the file path."""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"data/inspections/raw/{timestamp}_inspection.json"
-        
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(record, f, ensure_ascii=False, indent=2)
-        
-        return filename
+        """Append inspection record to the inspection log and return its record ID."""
+        # Under the init lock so that an index being built cannot miss the record
+        with self._init_lock:
+            with stage_timer("record_log_append"):
+                record_id = self.inspection_log.append(record)
+            if self._inspection_index is not None:
+                self._inspection_index.add(record_id, record)
+        return record_id
+
+    @property
+    def inspection_index(self) -> InspectionIndex:
+        """Index over the inspection log and legacy per-record files, built lazily."""
+        if self._inspection_index is None:
+            with self._init_lock:
+                if self._inspection_index is None:
+                    # Reading does not need the writer; records saved later are added directly
+                    log = self._inspection_log or RecordLog(self._log_dir("raw"), read_only=True)
+                    index = InspectionIndex(log,
+                                            raw_dir=os.path.join(self.data_dir, "inspections", "raw"))
+                    index.refresh()
+                    self._inspection_index = index
+        return self._inspection_index
+
+    def query_inspections(self, **conditions) -> List[Tuple[str, Dict]]:
+        """Query inspection records by machine, location, status, type and date range."""
+        return self.inspection_index.query(**conditions)
 
     def process_inspection_record(self, record: Dict) -> str:
         """Process a single inspection record and return its vector representation."""
         # Save raw record
         self.save_inspection_record(record)
         
-        # Convert record to text format
+        # Convert record to text format and split into chunks
         text = self._format_record_as_text(record)
+        with stage_timer("split"):
+            chunks = self.text_splitter.split_text(text)
         
-        # Split text into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
-        )
-        chunks = text_splitter.split_text(text)
-        
-        # Store chunks in Pinecone
-        self.vectorstore.add_texts(chunks)
+        # Store chunks in the vector store (IDs derived from the text and record metadata make re-ingestion idempotent)
+        metadatas = [self._chunk_metadata(record) for _ in chunks]
+        ids = [chunk_id(chunk, metadata) for chunk, metadata in zip(chunks, metadatas)]
+        with stage_timer("vector_upsert"):
+            self.vectorstore.add_texts(chunks, metadatas=metadatas, ids=ids)
+        self.after_ingest([record], chunks, metadatas, ids)
         
         return text
 
-    def _format_record_as_text(self, record: Dict) -> str:
-        """Format inspection record as text for processing."""
-        return f"""
-        点検日時: {record.get('inspection_date', 'N/A')}
-        機械ID: {record.get('machine_id', 'N/A')}
-        点検タイプ: {record.get('inspection_type', 'N/A')}
-        点検結果: {record.get('findings', 'N/A')}
-        推奨事項: {record.get('recommendations', 'N/A')}
-        測定値: {record.get('measurements', 'N/A')}
+    def process_inspection_records(self, records: List[Dict], batch_size: int = 1000) -> int:
+        """Ingest many inspection records, grouping their chunks into large embedding batches.
+
+        Raw copies are not written, so this is safe to run over data/inspections/raw.
+        Returns the number of chunks submitted.
         """
+        records = list(records)
+        all_chunks, all_metadatas, all_ids = [], [], []
+        with stage_timer("ingest_batch"), ChunkBatcher(self.vectorstore, batch_size=batch_size) as batcher:
+            for record in records:
+                chunks = self.text_splitter.split_text(self._format_record_as_text(record))
+                metadatas = [self._chunk_metadata(record) for _ in chunks]
+                ids = [chunk_id(chunk, metadata) for chunk, metadata in zip(chunks, metadatas)]
+                batcher.add(chunks, metadatas=metadatas, ids=ids)
+                all_chunks += chunks
+                all_metadatas += metadatas
+                all_ids += ids
+        self.after_ingest(records, all_chunks, all_metadatas, all_ids)
+        return batcher.flushed_chunks
 
-    def analyze_failure_cause(self, query: str) -> Dict:
-        """Analyze failure cause and provide countermeasures."""
-        # Create prompt template
-        template = """
-        以下の情報に基づいて、機械故障の原因分析と対策を提案してください：
+    def after_ingest(self, records: List[Dict], chunks: List[str], metadatas: List[Dict],
+                     ids: List[str]):
+        """Hooks every ingestion path runs once the chunks of records are in the vector store.
 
-        類似の点検記録:
-        {inspection_context}
+        The chunks go into the lexical index, the measurements into the columnar
+        store, and cached answers about the records' machines are dropped.
+        """
+        if self.hybrid_retrieval and chunks:
+            with stage_timer("lexical_index"):
+                self.lexical_index.add_texts(chunks, metadatas=metadatas, ids=ids)
+        with stage_timer("measurement_store"):
+            self.measurement_store.append(records)
+        self._invalidate_answers(records)
 
-        類似の故障事例:
-        {failure_context}
+    def _invalidate_answers(self, records: List[Dict]):
+        """Drop cached analyses that depend on the machines of newly ingested records."""
+        machine_ids = {str(record['machine_id']) for record in records if record.get('machine_id')}
+        self.answer_cache.invalidate_machines(machine_ids)
 
-        関連する技術ナレッジ:
-        {knowledge_context}
+    def ingest_inspection_directory(self, directory: Optional[str] = None,
+                                    batch_size: int = 1000) -> int:
+        """Ingest every inspection record in a record log or a directory of JSON files.
 
-        現在の状況:
-        {query}
+        By default this reads the inspection log together with any legacy
+        per-record files in data/inspections/raw that have not been migrated.
+        """
+        if directory:
+            sources = [directory]
+        else:
+            sources = [self._log_dir("raw"), os.path.join(self.data_dir, "inspections", "raw")]
+        records = [record for _, record in iter_record_sources(sources)]
+        return self.process_inspection_records(records, batch_size=batch_size)
 
-        以下の形式で回答してください：
+    @staticmethod
+    def _chunk_metadata(record: Dict) -> Dict:
+        """Filterable metadata for the chunks of an inspection record.
 
-        1. 原因分析
-        - 考えられる原因
-        - 発生メカニズム
-        - 影響範囲
+        The inspection date is stored as UNIX seconds so that time windows can
+        be expressed as $gte/$lt range filters.
+        """
+        metadata = {"type": "inspection"}
+        for field in ("machine_id", "location", "status", "inspection_type"):
+            if record.get(field) is not None:
+                metadata[field] = str(record[field])
+        timestamp = parse_inspection_date(record.get("inspection_date"))
+        if timestamp is not None:
+            metadata["inspection_date"] = timestamp
+        return metadata
 
-        2. 対策提案
-        - 緊急対応
-        - 予防対策
-        - 長期的な改善案
+    @staticmethod
+    def inspection_filter(machine_id: Optional[str] = None, start: Optional[datetime] = None,
+                          end: Optional[datetime] = None) -> Optional[Dict]:
+        """Metadata filter scoping inspection chunks to a machine and a [start, end) window."""
+        conditions = {}
+        if machine_id is not None:
+            conditions["machine_id"] = machine_id
+        window = {}
+        if start is not None:
+            window["$gte"] = int(start.timestamp())
+        if end is not None:
+            window["$lt"] = int(end.timestamp())
+        if window:
+            conditions["inspection_date"] = window
+        return conditions or None
 
-        3. リスク評価
-        - 発生確率
-        - 影響度
-        - 優先度
+    @staticmethod
+    def _format_record_as_text(record: Dict) -> str:
+        """Format inspection record as text for processing."""
+        return f"""
+        点検日時: {record.get('inspection_date', 'N/A')}
+        機械ID: {record.get('machine_id', 'N/A')}
+        点検タイプ: {record.get('inspection_type', 'N/A')}
+        点検結果: {record.get('findings', 'N/A')}
+        推奨事項: {record.get('recommendations', 'N/A')}
+        測定値: {record.get('measurements', 'N/A')}
         """
 
-        prompt = ChatPromptTemplate.from_template(template)
+    def analyze_failure_cause(self, query: str, machine_id: Optional[str] = None,
+                              start: Optional[datetime] = None, end: Optional[datetime] = None,
+                              shared_retrievals: Optional[SharedRetrievals] = None,
+                              retrieval_query: Optional[str] = None) -> Dict:
+        """Analyze failure cause and provide countermeasures.
+
+        Near-identical questions about the same machines are answered from the
+        semantic answer cache without retrieval or LLM calls. machine_id and
+        start/end restrict the inspection records searched to that machine and
+        time window before similarity ranking. Batch runs pass shared_retrievals
+        so that identical searches are run once, and may search with a
+        retrieval_query shared across machines while the prompt keeps query.
+        """
+        prepared = self._prepare_analysis(query, self.inspection_filter(machine_id, start, end),
+                                          shared_retrievals, retrieval_query)
+        if "cached" in prepared:
+            return prepared["cached"]
         
-        # Create chain
-        chain = LLMChain(llm=self.llm, prompt=prompt)
+        from langchain.chains import LLMChain
+        from langchain.prompts import ChatPromptTemplate
         
-        # Get similar records
-        similar_inspections = self.vectorstore.similarity_search(
-            query, 
-            k=3,
-            filter={"type": "inspection"}
-        )
-        inspection_context = "\n".join([doc.page_content for doc in similar_inspections])
+        # Create chain
+        chain = LLMChain(llm=self.llm, prompt=ChatPromptTemplate.from_template(ANALYSIS_TEMPLATE))
         
-        similar_failures = self.vectorstore.similarity_search(
-            query,
-            k=3,
-            filter={"type": "failure"}
-        )
-        failure_context = "\n".join([doc.page_content for doc in similar_failures])
+        # Generate analysis
+        with stage_timer("llm"):
+            result = chain.invoke(prepared["inputs"])
+        return self._finish_analysis(query, prepared, result["text"])
+
+    def stream_failure_cause(self, query: str, machine_id: Optional[str] = None,
+                             start: Optional[datetime] = None,
+                             end: Optional[datetime] = None) -> Iterator[Dict]:
+        """Streaming variant of analyze_failure_cause.
+
+        Yields a "context" event with the retrieved-context metadata as soon as
+        retrieval finishes, then one "token" event per generated chunk, and
+        finally a "done" event carrying the same dict analyze_failure_cause returns.
+        """
+        prepared = self._prepare_analysis(query, self.inspection_filter(machine_id, start, end))
+        if "cached" in prepared:
+            result = prepared["cached"]
+            yield {"event": "context", "data": {
+                "cached": True,
+                "cache_similarity": result["cache_similarity"],
+                "retrieval_timings": result["retrieval_timings"]
+            }}
+            yield {"event": "token", "data": result["analysis"]}
+            yield {"event": "done", "data": result}
+            return
         
-        similar_knowledge = self.vectorstore.similarity_search(
-            query,
-            k=3,
-            filter={"type": "knowledge"}
-        )
-        knowledge_context = "\n".join([doc.page_content for doc in similar_knowledge])
+        yield {"event": "context", "data": {
+            "cached": False,
+            "retrieval_timings": prepared["retrieval"]["timings"],
+            "sources": {
+                source: [{"metadata": doc.metadata, "preview": doc.page_content[:200]} for doc in docs]
+                for source, docs in prepared["documents"].items()
+            },
+            "context_stats": prepared["context_stats"]
+        }}
         
-        # Generate analysis
-        result = chain.invoke({
-            "inspection_context": inspection_context,
-            "failure_context": failure_context,
-            "knowledge_context": knowledge_context,
-            "query": query
-        })
+        from langchain.prompts import ChatPromptTemplate
+        chain = ChatPromptTemplate.from_template(ANALYSIS_TEMPLATE) | self.llm
+        pieces = []
+        llm_start = time.perf_counter()
+        for chunk in chain.stream(prepared["inputs"]):
+            if chunk.content:
+                if not pieces:
+                    observe_stage("llm_first_token", time.perf_counter() - llm_start)
+                pieces.append(chunk.content)
+                yield {"event": "token", "data": chunk.content}
+        observe_stage("llm", time.perf_counter() - llm_start)
+        yield {"event": "done", "data": self._finish_analysis(query, prepared, "".join(pieces))}
+
+    def _prepare_analysis(self, query: str, inspection_filter: Optional[Dict] = None,
+                          shared_retrievals: Optional[SharedRetrievals] = None,
+                          retrieval_query: Optional[str] = None) -> Dict:
+        """Embed the query and either return a cached analysis or retrieve the prompt inputs.
+
+        Queries that only name a machine ID or location are answered from the
+        lexical index alone, without an embedding call (and without the answer cache).
+        Scoped analyses (inspection_filter) and analyses searched with a separate
+        retrieval_query bypass the answer cache as well.
+        """
+        start = time.perf_counter()
+        search_query = retrieval_query or query
+        cacheable = inspection_filter is None and retrieval_query is None
+        if self.hybrid_retrieval and is_identifier_query(search_query):
+            query_embedding = None
+            retrieval = self.retrieve_context(search_query, k=CONTEXT_FETCH_K, lexical_only=True,
+                                              inspection_filter=inspection_filter,
+                                              shared_retrievals=shared_retrievals)
+        else:
+            query_embedding = self.embeddings.embed_query(search_query)
+            embedding_elapsed = time.perf_counter() - start
+            observe_stage("embedding", embedding_elapsed)
+            cached = None
+            if cacheable:
+                with stage_timer("answer_cache"):
+                    cached = self.answer_cache.get(query, query_embedding)
+                count_cache("answer", cached is not None)
+            if cached is not None:
+                result, similarity = cached
+                return {"cached": {
+                    **result,
+                    "cached": True,
+                    "cache_similarity": similarity,
+                    "retrieval_timings": {"total": time.perf_counter() - start}
+                }}
+            
+            # Get similar records (query is embedded once, sources searched concurrently)
+            retrieval = self.retrieve_context(search_query, k=CONTEXT_FETCH_K, query_embedding=query_embedding,
+                                              inspection_filter=inspection_filter,
+                                              shared_retrievals=shared_retrievals)
+            retrieval["timings"]["embedding"] = embedding_elapsed
+        retrieval["timings"]["total"] = time.perf_counter() - start
         
+        # Drop duplicate/overlapping chunks and pack each source into its token budget
+        with stage_timer("prompt"):
+            assembled = {
+                source: self.context_assembler.assemble(
+                    zip(docs, retrieval["scores"][source]), source=source
+                )
+                for source, docs in retrieval["documents"].items()
+            }
+        contexts = {source: result["text"] for source, result in assembled.items()}
+        # Without an embedding the result is not cached (scoped answers are not keyed by their scope)
         return {
-            "analysis": result["text"],
+            "embedding": query_embedding if cacheable else None,
+            "retrieval": retrieval,
+            "documents": {source: result["documents"] for source, result in assembled.items()},
+            "context_stats": {source: result["stats"] for source, result in assembled.items()},
+            "contexts": contexts,
+            "inputs": {
+                "inspection_context": contexts["inspection"],
+                "failure_context": contexts["failure"],
+                "knowledge_context": contexts["knowledge"],
+                "query": query
+            }
+        }
+
+    def _finish_analysis(self, query: str, prepared: Dict, text: str) -> Dict:
+        """Build the analysis result and store it in the answer cache."""
+        analysis = {
+            "analysis": text,
             "timestamp": datetime.now().isoformat(),
-            "query": query
+            "query": query,
+            "retrieval_timings": prepared["retrieval"]["timings"],
+            "context_stats": prepared["context_stats"]
         }
+        
+        # The answer depends on the machines in the query and in the retrieved context
+        context_machines = set()
+        for context in prepared["contexts"].values():
+            context_machines |= extract_machine_ids(context)
+        if prepared["embedding"] is not None:
+            self.answer_cache.put(query, prepared["embedding"], analysis, machine_ids=context_machines)
+        
+        return {**analysis, "cached": False}
 
-    def save_analysis_result(self, analysis: Dict) -> str:
-        """Save analysis result to file and return the file path."""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"data/inspections/processed/{timestamp}_analysis.json"
+    def retrieve_context(self, query: str, k: int = 3,
+                         query_embedding: Optional[List[float]] = None,
+                         lexical_only: bool = False,
+                         inspection_filter: Optional[Dict] = None,
+                         shared_retrievals: Optional[SharedRetrievals] = None) -> Dict:
+        """Embed the query once and search every source type concurrently.
+
+        With hybrid retrieval the vector and BM25 rankings of each source are
+        merged by reciprocal rank fusion; lexical_only skips the embedding.
+        inspection_filter (see inspection_filter()) is added to the metadata
+        filter of the inspection source. Searches already run through
+        shared_retrievals are reused.
+        Returns the documents and their scores per source and the elapsed
+        seconds of each stage.
+        """
+        start = time.perf_counter()
+        if self.hybrid_retrieval or lexical_only:
+            self._sync_lexical_index()
+        timings = {}
+        if not lexical_only:
+            if query_embedding is None:
+                query_embedding = self.embeddings.embed_query(query)
+                observe_stage("embedding", time.perf_counter() - start)
+            timings["embedding"] = time.perf_counter() - start
         
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(analysis, f, ensure_ascii=False, indent=2)
+        pool = self._retrieval_pool
+        if shared_retrievals is not None and shared_retrievals.pool is not None:
+            pool = shared_retrievals.pool
+        futures = {}
+        for source in RETRIEVAL_SOURCES:
+            filter = {"type": source, **(inspection_filter or {})} if source == "inspection" else {"type": source}
+            submit = partial(pool.submit, self._timed_search, query,
+                             None if lexical_only else query_embedding, k, filter)
+            if shared_retrievals is None:
+                futures[source] = submit()
+            else:
+                key = (query, lexical_only, k, json.dumps(filter, sort_keys=True))
+                futures[source] = shared_retrievals.get_or_submit(key, submit)
+        documents, scores = {}, {}
+        for source, future in futures.items():
+            results, timings[source] = future.result()
+            documents[source] = [doc for doc, _ in results]
+            scores[source] = [score for _, score in results]
+            observe_stage("vector_search", timings[source], source=source)
+        timings["total"] = time.perf_counter() - start
         
-        return filename
+        return {"documents": documents, "scores": scores, "timings": timings}
+
+    def _timed_search(self, query: str, embedding: Optional[List[float]], k: int,
+                      filter: Dict) -> Tuple[List, float]:
+        """Run one filtered search and return ((document, score) pairs, elapsed seconds).
+
+        Without an embedding only the lexical index is searched.
+        """
+        start = time.perf_counter()
+        rankings = []
+        if embedding is not None:
+            rankings.append(self.vectorstore.similarity_search_by_vector_with_score(
+                embedding, k=k, filter=filter
+            ))
+        if self.hybrid_retrieval or embedding is None:
+            rankings.append(self.lexical_index.search(query, k=k, filter=filter))
+        results = rankings[0] if len(rankings) == 1 else reciprocal_rank_fusion(*rankings, limit=k)
+        return results, time.perf_counter() - start
+
+    def save_analysis_result(self, analysis: Dict) -> str:
+        """Append analysis result to the analysis log and return its record ID."""
+        with stage_timer("record_log_append"):
+            return self.analysis_log.append(analysis)
 
 def main():
     # Initialize analyzer